@@ -1,31 +1,36 @@
+from contextlib import contextmanager
 from typing import Optional
 from threading import Lock
 
-from PyQt6.QtCore import QMutexLocker, QMutex
+from PyQt6.QtCore import QMutexLocker, QRecursiveMutex
 from Scripts.Camera.raptor_ninox640II import RaptorNinox640II
 
 class CameraInterface(RaptorNinox640II):
     """
     Singleton class
     Interface between RaptorNinox640II and Qt to handle multithreading.
-    A mutex locks the access to methods.
+    A mutex locks the access to methods, it's held during a whole transaction (multi-step register access).
     Thread-safe singleton implementation.
     """
     _instance = None
     _lock = Lock()  # Thread safety
     _initialized = False
 
-    def __new__(cls):
+    def __new__(cls, *args, **kwargs):
         with cls._lock:
             if cls._instance is None:
                 cls._instance = super(CameraInterface, cls).__new__(cls)
         return cls._instance
 
-    def __init__(self):
+    def __init__(self, xclib=None):
+        """
+        :param xclib: Library of the frame grabber, only used at the first creation of the instance
+        """
         with self._lock:
             if not self._initialized:
-                self._mutex = QMutex()
-                super().__init__()
+                # Recursive: the serial commands of a transaction lock it again
+                self._mutex = QRecursiveMutex()
+                super().__init__(xclib)
                 self._initialized = True
 
     @classmethod
@@ -35,6 +40,14 @@ class CameraInterface(RaptorNinox640II):
         """
         return cls()  # Call __new__ then __init__
 
+    @contextmanager
+    def transaction(self):
+        """
+        Hold the mutex during a multi-step register access, the other threads wait for its end
+        """
+        with QMutexLocker(self._mutex):
+            yield self
+
     def serial_set(self, data: list, length_answer: Optional[int] = 2):
         with QMutexLocker(self._mutex):
             return super().serial_set(data, length_answer)
@@ -42,4 +55,3 @@ class CameraInterface(RaptorNinox640II):
     def serial_get(self, data: list, length_answer):
         with QMutexLocker(self._mutex):
             return super().serial_get(data, length_answer)
-
@@ -0,0 +1,58 @@
+import threading
+import time
+from typing import Callable, Optional
+
+import numpy as np
+
+
+class FrameMailbox:
+    """
+    Single slot between the thread of the camera and the GUI: only the newest frame waits for the display.
+    A frame put while the slot is full replaces the old one, which is released and counted as dropped,
+    so the display never falls behind the camera when the GUI is busy.
+    """
+
+    def __init__(self, release: Callable[[np.ndarray], None]):
+        """
+        :param release: Give back a frame dropped to its owner, ex: RaptorNinox640II.release_frame
+        """
+        self._release = release
+        self._lock = threading.Lock()
+        self._frame: Optional[np.ndarray] = None
+        self._put_time = 0
+        self.dropped = 0  # Number of frames replaced before being displayed
+        self.last_wait = 0  # Time in the slot of the last frame taken in seconds
+
+    def put(self, frame: np.ndarray) -> bool:
+        """
+        Put the new frame in the slot, the mailbox owns it until take
+        :return: True if the slot was empty: the reader must be notified, else it's already notified
+        """
+        with self._lock:
+            previous, self._frame = self._frame, frame
+            self._put_time = time.perf_counter()
+            if previous is not None:
+                self.dropped += 1
+
+        if previous is not None:
+            self._release(previous)
+            return False
+        return True
+
+    def take(self) -> Optional[np.ndarray]:
+        """
+        :return: Newest frame, the caller owns it. None if the slot is empty
+        """
+        with self._lock:
+            frame, self._frame = self._frame, None
+            if frame is not None:
+                self.last_wait = time.perf_counter() - self._put_time
+        return frame
+
+    def clear(self):
+        """
+        Release the frame waiting in the slot
+        """
+        frame = self.take()
+        if frame is not None:
+            self._release(frame)
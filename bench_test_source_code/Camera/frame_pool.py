@@ -0,0 +1,70 @@
+import ctypes
+import threading
+from collections import deque
+
+import numpy as np
+
+
+class FramePoolError(Exception):
+    pass
+
+
+class FramePool:
+    """
+    Fixed set of frame buffers reused by the capture of the camera, to avoid an allocation at each frame.
+    A buffer taken with acquire belongs to its user until it gives it back with release.
+    """
+
+    def __init__(self, shape: tuple, count: int = 6, dtype=np.uint16):
+        """
+        :param shape: Shape of a frame
+        :param count: Number of buffers of the pool
+        """
+        self.shape = shape
+        self.dtype = np.dtype(dtype)
+        self._frames = [np.zeros(shape, dtype=self.dtype) for _ in range(count)]
+        # Pointers created once to give the buffers to xclib
+        self._pointers = {id(frame): frame.ctypes.data_as(ctypes.POINTER(ctypes.c_ushort)) for frame in self._frames}
+        self._free = deque(self._frames)
+        self._condition = threading.Condition()
+
+    def __len__(self):
+        return len(self._frames)
+
+    @property
+    def free_count(self) -> int:
+        """
+        :return: Number of buffers not used
+        """
+        with self._condition:
+            return len(self._free)
+
+    def acquire(self, timeout: float = 1.0) -> np.ndarray:
+        """
+        Take a free buffer, wait that a user releases one if all are used
+        :param timeout: Max time to wait for a free buffer in seconds
+        :return: Buffer of the pool, its content is the last frame written in it
+        """
+        with self._condition:
+            if not self._condition.wait_for(lambda: len(self._free) > 0, timeout):
+                raise FramePoolError(f"No free frame buffer after {timeout}s, all {len(self._frames)} are used")
+            return self._free.popleft()
+
+    def release(self, frame: np.ndarray):
+        """
+        Give back a buffer to the pool, it must not be used after
+        :param frame: Buffer returned by acquire (not a view or a copy of it)
+        """
+        with self._condition:
+            if id(frame) not in self._pointers:
+                raise FramePoolError("The frame released doesn't belong to the pool")
+            if any(free is frame for free in self._free):
+                raise FramePoolError("The frame is released twice")
+            self._free.append(frame)
+            self._condition.notify()
+
+    def pointer(self, frame: np.ndarray) -> ctypes.POINTER(ctypes.c_ushort):
+        """
+        :return: ctypes pointer on the data of a buffer of the pool
+        """
+        return self._pointers[id(frame)]
@@ -1,10 +1,14 @@
 import time
+from contextlib import contextmanager
 
 import numpy as np
 import functools
 import ctypes
 from ctypes import *
 import typing
+from Scripts.Camera import raptor_registers as registers
+from Scripts.Camera.frame_pool import FramePool
+from Scripts.Camera.raptor_registers import FpgaRegister
 from Scripts.utils import LoggingClass
 import os
 from typing import Optional
@@ -14,6 +18,21 @@ class RaptorNinox640IIError(Exception):
     pass
 
 class RaptorNinox640II(LoggingClass):
+    # Bits of the FPGA control register
+    FPGA_TEC_ENABLE = 1 << 0
+    FPGA_AUTO_EXPOSURE = 1 << 1
+    FPGA_FAN_ENABLE = 1 << 2
+    FPGA_INVERT_VIDEO = 1 << 6
+    FPGA_HORIZ_FLIP = 1 << 7
+    # Bits kept when the register is written, the others are written at 0
+    FPGA_CONTROL_MASK = FPGA_HORIZ_FLIP | FPGA_INVERT_VIDEO | FPGA_FAN_ENABLE | FPGA_AUTO_EXPOSURE | FPGA_TEC_ENABLE
+
+    # Sleep between two empty serial reads in seconds, doubled at each empty read
+    SERIAL_MIN_SLEEP = 0.0001
+    SERIAL_MAX_SLEEP = 0.005
+
+    # Longest exposure of the camera in seconds
+    MAX_EXPOSURE = 26.8
 
     #region Serial communication
     def serial_config(self):
@@ -28,28 +47,41 @@ class RaptorNinox640II(LoggingClass):
         """
         Read data send by the camera
         Should not be used as is: use self.serial_ask instead.
+        Between two empty reads, sleep with a growing time (SERIAL_MIN_SLEEP to SERIAL_MAX_SLEEP) instead of spinning.
         :param length_answer: length of the data expected according to the datasheet
         :return: Answer sent in hex ( for the ack/sum verification ).
         """
-        read_buffer = np.zeros(length_answer, dtype=np.uint8)
-        length = 0
-        data = []
-        i = 0
+        if length_answer > len(self._serial_buffer):
+            self._serial_buffer = bytearray(length_answer)
+
+        received = 0
+        sleep_time = self.SERIAL_MIN_SLEEP
+        deadline = time.perf_counter() + self.serial_timeout
         # Waiting for data of the length in parameter
-        while len(data) < length_answer:
-            i += 1
-            if i > 1000:
-                time.sleep(0.1)
-                self.logger.error("Stuck in serial read, {}".format(hex(x) for x in data))
-            # Put data send by the camera into read_buffer and return the length of bytes of data read
-            length = self.xclib.pxd_serialRead(1, 0, read_buffer.ctypes.data_as(ctypes.POINTER(ctypes.c_char)),
-                                            len(read_buffer))
-            data += list(read_buffer[:length])
-        if length < 0:
-            raise RaptorNinox640IIError(f"Error at serial read: {self._get_error()}")
-        else:
-            self.logger.debug(f"read <= {data}")
-            return data
+        while received < length_answer:
+            # Put data send by the camera directly after the bytes already received
+            # and return the length of bytes of data read
+            free_part = (c_char * (length_answer - received)).from_buffer(self._serial_buffer, received)
+            length = self.xclib.pxd_serialRead(1, 0, free_part, length_answer - received)
+            if length < 0:
+                raise RaptorNinox640IIError(f"Error at serial read: {self._get_error()}")
+
+            if length > 0:
+                received += length
+                sleep_time = self.SERIAL_MIN_SLEEP
+                continue
+
+            if time.perf_counter() > deadline:
+                data_hex = [hex(x) for x in self._serial_buffer[:received]]
+                self.logger.error(f"Timeout at serial read: {received}/{length_answer} bytes, data: {data_hex}")
+                raise RaptorNinox640IIError(f"Timeout at serial read after {self.serial_timeout}s: "
+                                            f"{received}/{length_answer} bytes received, data: {data_hex}")
+            time.sleep(sleep_time)
+            sleep_time = min(sleep_time * 2, self.SERIAL_MAX_SLEEP)
+
+        data = list(self._serial_buffer[:length_answer])
+        self.logger.debug(f"read <= {data}")
+        return data
 
     def _serial_write(self, data: list) -> list:
         """
@@ -75,8 +107,38 @@ class RaptorNinox640II(LoggingClass):
         :param length_answer: length of the data expected according to the datasheet
         :return: Answer in hex sent by the camera.
         """
+        start = time.perf_counter()
         sent_data = self._serial_write(data)
         read_data = self._serial_read(length_answer)
+        self.last_serial_latency = time.perf_counter() - start
+        return self._check_sum(sent_data, read_data)
+
+    def _serial_ask_batch(self, commands: typing.List[typing.Tuple[list, int]]) -> typing.List[list]:
+        """
+        Send several commands back to back, then read all the answers in one read (pipelined transaction).
+        The camera answers the commands in order, so the answers are split with their expected length.
+        :param commands: List of (command, length of the answer)
+        :return: Answer of each command, in the order of the commands
+        """
+        start = time.perf_counter()
+        sent_data = [self._serial_write(data) for data, _ in commands]
+        read_data = self._serial_read(sum(length for _, length in commands))
+        self.last_serial_latency = time.perf_counter() - start
+
+        answers = []
+        start = 0
+        for sent, (_, length) in zip(sent_data, commands):
+            answers.append(self._check_sum(sent, read_data[start:start + length]))
+            start += length
+        return answers
+
+    def _check_sum(self, sent_data: list, read_data: list) -> list:
+        """
+        Verification of the ack + sum at the end of the answer of a command.
+        :param sent_data: Command sent with its ack and sum
+        :param read_data: Answer of the camera
+        :return: Answer in hex sent by the camera.
+        """
         # Checksum of the data received
         for x in range(1, len(read_data)):
             if read_data[-x] == '0':
@@ -90,6 +152,15 @@ class RaptorNinox640II(LoggingClass):
                 raise RaptorNinox640IIError(f"Error at check sum: {hex(read_data[-x])}, list of data: {data_hex}, "
                                             f"Error: {self._get_error()}")
 
+    @contextmanager
+    def transaction(self):
+        """
+        Group several serial commands that must not be interleaved with the commands of another thread,
+        ex: set the address of a register then read it.
+        Nothing to lock here, CameraInterface holds its mutex during the transaction.
+        """
+        yield self
+
     def serial_set(self, data: list, length_answer: Optional[int] = 2):
         """
         Set the value of an attribute of the camera
@@ -110,20 +181,68 @@ class RaptorNinox640II(LoggingClass):
 
     #endregion
 
-    def __init__(self):
+    #region Register access
+
+    def read_register_bytes(self, register: FpgaRegister) -> typing.List[int]:
+        """
+        Read all the bytes of a register in one transaction: all addresses are set and read back to back
+        :return: Bytes of the register, from the most significant byte
+        """
+        commands = []
+        for address in register.addresses:
+            commands.append(([0x53, 0xE0, 0x01, address], 2))  # Set the address to read
+            commands.append(([0x53, 0xE1, 0x01], 3))  # Read the byte at the address
+        with self.transaction():
+            answers = self._serial_ask_batch(commands)
+        # Answers of the read commands: [value, ack, sum]
+        return [answer[0] for answer in answers[1::2]]
+
+    def read_register(self, register: FpgaRegister) -> int:
+        """
+        :return: Value of a register on several bytes
+        """
+        return register.join(self.read_register_bytes(register))
+
+    def write_register(self, register: FpgaRegister, value: int):
+        """
+        Write all the bytes of a register in one transaction
+        """
+        with self.transaction():
+            self._serial_ask_batch([([0x53, 0xE0, 0x02, address, byte], 2)
+                                    for address, byte in zip(register.addresses, register.split(value))])
+
+    #endregion
+
+    def __init__(self, xclib=None):
         """
         Import the library & Connect with the camera.
+        :param xclib: Library of the frame grabber, None to load xclibw64.dll.
+        Another backend can be given, ex: XclibSimulator to run without the camera
         """
         LoggingClass.__init__(self)
         self.last_command = None  # Stock the last command send
 
+        # Max time to wait the answer of the camera in seconds
+        self.serial_timeout = 1.0
+        # Buffer filled by the serial reads, reused for each answer
+        self._serial_buffer = bytearray(64)
+        # Time of the last serial transaction (write + read) in seconds
+        self.last_serial_latency = None
+
         # Attribute for the Set Point Temperature Calibration
         self.constant_tec_get = 0
         self.slope_tec_get = 0
         self.constant_tec_set = 0
         self.slope_tec_set = 0
 
-        self.xclib = WinDLL(os.path.join(os.path.dirname(__file__), "xclibw64.dll"))  # dll for the camera
+        # Shadow copy of the FPGA control register, updated at each write by the driver
+        self._fpga_control = None
+        self._fpga_control_time = 0
+        # Revalidation policy: max age in seconds of the shadow copy before the register is read again
+        # None = never read again, 0 = read at each access
+        self.fpga_control_max_age: Optional[float] = 30
+
+        self.xclib = xclib if xclib is not None else self.load_xclib()
         self._connect()
         self.serial_config()  # serial config xclib
         x = 0
@@ -144,10 +263,32 @@ class RaptorNinox640II(LoggingClass):
         self.width = 640
         self.height = 512
 
+        # Buffers reused by capture_frame, the shape is the one of the reshaped picture
+        self.frame_pool = FramePool((self.width, self.height), count=6)
+        self.last_img = None
+
+        # Live acquisition: the frame grabber fills several buffers in rotation
+        self.live = False
+        self.live_buffer_count = 0
+        # Sequence number (field count of the frame grabber) of the last image read, to detect skipped frames
+        self.frame_sequence = None
+        self.skipped_frames = 0
+
+    @staticmethod
+    def load_xclib():
+        """
+        :return: dll of the frame grabber, only available on Windows
+        """
+        if os.name != "nt":
+            raise RaptorNinox640IIError("xclibw64.dll can only be loaded on Windows, use XclibSimulator instead")
+        return WinDLL(os.path.join(os.path.dirname(__file__), "xclibw64.dll"))  # dll for the camera
+
     def __del__(self):
         """
         Deconnection.
         """
+        if self.live:
+            self.stop_live()
         ret = self.xclib.pxd_PIXCIclose()
         if ret not in (0, -25):
             raise RaptorNinox640IIError("Error at disconnection:", self._get_error())
@@ -177,8 +318,9 @@ class RaptorNinox640II(LoggingClass):
         Get manufacturer's data / later used information like ADC and DAC values
         """
         self.logger.debug("Ask for manufacturer data")
-        self.serial_set([0x53, 0xAE, 0x05, 0x01, 0x00, 0x00, 0x02, 0x00])
-        man_data = self.serial_get([0x53, 0xAF, 0x12], 20)
+        with self.transaction():
+            self.serial_set([0x53, 0xAE, 0x05, 0x01, 0x00, 0x00, 0x02, 0x00])
+            man_data = self.serial_get([0x53, 0xAF, 0x12], 20)
 
         # Need to turn in hexa to concatene 2 bytes with little endian method
         man_data_hex = [hex(x)[2:] for x in man_data]
@@ -238,44 +380,164 @@ class RaptorNinox640II(LoggingClass):
         mic = self.serial_get([0x56], 4)
         micro_version = f"v{mic[0]}.{mic[1]}"
         # get fpga version
-        self.serial_set([0x53, 0xE0, 0x01, 0x7E])
-        v1 = self.serial_get([0x53, 0xE1, 0x01], 3)
-        self.serial_set([0x53, 0xE0, 0x01, 0x7F])
-        v2 = self.serial_get([0x53, 0xE1, 0x01],3)
-        fpga_version = f"v{v1[0]}.{v2[0]}"
+        v1, v2 = self.read_register_bytes(registers.FPGA_VERSION)
+        fpga_version = f"v{v1}.{v2}"
 
         info = [FPGA_booted_success, FPGA_not_in_reset, comm_to_EPROM,
                 micro_version, fpga_version]
         return info
 
-    def capture_img(self) -> np.ndarray:
+    #region Live acquisition
+
+    def start_live(self, buffer_count: int = 4):
         """
-        Capture image into buffer 1 and into self.last_img
-        :return: raw image data in an array
+        Start the continuous acquisition: the frame grabber captures every frame of the camera in rotation
+        into the buffers 1 to buffer_count, the frame rate is only limited by the exposure.
+        capture_img then reads the last completed buffer without snap round trip.
+        :param buffer_count: Number of frame buffers in rotation, limited by the memory of the frame grabber
+        """
+        buffer_count = min(buffer_count, self.xclib.pxd_imageZdim())
+        if buffer_count < 2:
+            raise RaptorNinox640IIError(f"Not enough frame buffers for live acquisition: {buffer_count}")
+
+        # Capture in buffers 1 to buffer_count, increment of 1, 0 = no end, period of 1 field
+        error = self.xclib.pxd_goLiveSeq(1, 1, buffer_count, 1, 0, 1)
+        if error < 0:
+            raise RaptorNinox640IIError(f"Error at start live: {error}, {self._get_error()}")
+
+        self.live = True
+        self.live_buffer_count = buffer_count
+        self.frame_sequence = None
+        self.skipped_frames = 0
+        self.logger.debug(f"Live acquisition started on {buffer_count} buffers")
+
+    def stop_live(self):
+        """
+        Stop the continuous acquisition, capture_img takes back a snap for each picture
+        """
+        error = self.xclib.pxd_goUnLive(1)
+        self.live = False
+        if error < 0:
+            raise RaptorNinox640IIError(f"Error at stop live: {error}, {self._get_error()}")
+        self.logger.debug("Live acquisition stopped")
+
+    def last_captured_buffer(self) -> tuple[int, int]:
+        """
+        :return: Number of the last buffer completed by the frame grabber and its sequence number.
+        The buffer number is 0 if no frame has been captured yet.
+        """
+        buffer = self.xclib.pxd_capturedBuffer(1)
+        if buffer <= 0:
+            return 0, -1
+        return buffer, self.xclib.pxd_buffersFieldCount(1, buffer)
+
+    def wait_new_frame(self, last_sequence: Optional[int], timeout: float = 1.0) -> bool:
+        """
+        Wait until the frame grabber completes a frame newer than last_sequence
+        :param last_sequence: Sequence number of the last frame used, None to take the next completed frame
+        :param timeout: Max time to wait in seconds
+        :return: True if a new frame is available
         """
-        # Capturing a single image
-        error = self.xclib.pxd_doSnap(1, 1, 0)
-        if error > 0:
-            raise RaptorNinox640IIError("Error at capture image:", self._get_error())
+        if last_sequence is None:
+            last_sequence = self.last_captured_buffer()[1]
 
-        # Create dimension of the picture
-        self.last_img = np.zeros(self.xdim*self.ydim).astype(np.uint16)
+        deadline = time.perf_counter() + timeout
+        while self.last_captured_buffer()[1] == last_sequence:
+            if time.perf_counter() > deadline:
+                return False
+            time.sleep(0.001)
+        return True
+
+    @classmethod
+    def frame_timeout(cls, exposure: Optional[float]) -> float:
+        """
+        :param exposure: Exposure time in seconds, None if unknown (auto exposure)
+        :return: Max time to wait for a frame of the live acquisition in seconds
+        """
+        if exposure is None:
+            exposure = cls.MAX_EXPOSURE
+        return 2 * exposure + 1.0
+
+    #endregion
+
+    def capture_fresh_frame(self, timeout: float = 1.0) -> np.ndarray:
+        """
+        Capture a frame exposed after the call, for the single pictures: ex after a move, for a dark.
+        In live mode, the last buffer completed can be older than the call, like a snap: wait for the frames after.
+        The caller owns the buffer returned and must give it back with release_frame.
+        :param timeout: Max time to wait for each frame in seconds, see frame_timeout
+        """
+        if self.live:
+            sequence = self.last_captured_buffer()[1]
+            # The frame in progress at the call started its exposure before it: wait for the one after
+            for _ in range(2):
+                if not self.wait_new_frame(sequence, timeout):
+                    raise RaptorNinox640IIError(f"Error at capture image: no new frame after {timeout} s in live mode")
+                sequence = self.last_captured_buffer()[1]
+        return self.capture_frame(timeout)
+
+    def capture_frame(self, timeout: float = 1.0) -> np.ndarray:
+        """
+        Capture image into a buffer of the frame pool, without allocation.
+        In live mode, read the last buffer completed by the frame grabber instead of a snap.
+        The caller owns the buffer returned and must give it back with release_frame.
+        :param timeout: Max time to wait for a free buffer of the pool in seconds
+        :return: raw image data in 16 bits, in an array of the frame pool
+        """
+        # Take the buffer before reading the frame grabber, to read the last frame in live mode
+        frame = self.frame_pool.acquire(timeout)
+
+        if self.live:
+            buffer, sequence = self.last_captured_buffer()
+            if buffer == 0:
+                self.frame_pool.release(frame)
+                raise RaptorNinox640IIError("Error at capture image: no frame captured in live mode")
+        else:
+            buffer = 1
+            # Capturing a single image
+            error = self.xclib.pxd_doSnap(1, buffer, 0)
+            if error > 0:
+                self.frame_pool.release(frame)
+                raise RaptorNinox640IIError("Error at capture image:", self._get_error())
+            sequence = self.xclib.pxd_buffersFieldCount(1, buffer)
 
         cx = 0  # x of the upper left corner
         cy = 0  # y of the upper left corner
 
-        # Write the value of the new image into last_image variable in a grey shade
-        error = self.xclib.pxd_readushort(1, 1, cx, cy, -1, -1,
-                                          self.last_img.ctypes.data_as(ctypes.POINTER(ctypes.c_ushort)),
+        # Write the value of the new image directly into the buffer of the pool in a grey shade
+        error = self.xclib.pxd_readushort(1, buffer, cx, cy, -1, -1, self.frame_pool.pointer(frame),
                                           self.xdim*self.ydim, b"Grey")
         if error < 0:
+            self.frame_pool.release(frame)
             raise RaptorNinox640IIError("Error at saving data -> buffer", self._get_error())
 
-        # Put 2 dimensional array for height x width
-        self.last_img =  self.last_img.reshape(self.width, self.height)
-        # Put the array into 16 bits value
-        self.last_img = self.last_img * 4
+        # Put the 14 bits values into 16 bits values (* 4) in place
+        np.left_shift(frame, 2, out=frame)
+
+        # Count the frames completed by the frame grabber but never read
+        if self.frame_sequence is not None and sequence > self.frame_sequence + 1:
+            self.skipped_frames += sequence - self.frame_sequence - 1
+        self.frame_sequence = sequence
+
+        return frame
 
+    def release_frame(self, frame: np.ndarray):
+        """
+        Give back to the frame pool a buffer returned by capture_frame
+        """
+        self.frame_pool.release(frame)
+
+    def capture_img(self, fresh: bool = False, timeout: float = 1.0) -> np.ndarray:
+        """
+        Capture image into self.last_img
+        The array belongs to the caller, use capture_frame for the continuous acquisition
+        :param fresh: True for a frame exposed after the call, see capture_fresh_frame
+        :param timeout: Max time to wait for a frame in seconds
+        :return: raw image data in an array
+        """
+        frame = self.capture_fresh_frame(timeout) if fresh else self.capture_frame(timeout)
+        self.last_img = frame.copy()
+        self.release_frame(frame)
         return self.last_img
 
     def save_bmp(self):
@@ -289,55 +551,65 @@ class RaptorNinox640II(LoggingClass):
 
     def micro_reset(self):
         self.serial_set([0x55, 0x99, 0x66, 0x11], 0)
+        self.invalidate_fpga_status()
+
+    def get_fpga_status(self, force: bool = False) -> int:
+        """
+        Value of the FPGA control register, served from its shadow copy if it's recent enough
+        :param force: Read the register even if the shadow copy is valid
+        """
+        with self.transaction():
+            max_age = self.fpga_control_max_age
+            expired = max_age is not None and time.monotonic() - self._fpga_control_time >= max_age
+            if force or self._fpga_control is None or expired:
+                self._fpga_control = self.read_register(registers.FPGA_CONTROL)
+                self._fpga_control_time = time.monotonic()
+            return self._fpga_control
 
-    def get_fpga_status(self):
-        self.serial_set([0x53, 0xE0, 0x01, 0x00])
-        state = self.serial_get([0x53, 0xE1, 0x01], 3)
-        state = (bin(state[0])[2:]).zfill(8)
-        self.fan_enable = state[-3]
-        self.auto_expo_enable = state[-2]
-        self.tec_enable = state[-1]
-        self.horiz_flip_cap = state[0]
-        self.invert_cap = state[1]
+    def invalidate_fpga_status(self):
+        """
+        Force the next access to the FPGA control register to read it
+        """
+        self._fpga_control = None
+
+    def _get_fpga_bit(self, bit: int) -> int:
+        return 1 if self.get_fpga_status() & bit else 0
+
+    def _set_fpga_bit(self, bit: int, state: typing.Union[int, bool]):
+        """
+        Change one bit of the FPGA control register: one write if the shadow copy is valid
+        """
+        with self.transaction():
+            control = self.get_fpga_status() & self.FPGA_CONTROL_MASK
+            control = control | bit if int(state) else control & ~bit
+            self.write_register(registers.FPGA_CONTROL, control)
+            self._fpga_control = control
+            self._fpga_control_time = time.monotonic()
 
     #region Setter and getter of the attributes
 
     @property
     def fan(self) -> int:
-        self.get_fpga_status()
-        return 1 if self.fan_enable == '1' else 0
+        return self._get_fpga_bit(self.FPGA_FAN_ENABLE)
 
     @fan.setter
     def fan(self, fan_state: typing.Union[int, bool]):
-        fan_state = int(fan_state)
-        self.get_fpga_status()
-        init = (self.horiz_flip_cap, self.invert_cap, 0, 0, 0, fan_state, self.auto_expo_enable, self.tec_enable)
-        init = "0x{:02x}".format(int("".join(str(ele) for ele in init), 2))
-        self.serial_set([0x53, 0xE0, 0x02, 0x00, int(init, 16)])
+        self._set_fpga_bit(self.FPGA_FAN_ENABLE, fan_state)
 
     @property
     def tec_activation(self) -> int:
-        self.get_fpga_status()
-        return 1 if self.tec_enable == '1' else 0
+        return self._get_fpga_bit(self.FPGA_TEC_ENABLE)
 
     @tec_activation.setter
     def tec_activation(self, tec_state: typing.Union[int, bool]):
-        tec_state = int(tec_state)
-        self.get_fpga_status()
-        init = (self.horiz_flip_cap, self.invert_cap, 0, 0, 0, self.fan_enable, self.auto_expo_enable, tec_state)
-        init = "0x{:02x}".format(int("".join(str(ele) for ele in init), 2))
-        self.serial_set([0x53, 0xE0, 0x02, 0x00, int(init, 16)])
+        self._set_fpga_bit(self.FPGA_TEC_ENABLE, tec_state)
 
     @property
     def tec(self) -> float:
         """
         :return: ThermoElectric Cooler Setpoint
         """
-        self.serial_set([0x53, 0xE0, 0x01, 0xFB])
-        msb = self.serial_get([0x53, 0xE1, 0x01], 3)
-        self.serial_set([0x53, 0xE0, 0x01, 0xFA])
-        lsb = self.serial_get([0x53, 0xE1, 0x01], 3)
-        tec = (self.slope_tec_get * (msb[0] << 8 | lsb[0])) + self.constant_tec_get
+        tec = (self.slope_tec_get * self.read_register(registers.TEC_SETPOINT)) + self.constant_tec_get
         return tec
 
     @tec.setter
@@ -346,20 +618,15 @@ class RaptorNinox640II(LoggingClass):
         Set TEC Value
         """
         val = (tec_val - self.constant_tec_set) / self.slope_tec_set
-        tec = '0x{:04x}'.format(int(val))
-        self.serial_set([0x53, 0xE0, 0x02, 0xFB, int(tec[2:4], 16)])
-        self.serial_set([0x53, 0xE0, 0x02, 0xFA, int(tec[4:6], 16)])
+        self.write_register(registers.TEC_SETPOINT, int(val) & 0xFFFF)
 
     @property
     def temp(self):
         """
         :return: Sensor Temperature CDD Cooler
         """
-        self.serial_set([0x53, 0xE0, 0x01, 0x6E])
-        temp1 = self.serial_get([0x53, 0xE1, 0x01], 3)
-        self.serial_set([0x53, 0xE0, 0x01, 0x6F])
-        temp2 = self.serial_get([0x53, 0xE1, 0x01], 3)
-        temp = self.slope_tec_get * (temp1[0] << 8 | temp2[0]) + self.constant_tec_get  # from adc values
+        # from adc values
+        temp = self.slope_tec_get * self.read_register(registers.SENSOR_TEMPERATURE) + self.constant_tec_get
         return temp
 
     @property
@@ -367,11 +634,7 @@ class RaptorNinox640II(LoggingClass):
         """
         :return: Sensor Temperature PCB
         """
-        self.serial_set([0x53, 0xE0, 0x01, 0x70])
-        msb = self.serial_get([0x53, 0xE1, 0x01], 3)
-        self.serial_set([0x53, 0xE0, 0x01, 0x71])
-        lsb = self.serial_get([0x53, 0xE1, 0x01], 3)
-        temp_pcb = ((msb[0] & 0b1111) << 8 | lsb[0])
+        temp_pcb = self.read_register(registers.PCB_TEMPERATURE) & 0b1111_1111_1111
         left_part = -2 ** 12 + (temp_pcb >> 4) & 0b111_1111_1111 if (temp_pcb >> 11) else temp_pcb >> 4
         right_part = (temp_pcb & 0b1111) * 1 / 16
         return left_part + right_part
@@ -381,9 +644,8 @@ class RaptorNinox640II(LoggingClass):
         """
         :return: 1 = High Gain  0 = Low Gain
         """
-        self.serial_set([0x53, 0xE0, 0x01, 0xF2])
-        state = self.serial_get([0x53, 0xE1, 0x01], 3)
-        state = (bin(state[0])[2:]).zfill(8)
+        state = self.read_register(registers.GAIN_MODE)
+        state = (bin(state)[2:]).zfill(8)
         return 1 if state[-2] and state[-3] == '1' else 0
 
     @gain.setter
@@ -391,7 +653,7 @@ class RaptorNinox640II(LoggingClass):
         """
         Set gain: 1 = High Gain  0 = Low Gain
         """
-        self.serial_set([0x53, 0xE0, 0x02, 0xF2, 0x06]) if state else self.serial_set([0x53, 0xE0, 0x02, 0xF2, 0x00])
+        self.write_register(registers.GAIN_MODE, 0x06 if state else 0x00)
 
     @property
     def digital_gain(self):
@@ -400,14 +662,7 @@ class RaptorNinox640II(LoggingClass):
         According to the datasheet of the camera, the digital gain is a different parameter than gain
         :return: Value of the digital gain of the camera. Max value: 65535, min value: 0
         """
-        self.serial_set([0x53, 0xE0, 0x01, 0xC6])
-        gain_msb = self.serial_get([0x53, 0xE1, 0x01], 3)[0]
-        self.serial_set([0x53, 0xE0, 0x01, 0xC7])
-        gain_lsb = self.serial_get([0x53, 0xE1, 0x01], 3)[0]
-
-        print(gain_msb << 8 | gain_lsb)
-
-        return gain_msb << 8 | gain_lsb
+        return self.read_register(registers.DIGITAL_GAIN)
 
     @digital_gain.setter
     def digital_gain(self, value):
@@ -420,16 +675,11 @@ class RaptorNinox640II(LoggingClass):
             self.logger.error("Wrong value to digital gain setter")
             return
 
-        self.serial_set([0x53, 0xE0, 0x02, 0xC6, (value >> 8) & 0xFF])
-        self.serial_set([0x53, 0xE0, 0x02, 0xC7, value & 0xFF])
+        self.write_register(registers.DIGITAL_GAIN, value)
 
     @property
     def auto_level(self) -> int:
-        self.serial_set([0x53, 0xE0, 0x01, 0x23])
-        msb = self.serial_get([0x53, 0xE1, 0x01], 3)
-        self.serial_set([0x53, 0xE0, 0x01, 0x24])
-        lsb = self.serial_get([0x53, 0xE1, 0x01], 3)
-        auto_level = (msb[0] << 8 | lsb[0]) >> 2
+        auto_level = self.read_register(registers.AUTO_LEVEL) >> 2
         return auto_level
 
     @auto_level.setter
@@ -439,10 +689,8 @@ class RaptorNinox640II(LoggingClass):
             value = 16383
             self.logger.error("Value of auto level too high")
 
-        auto_level = '{0:014b}'.format(value)
-        lsb = f"{auto_level[8:14]}00"
-        self.serial_set([0x53, 0xE0, 0x02, 0x23, int(auto_level[0:8], 2)])  # Send MM bits
-        self.serial_set([0x53, 0xE0, 0x02, 0x24, int(lsb, 2)])  # Send LL bits
+        # 14 bits value on the MSB of the register: MM bits then LL bits followed by 00
+        self.write_register(registers.AUTO_LEVEL, value << 2)
 
     @property
     def exposure(self) -> int:
@@ -450,17 +698,8 @@ class RaptorNinox640II(LoggingClass):
         :return: Time of exposure in seconds
         min = 500ns
         """
-        self.serial_set([0x53, 0xE0, 0x01, 0xEE])  # msb
-        msb = self.serial_get([0x53, 0xE1, 0x01], 3)
-        self.serial_set([0x53, 0xE0, 0x01, 0xEF])  # mid upper bit
-        midu = self.serial_get([0x53, 0xE1, 0x01], 3)
-        self.serial_set([0x53, 0xE0, 0x01, 0xF0])  # mid low bit
-        midl = self.serial_get([0x53, 0xE1, 0x01], 3)
-        self.serial_set([0x53, 0xE0, 0x01, 0xF1])  # lsb
-        lsb = self.serial_get([0x53, 0xE1, 0x01], 3)
-
-        value = msb[0] << 24 | midu[0] << 16 | midl[0] << 8 | lsb[0]
-        return value
+        # msb, mid upper bit, mid low bit and lsb in one transaction
+        return self.read_register(registers.EXPOSURE)
 
     @exposure.setter
     def exposure(self, exp: float):
@@ -474,47 +713,31 @@ class RaptorNinox640II(LoggingClass):
         # Divide to find 1 count
         # multiply by 4e7 = divide by 25e-9, 1 count
         exp = int(exp*40_000_000)
-        exp = "0x{:08x}".format(exp)
-        self.serial_set([0x53, 0xE0, 0x02, 0xEE, int(exp[2:4], 16)])  # msb
-        self.serial_set([0x53, 0xE0, 0x02, 0xEF, int(exp[4:6], 16)])  # midu
-        self.serial_set([0x53, 0xE0, 0x02, 0xF0, int(exp[6:8], 16)])  # midl
-        self.serial_set([0x53, 0xE0, 0x02, 0xF1, int(exp[8:10], 16)])  # lsb
+        self.write_register(registers.EXPOSURE, exp)
 
     @property
     def auto_exposure(self) -> int:
-        self.get_fpga_status()
-        return 1 if self.auto_expo_enable == '1' else 0
+        return self._get_fpga_bit(self.FPGA_AUTO_EXPOSURE)
 
     @auto_exposure.setter
     def auto_exposure(self, au_exp_state: int):
-        self.get_fpga_status()
-        init = (self.horiz_flip_cap, self.invert_cap, 0, 0, 0, self.fan_enable, au_exp_state, self.tec_enable)
-        init = "0x{:02x}".format(int("".join(str(ele) for ele in init), 2))
-        self.serial_set([0x53, 0xE0, 0x02, 0x00, int(init, 16)])
+        self._set_fpga_bit(self.FPGA_AUTO_EXPOSURE, au_exp_state)
 
     @property
     def invert_video(self) -> int:
-        self.get_fpga_status()
-        return 1 if self.invert_cap == '1' else 0
+        return self._get_fpga_bit(self.FPGA_INVERT_VIDEO)
 
     @invert_video.setter
     def invert_video(self, invert_state: int):
-        self.get_fpga_status()
-        init = (self.horiz_flip_cap, invert_state, 0, 0, 0, self.fan_enable, self.auto_expo_enable, self.tec_enable)
-        init = "0x{:02x}".format(int("".join(str(ele) for ele in init), 2))
-        self.serial_set([0x53, 0xE0, 0x02, 0x00, int(init, 16)])
+        self._set_fpga_bit(self.FPGA_INVERT_VIDEO, invert_state)
 
     @property
     def horiz_flip(self) -> int:
-        self.get_fpga_status()
-        return 1 if self.horiz_flip_cap == '1' else 0
+        return self._get_fpga_bit(self.FPGA_HORIZ_FLIP)
 
     @horiz_flip.setter
     def horiz_flip(self, horiz_flip_state: int):
-        self.get_fpga_status()
-        init = (horiz_flip_state, self.invert_cap, 0, 0, 0, self.fan_enable, self.auto_expo_enable, self.tec_enable)
-        init = "0x{:02x}".format(int("".join(str(ele) for ele in init), 2))
-        self.serial_set([0x53, 0xE0, 0x02, 0x00, int(init, 16)])
+        self._set_fpga_bit(self.FPGA_HORIZ_FLIP, horiz_flip_state)
 
     #endregion
 
@@ -0,0 +1,37 @@
+from typing import NamedTuple, List
+
+
+class FpgaRegister(NamedTuple):
+    """
+    Value of the FPGA of the camera stored on one or several registers of 1 byte
+    """
+    name: str
+    addresses: tuple  # Address of each byte, from the most significant byte to the least significant byte
+
+    def split(self, value: int) -> List[int]:
+        """
+        :return: Bytes to write at each address of the register
+        """
+        return [(value >> (8 * shift)) & 0xFF for shift in reversed(range(len(self.addresses)))]
+
+    def join(self, data: List[int]) -> int:
+        """
+        :param data: Bytes read at each address of the register
+        :return: Value of the register
+        """
+        value = 0
+        for byte in data:
+            value = value << 8 | byte
+        return value
+
+
+# Register map of the Raptor Ninox 640 II (datasheet)
+FPGA_CONTROL = FpgaRegister("fpga_control", (0x00,))
+AUTO_LEVEL = FpgaRegister("auto_level", (0x23, 0x24))
+SENSOR_TEMPERATURE = FpgaRegister("temp", (0x6E, 0x6F))
+PCB_TEMPERATURE = FpgaRegister("temp_pcb", (0x70, 0x71))
+FPGA_VERSION = FpgaRegister("fpga_version", (0x7E, 0x7F))
+DIGITAL_GAIN = FpgaRegister("digital_gain", (0xC6, 0xC7))
+EXPOSURE = FpgaRegister("exposure", (0xEE, 0xEF, 0xF0, 0xF1))
+GAIN_MODE = FpgaRegister("gain", (0xF2,))
+TEC_SETPOINT = FpgaRegister("tec", (0xFB, 0xFA))
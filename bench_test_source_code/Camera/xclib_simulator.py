@@ -0,0 +1,300 @@
+import ctypes
+import functools
+import time
+from collections import deque
+from typing import Optional
+
+import numpy as np
+
+from Scripts.Camera import raptor_registers as registers
+from Scripts.utils import LoggingClass
+
+
+class XclibSimulator(LoggingClass):
+    """
+    In-process stand-in of xclibw64.dll for a Raptor Ninox 640 II, to run the driver without the frame grabber.
+    Give it to RaptorNinox640II(xclib=XclibSimulator()) or CameraInterface(xclib=XclibSimulator()).
+    Only the pxd_* functions used by the driver are implemented, with the same arguments and return codes.
+    The serial port answers the register protocol of the camera (ack 0x50 + check sum) after a configurable latency,
+    the frames are synthetic 14 bits pictures: a background, gaussian hotspots and a noise.
+    """
+    # Calibration of the temperature sensor and of the TEC stored in the manufacturer data (ADC/DAC at 0°C and 40°C)
+    # All the low bytes are >= 0x10 because the driver concatenates them in hexadecimal without padding
+    ADC_0, ADC_40 = 0x3A98, 0x1F40
+    DAC_0, DAC_40 = 0x3E80, 0x1770
+    SERIAL_NUMBER = 0x2A31
+    BUILD_DATE = (18, 6, 23)
+    MICRO_VERSION = (2, 17)
+    FPGA_VERSION = (3, 12)
+
+    # Bits of the system status: FPGA booted, FPGA not in reset, communication with the EPROM
+    SYSTEM_STATUS = 0b111
+    # Bit of the system state enabling the check sum at the end of the answers
+    CHECK_SUM_ENABLE = 1 << 6
+
+    def __init__(self, width: int = 640, height: int = 512, noise: float = 40.0, hotspots: int = 3,
+                 background: int = 2000, frame_period: float = 0.02, serial_latency: float = 0.0,
+                 buffer_count: int = 4, noise_frames: int = 8, seed: Optional[int] = None):
+        """
+        :param noise: Standard deviation of the noise of the frames in 14 bits levels
+        :param hotspots: Number of gaussian hotspots in the frames
+        :param background: Mean level of the background in 14 bits levels
+        :param frame_period: Time between two frames of the live acquisition in seconds
+        :param serial_latency: Time between a serial command and its answer in seconds
+        :param buffer_count: Number of frame buffers of the frame grabber
+        :param noise_frames: Number of different frames, they are generated once and repeated
+        :param seed: Seed of the random generator, for reproducible frames
+        """
+        LoggingClass.__init__(self)
+        self.width = width
+        self.height = height
+        self.frame_period = frame_period
+        self.serial_latency = serial_latency
+        self.buffer_count = buffer_count
+        self.opened = False
+
+        self._rng = np.random.default_rng(seed)
+        self._frames = self._generate_frames(noise, hotspots, background, noise_frames)
+
+        # Serial port: answers waiting their latency (time available, bytes), then bytes ready to be read
+        self._pending = deque()
+        self._rx = bytearray()
+        self._system_state = 0
+        self._address = 0
+        self._registers = self._default_registers()
+
+        # Frame grabber: sequence number of the frame in each buffer, live acquisition start time
+        self._buffer_fields = [0] * (buffer_count + 1)
+        self._field_count = 0
+        self._live_start = None
+        self._live_buffers = buffer_count
+        self._live_field_start = 0
+        self._last_error = ""
+
+    #region Synthetic frames
+
+    def _generate_frames(self, noise: float, hotspots: int, background: int, count: int) -> np.ndarray:
+        """
+        :return: Frames of 14 bits values in the memory order of the frame grabber (rows of width pixels)
+        """
+        y, x = np.mgrid[0:self.height, 0:self.width].astype(np.float32)
+        scene = np.full((self.height, self.width), background, dtype=np.float32)
+        # Slow gradient, to see the flip and the crop of the picture
+        scene += 200 * x / self.width
+        for _ in range(hotspots):
+            cx, cy = self._rng.uniform(0, self.width), self._rng.uniform(0, self.height)
+            sigma = self._rng.uniform(4, 30)
+            amplitude = self._rng.uniform(2000, 12000)
+            scene += amplitude * np.exp(-((x - cx) ** 2 + (y - cy) ** 2) / (2 * sigma ** 2))
+
+        frames = np.empty((count, self.height, self.width), dtype=np.uint16)
+        for frame in frames:
+            noisy = scene + self._rng.normal(0, noise, scene.shape).astype(np.float32)
+            np.clip(noisy, 0, 2 ** 14 - 1, out=noisy)
+            frame[:] = noisy
+        return frames
+
+    def _frame(self, buffer: int) -> np.ndarray:
+        return self._frames[self._buffer_fields[buffer] % len(self._frames)]
+
+    #endregion
+
+    #region Camera registers
+
+    def _default_registers(self) -> dict:
+        values = {}
+
+        def set_register(register, value):
+            values.update(zip(register.addresses, register.split(value)))
+
+        set_register(registers.FPGA_CONTROL, 0)
+        set_register(registers.AUTO_LEVEL, 0x2000)
+        set_register(registers.SENSOR_TEMPERATURE, self._adc(20))
+        set_register(registers.PCB_TEMPERATURE, 35 * 16)
+        set_register(registers.FPGA_VERSION, self.FPGA_VERSION[0] << 8 | self.FPGA_VERSION[1])
+        set_register(registers.DIGITAL_GAIN, 0x0100)
+        # The camera exposes during the whole frame period
+        set_register(registers.EXPOSURE, int(self.frame_period * 4e7))
+        set_register(registers.GAIN_MODE, 0x06)
+        set_register(registers.TEC_SETPOINT, int(self.DAC_0 + (self.DAC_40 - self.DAC_0) * 15 / 40))
+        return values
+
+    def _adc(self, temperature: float) -> int:
+        return int(self.ADC_0 + (self.ADC_40 - self.ADC_0) * temperature / 40)
+
+    def _manufacturer_data(self) -> list:
+        data = [0x10] * 18
+        data[0:2] = self.SERIAL_NUMBER & 0xFF, self.SERIAL_NUMBER >> 8
+        data[2:5] = self.BUILD_DATE
+        # Values on 2 bytes in little endian
+        for index, value in zip((10, 12, 14, 16), (self.ADC_0, self.ADC_40, self.DAC_0, self.DAC_40)):
+            data[index:index + 2] = value & 0xFF, value >> 8
+        return data
+
+    def _answer(self, command: bytes) -> Optional[list]:
+        """
+        :param command: Command sent by the driver without its ack and check sum
+        :return: Data of the answer of the camera without ack and check sum, None if the camera doesn't answer
+        """
+        if command[0] == 0x49:  # Get system status
+            return [self.SYSTEM_STATUS]
+        if command[0] == 0x4F:  # Set system state
+            self._system_state = command[1]
+            return []
+        if command[0] == 0x56:  # Get micro version
+            return list(self.MICRO_VERSION)
+        if command[0] == 0x55:  # Micro reset
+            return None
+        if command[:3] == b"\x53\xE0\x01":  # Set the address of a register
+            self._address = command[3]
+            return []
+        if command[:3] == b"\x53\xE1\x01":  # Read the register at the address set
+            return [self._registers.get(self._address, 0)]
+        if command[:3] == b"\x53\xE0\x02":  # Write a register
+            self._registers[command[3]] = command[4]
+            return []
+        if command[:2] == b"\x53\xAE":  # Set the address of the manufacturer data
+            return []
+        if command[:2] == b"\x53\xAF":  # Read the manufacturer data
+            return self._manufacturer_data()[:command[2]]
+        self.logger.warning(f"Unknown serial command: {list(map(hex, command))}")
+        return []
+
+    #endregion
+
+    #region Connection
+
+    def pxd_PIXCIopen(self, driver_params, format_name, format_file) -> int:
+        self.opened = True
+        return 0
+
+    def pxd_PIXCIclose(self) -> int:
+        if self.opened:
+            self.pxd_goUnLive(1)
+        self.opened = False
+        return 0
+
+    def pxd_mesgErrorCode(self, error: int) -> int:
+        return error
+
+    def pxd_mesgFaultText(self, unitmap: int, buffer, size: int) -> int:
+        if not self._last_error:
+            return 0
+        text = self._last_error.encode("utf8")[:size - 1] + b"\0"
+        ctypes.memmove(buffer, text, len(text))
+        return 1
+
+    #endregion
+
+    #region Serial port
+
+    def pxd_serialConfigure(self, unitmap, rsvd0, baud, bits, parity, stopbits, rsvd1, rsvd2, rsvd3) -> int:
+        return 0
+
+    def pxd_serialWrite(self, unitmap: int, rsvd: int, data: bytes, count: int) -> int:
+        """
+        The driver writes one command with its ack and check sum at each call
+        """
+        command = bytes(data[:count])
+        answer = self._answer(command[:-2])
+        if answer is None:
+            return count
+
+        answer = answer + [0x50]
+        if self._system_state & self.CHECK_SUM_ENABLE:
+            # The camera sends back the check sum of the command
+            answer.append(functools.reduce(int.__xor__, command[:-1]))
+        self._pending.append((time.perf_counter() + self.serial_latency, bytes(answer)))
+        return count
+
+    def pxd_serialRead(self, unitmap: int, rsvd: int, buffer, count: int) -> int:
+        now = time.perf_counter()
+        while self._pending and self._pending[0][0] <= now:
+            self._rx += self._pending.popleft()[1]
+
+        length = min(count, len(self._rx))
+        if length:
+            ctypes.memmove(buffer, bytes(self._rx[:length]), length)
+            del self._rx[:length]
+        return length
+
+    #endregion
+
+    #region Frame grabber
+
+    def pxd_imageXdims(self) -> int:
+        return self.width
+
+    def pxd_imageYdims(self) -> int:
+        return self.height
+
+    def pxd_imageCdim(self) -> int:
+        return 1
+
+    def pxd_imageBdim(self) -> int:
+        return 14
+
+    def pxd_imageZdim(self) -> int:
+        return self.buffer_count
+
+    def pxd_doSnap(self, unitmap: int, buffer: int, timeout: int) -> int:
+        if not 1 <= buffer <= self.buffer_count:
+            self._last_error = f"Wrong frame buffer: {buffer}"
+            return -1
+        self._field_count += 1
+        self._buffer_fields[buffer] = self._field_count
+        return 0
+
+    def pxd_goLiveSeq(self, unitmap: int, startbuf: int, endbuf: int, incbuf: int, numbuf: int, period: int) -> int:
+        if startbuf != 1 or not 1 < endbuf <= self.buffer_count:
+            self._last_error = f"Wrong frame buffers: {startbuf} to {endbuf}"
+            return -1
+        self._live_buffers = endbuf
+        self._live_field_start = self._field_count
+        self._live_start = time.perf_counter()
+        return 0
+
+    def pxd_goUnLive(self, unitmap: int) -> int:
+        if self._live_start is not None:
+            self._update_live()
+            self._live_start = None
+        return 0
+
+    def _update_live(self):
+        """
+        Fill the buffers with the frames completed since the start of the live acquisition
+        """
+        fields = int((time.perf_counter() - self._live_start) / self.frame_period)
+        count = self._live_field_start + fields
+        # Only the last frame of each buffer matters, the older ones are overwritten
+        for field in range(max(self._field_count, count - self._live_buffers) + 1, count + 1):
+            self._buffer_fields[(field - self._live_field_start - 1) % self._live_buffers + 1] = field
+        self._field_count = count
+
+    def pxd_capturedBuffer(self, unitmap: int) -> int:
+        if self._live_start is not None:
+            self._update_live()
+        if self._field_count == 0:
+            return 0
+        return self._buffer_fields.index(max(self._buffer_fields))
+
+    def pxd_buffersFieldCount(self, unitmap: int, buffer: int) -> int:
+        if self._live_start is not None:
+            self._update_live()
+        return self._buffer_fields[buffer]
+
+    def pxd_readushort(self, unitmap: int, buffer: int, ulx: int, uly: int, lrx: int, lry: int,
+                       pointer, count: int, color: bytes) -> int:
+        """
+        Copy the frame of a buffer into the memory of the pointer (only the whole frame is implemented)
+        """
+        frame = self._frame(buffer).reshape(-1)
+        count = min(count, frame.size)
+        np.copyto(np.ctypeslib.as_array(pointer, shape=(count,)), frame[:count])
+        return count
+
+    def pxd_saveBmp(self, unitmap, name, buffer, ulx, uly, lrx, lry, savemode, options) -> int:
+        self._last_error = "pxd_saveBmp is not implemented by the simulator"
+        return -1
+
+    #endregion
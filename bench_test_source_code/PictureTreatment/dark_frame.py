@@ -0,0 +1,137 @@
+import time
+from typing import List, Optional
+
+import numpy as np
+
+
+class MasterDark:
+    """
+    Dark frames of the camera combined into one master dark frame, subtracted from the frames of the camera.
+    The master dark is computed once and cached until the list of dark frames or the method changes,
+    so the cost of the subtraction doesn't depend on the number of dark frames.
+    """
+    MEAN = "Mean"
+    MEDIAN = "Median"
+    METHODS = (MEAN, MEDIAN)
+
+    def __init__(self, method: str = MEAN, frame_shape: tuple = (640, 512)):
+        """
+        :param method: Combination of the dark frames, MEAN or MEDIAN
+        """
+        self.frame_shape = frame_shape
+        self._frames: List[np.ndarray] = []
+        self._method = method
+        self._master: Optional[np.ndarray] = None
+        # Output buffer of the subtraction, reused at each frame
+        self._output = np.zeros(frame_shape, dtype=np.uint16)
+
+    def __len__(self):
+        return len(self._frames)
+
+    @property
+    def frames(self) -> tuple:
+        """
+        :return: Dark frames, in the order they were added
+        """
+        return tuple(self._frames)
+
+    @property
+    def method(self) -> str:
+        return self._method
+
+    @method.setter
+    def method(self, method: str):
+        if method not in self.METHODS:
+            raise ValueError(f"Unknown method to combine the dark frames: {method}")
+        if method != self._method:
+            self._method = method
+            self._master = None
+
+    def add(self, frame: np.ndarray):
+        """
+        :param frame: Dark frame, copied
+        """
+        if frame.shape != self.frame_shape:
+            raise ValueError(f"Wrong shape of the dark frame: {frame.shape}, expected {self.frame_shape}")
+        self._frames.append(np.array(frame, dtype=np.uint16))
+        self._master = None
+
+    def pop(self) -> Optional[np.ndarray]:
+        """
+        Remove the last dark frame added
+        :return: The dark frame removed, None if there is no dark frame
+        """
+        if not self._frames:
+            return None
+        self._master = None
+        return self._frames.pop()
+
+    def set_frames(self, frames: List[np.ndarray]):
+        """
+        Replace all the dark frames, ex: at the load of the settings
+        """
+        self._frames = []
+        for frame in frames:
+            self.add(frame)
+        self._master = None
+
+    def master(self) -> Optional[np.ndarray]:
+        """
+        :return: Master dark frame, None if there is no dark frame
+        """
+        if self._master is None and self._frames:
+            stack = np.stack(self._frames)
+            if self._method == self.MEDIAN:
+                combined = np.median(stack, axis=0)
+            else:
+                combined = np.mean(stack, axis=0)
+            self._master = np.round(combined).astype(np.uint16)
+        return self._master
+
+    def subtract(self, frame: np.ndarray) -> np.ndarray:
+        """
+        Subtract the master dark, the negative values are put at 0
+        :param frame: Frame of the camera, not modified
+        :return: Frame without the dark. The array is reused at the next call, copy it to keep it
+        """
+        master = self.master()
+        if master is None or frame.shape != master.shape:
+            return frame
+
+        # Saturating subtraction in uint16: max(frame, dark) - dark
+        np.maximum(frame, master, out=self._output)
+        np.subtract(self._output, master, out=self._output)
+        return self._output
+
+
+if __name__ == '__main__':
+    # Benchmark: cost of the subtraction depending on the number of dark frames
+    rng = np.random.default_rng(0)
+    frame = rng.integers(0, 2**14, size=(640, 512), dtype=np.uint16) * 4
+    repeat = 50
+
+    def legacy_subtract(array_picture, subtract_image_list):
+        # Old implementation of CameraPictureWidget.apply_treatment_picture
+        for subtract_picture in subtract_image_list:
+            array_picture = np.subtract(array_picture, subtract_picture, dtype=np.int32)
+            array_picture = np.clip(array_picture, 0, None)
+        return array_picture.astype(dtype=np.uint16)
+
+    print(f"{'darks':>6} {'master dark (ms)':>18} {'legacy (ms)':>13}")
+    for count in (1, 2, 5, 10):
+        darks = [rng.integers(0, 500, size=(640, 512), dtype=np.uint16) for _ in range(count)]
+        master_dark = MasterDark()
+        master_dark.set_frames(darks)
+        master_dark.subtract(frame)
+
+        start = time.perf_counter()
+        for _ in range(repeat):
+            master_dark.subtract(frame)
+        master_time = (time.perf_counter() - start) / repeat * 1000
+
+        start = time.perf_counter()
+        for _ in range(repeat):
+            legacy_subtract(frame, darks)
+        legacy_time = (time.perf_counter() - start) / repeat * 1000
+
+        print(f"{count:>6} {master_time:>18.3f} {legacy_time:>13.3f}")
@@ -0,0 +1,209 @@
+import time
+from typing import Optional
+
+import numpy as np
+import pyqtgraph as pg
+from PyQt6.QtCore import QSize, Qt
+from PyQt6.QtGui import QImage, QPixmap
+
+
+class DisplayRenderer:
+    """
+    Turn a 16 bits frame of the camera into the pixmap displayed in the GUI.
+    The crop of the black border, the vertical flip and the level mapping are done in one pass:
+    a lookup table of the 65536 levels is applied on a view of the frame,
+    into 8 bits buffers allocated once and wrapped by QImages allocated once.
+    The lookup table holds the window [min_value, max_value], the gamma and the colormap,
+    it's only rebuilt when one of them changes.
+    """
+    GRAY = "Gray"
+    # False colour maps of pyqtgraph available in the GUI
+    COLORMAPS = (GRAY, "viridis", "inferno", "turbo", "CET-L3")
+
+    def __init__(self, frame_width: int = 640, frame_height: int = 512, border: int = 2):
+        """
+        :param frame_width: Number of pixels of a line in the memory of the frame
+        :param frame_height: Number of lines in the memory of the frame
+        :param border: Black border of the sensor removed from the picture
+        """
+        self.frame_width = frame_width
+        self.frame_height = frame_height
+        self.border = border
+        self.width = frame_width - border
+        self.height = frame_height - border
+
+        # Output of the level mapping: gray picture, or RGBX picture with the overlay in the blue channel
+        self._gray = np.zeros((self.height, self.width), dtype=np.uint8)
+        self._rgbx = np.zeros((self.height, self.width, 4), dtype=np.uint8)
+        # Display value of each 16 bits level: 8 bits gray, and RGBX colour packed in an uint32
+        self._gray_lut = np.zeros(65536, dtype=np.uint8)
+        self._color_lut = np.zeros(65536, dtype=np.uint32)
+        self._lut_valid = False
+        self._min_value = 0
+        self._max_value = 65535
+        self._gamma = 1.0
+        self._colormap = self.GRAY
+
+        self._gray_image = QImage(self._gray, self.width, self.height, self.width, QImage.Format.Format_Grayscale8)
+        self._rgbx_image = QImage(self._rgbx, self.width, self.height, self.width * 4,
+                                  QImage.Format.Format_RGBX8888)
+
+    def view(self, frame: np.ndarray) -> np.ndarray:
+        """
+        :param frame: Frame of the camera, in the shape of the frame pool
+        :return: View of the frame cropped and flipped vertically, without copy
+        """
+        # The memory of the frame is frame_height lines of frame_width pixels, the first line is at the bottom
+        lines = frame.reshape(self.frame_height, self.frame_width)
+        return lines[self.height - 1::-1, self.border:]
+
+    #region Levels
+
+    @property
+    def min_value(self) -> int:
+        return self._min_value
+
+    @property
+    def max_value(self) -> int:
+        return self._max_value
+
+    def set_levels(self, min_value: int, max_value: int):
+        """
+        :param min_value: The levels lower or equal are black (first colour of the colormap)
+        :param max_value: The levels upper or equal are white (last colour of the colormap)
+        """
+        min_value, max_value = int(min_value), int(max_value)
+        if max_value <= min_value:
+            max_value = min_value + 1
+        if (min_value, max_value) != (self._min_value, self._max_value):
+            self._min_value, self._max_value = min_value, max_value
+            self._lut_valid = False
+
+    @property
+    def gamma(self) -> float:
+        return self._gamma
+
+    @gamma.setter
+    def gamma(self, value: float):
+        """
+        :param value: Exponent applied on the window, < 1 to show the low levels, > 1 to show the high levels
+        """
+        if value <= 0:
+            raise ValueError(f"Gamma must be positive: {value}")
+        if value != self._gamma:
+            self._gamma = value
+            self._lut_valid = False
+
+    @property
+    def colormap(self) -> str:
+        return self._colormap
+
+    @colormap.setter
+    def colormap(self, name: str):
+        """
+        :param name: GRAY or a colormap of pyqtgraph, ex: "viridis"
+        """
+        if name != self._colormap:
+            self._colormap = name
+            self._lut_valid = False
+
+    def lut(self) -> np.ndarray:
+        """
+        :return: Lookup table from the 16 bits levels to the 8 bits gray levels displayed
+        """
+        if not self._lut_valid:
+            self._build_lut()
+        return self._gray_lut
+
+    def _build_lut(self):
+        levels = np.arange(65536, dtype=np.float64)
+        window = np.clip((levels - self._min_value) / (self._max_value - self._min_value), 0, 1)
+        if self._gamma != 1:
+            window **= self._gamma
+        self._gray_lut[:] = np.round(window * 255)
+
+        if self._colormap != self.GRAY:
+            colors = pg.colormap.get(self._colormap).getLookupTable(0, 1, 256, alpha=False).astype(np.uint32)
+            # Bytes R, G, B, X of the RGBX8888 format in the memory of an uint32 (little endian)
+            packed = colors[:, 0] | colors[:, 1] << 8 | colors[:, 2] << 16 | np.uint32(0xFF) << 24
+            np.take(packed, self._gray_lut, out=self._color_lut)
+        self._lut_valid = True
+
+    def map_levels(self, frame: np.ndarray, out: np.ndarray):
+        """
+        Put a 16 bits frame into 8 bits gray levels, cropped and flipped
+        :param out: 8 bits buffer of the cropped shape
+        """
+        np.take(self.lut(), self.view(frame), out=out, mode='clip')
+
+    #endregion
+
+    def render(self, frame: np.ndarray, size: QSize, overlay: Optional[np.ndarray] = None) -> QPixmap:
+        """
+        :param frame: 16 bits frame of the camera, not modified
+        :param size: Size of the label where the picture is displayed
+        :param overlay: Static picture displayed in the blue channel over the gray picture, None to not display it
+        :return: Picture scaled to the size, keeping the ratio
+        """
+        if overlay is not None:
+            self.map_levels(frame, self._rgbx[..., 0])
+            self._rgbx[..., 1] = self._rgbx[..., 0]
+            np.right_shift(self.view(overlay), 8, out=self._rgbx[..., 2], casting='unsafe')
+            image = self._rgbx_image
+        elif self._colormap != self.GRAY:
+            self.lut()
+            # One pass for the 4 bytes of each pixel
+            np.take(self._color_lut, self.view(frame), out=self._rgbx.view(np.uint32)[..., 0], mode='clip')
+            image = self._rgbx_image
+        else:
+            self.map_levels(frame, self._gray)
+            image = self._gray_image
+
+        scaled = image.scaled(size, Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation)
+        return QPixmap.fromImage(scaled)
+
+
+if __name__ == '__main__':
+    # Benchmark: time from the frame of the camera to the pixmap displayed
+    import sys
+    from PyQt6.QtWidgets import QApplication
+
+    app = QApplication(sys.argv)
+    rng = np.random.default_rng(0)
+    frames = [rng.integers(0, 2**14, size=(640, 512), dtype=np.uint16) * 4 for _ in range(4)]
+    overlay = frames[0].copy()
+    size = QSize(800, 640)
+    repeat = 100
+
+    def legacy_render(frame, max_value, overlay_image=None):
+        # Old implementation of CameraPictureWidget.apply_treatment_picture + load_image
+        frame = frame.copy()
+        frame[frame > max_value] = 65535
+        if overlay_image is not None:
+            frame = np.stack([frame, frame, overlay_image, frame], axis=-1)
+        else:
+            frame = np.stack([frame, frame, frame, frame], axis=-1).astype(np.uint16)
+        image = QImage(frame, 640, 512, 640 * 8, QImage.Format.Format_RGBX64).mirrored(False, True)
+        pixmap = QPixmap.fromImage(image).copy(2, 2, 638, 510)
+        return pixmap.scaled(size, Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation)
+
+    renderer = DisplayRenderer()
+    renderer.set_levels(0, 40000)
+    cases = (("gray", None, DisplayRenderer.GRAY), ("overlay", overlay, DisplayRenderer.GRAY), ("viridis", None, "viridis"))
+    for name, overlay_image, colormap in cases:
+        renderer.colormap = colormap
+        for label, render in (("legacy", lambda f: legacy_render(f, 40000, overlay_image)),
+                              ("renderer", lambda f: renderer.render(f, size, overlay_image))):
+            if label == "legacy" and colormap != DisplayRenderer.GRAY:
+                continue
+            render(frames[0])
+            start = time.perf_counter()
+            for i in range(repeat):
+                render(frames[i % len(frames)])
+            print(f"{name:>8} {label:>9}: {(time.perf_counter() - start) / repeat * 1000:.2f} ms")
+
+    start = time.perf_counter()
+    for gamma in np.linspace(0.5, 2, repeat):
+        renderer.gamma = gamma
+        renderer.lut()
+    print(f"Rebuild of the lookup table: {(time.perf_counter() - start) / repeat * 1000:.2f} ms")
@@ -0,0 +1,125 @@
+import time
+from typing import Optional
+
+import numpy as np
+
+
+class FrameAverager:
+    """
+    Running average of the last N frames of the camera.
+    The frames are stored in a preallocated ring buffer and their sum is kept in an accumulator:
+    a new frame is added to the sum and the oldest one is subtracted, so the cost of a frame doesn't depend on N.
+    """
+    # Max value of the frame average spinbox of the camera settings
+    MAX_FRAME_AVERAGE = 50
+
+    def __init__(self, max_frame_average: int = 10, frame_shape: tuple = (640, 512),
+                 capacity: int = MAX_FRAME_AVERAGE):
+        self.frame_shape = frame_shape
+        self.capacity = capacity
+
+        # Ring buffer of the frames in the average, _start is the index of the oldest frame
+        self._frames = np.zeros((capacity, *frame_shape), dtype=np.uint16)
+        self._start = 0
+        self._count = 0
+
+        # 50 frames of 16 bits can't overflow an uint32
+        self._accumulator = np.zeros(frame_shape, dtype=np.uint32)
+        # Output buffer of the average, reused at each frame
+        self._average = np.zeros(frame_shape, dtype=np.uint16)
+
+        self._max_frame_average = 1
+        self.max_frame_average = max_frame_average
+
+    @property
+    def count(self) -> int:
+        """
+        :return: Number of frames in the average
+        """
+        return self._count
+
+    @property
+    def max_frame_average(self) -> int:
+        return self._max_frame_average
+
+    @max_frame_average.setter
+    def max_frame_average(self, value: int):
+        """
+        :param value: Number of frames to average, between 1 and the capacity of the ring buffer
+        """
+        self._max_frame_average = min(max(int(value), 1), self.capacity)
+        # Remove the oldest frames if the value is decreased
+        while self._count > self._max_frame_average:
+            self._evict_oldest()
+
+    def reset(self):
+        """
+        Forget all frames stored, the next frame starts a new average
+        """
+        self._start = 0
+        self._count = 0
+        self._accumulator.fill(0)
+
+    def add(self, frame: np.ndarray) -> np.ndarray:
+        """
+        Add a new frame to the average
+        :param frame: New picture take by the camera
+        :return: The average of the frames stored. The array is reused at the next call, copy it to keep it
+        """
+        if self._count == self._max_frame_average:
+            self._evict_oldest()
+
+        index = (self._start + self._count) % self.capacity
+        self._frames[index] = frame
+        np.add(self._accumulator, self._frames[index], out=self._accumulator)
+        self._count += 1
+
+        return self._compute_average()
+
+    def average(self) -> Optional[np.ndarray]:
+        """
+        :return: A copy of the actual average, None if no frame is stored
+        """
+        if self._count == 0:
+            return None
+        return self._compute_average().copy()
+
+    def _evict_oldest(self):
+        np.subtract(self._accumulator, self._frames[self._start], out=self._accumulator)
+        self._start = (self._start + 1) % self.capacity
+        self._count -= 1
+
+    def _compute_average(self) -> np.ndarray:
+        # Integer division gives the same result as np.mean(...).astype(np.uint16) on positive values
+        np.floor_divide(self._accumulator, self._count, out=self._average, casting='unsafe')
+        return self._average
+
+
+if __name__ == '__main__':
+    # Benchmark: cost of a new frame depending on the number of frames averaged
+    rng = np.random.default_rng(0)
+    frames = rng.integers(0, 2**14, size=(8, 640, 512), dtype=np.uint16) * 4
+    repeat = 100
+
+    def legacy_average(stack, frame, max_frame_average):
+        # Old implementation of CameraPictureWidget.frame_average_calculation
+        stack = np.concatenate((stack[len(stack) - max_frame_average + 1:], np.expand_dims(frame, axis=0)), axis=0)
+        return stack, np.mean(stack, axis=0).astype(np.uint16)
+
+    print(f"{'N':>4} {'ring buffer (ms)':>18} {'concatenate + mean (ms)':>25}")
+    for n in (1, 2, 5, 10, 20, 30, 40, 50):
+        averager = FrameAverager(n)
+        for i in range(n):
+            averager.add(frames[i % len(frames)])
+        start = time.perf_counter()
+        for i in range(repeat):
+            averager.add(frames[i % len(frames)])
+        ring_time = (time.perf_counter() - start) / repeat * 1000
+
+        stack = np.repeat(np.expand_dims(frames[0], axis=0), n, axis=0)
+        start = time.perf_counter()
+        for i in range(repeat // 10):
+            stack, _ = legacy_average(stack, frames[i % len(frames)], n)
+        legacy_time = (time.perf_counter() - start) / (repeat // 10) * 1000
+
+        print(f"{n:>4} {ring_time:>18.3f} {legacy_time:>25.3f}")
@@ -0,0 +1,93 @@
+import threading
+import time
+
+import numpy as np
+from PyQt6.QtCore import QThread, pyqtSignal
+
+
+class HistogramEngine(QThread):
+    """
+    Compute the histogram of the frames of the camera out of the GUI thread.
+    At most `rate` histograms per second are computed, on a subsample of the frame (1 pixel every `step`
+    in each direction): the cost doesn't depend on the frame rate of the camera.
+    Only the counts of the bins are sent to the GUI.
+    """
+    histogram_changed = pyqtSignal(object, object)  # Level at the center of each bin, count of each bin
+
+    def __init__(self, rate: float = 5.0, step: int = 4, bins: int = 256, frame_shape: tuple = (640, 512)):
+        """
+        :param rate: Max number of histograms by second
+        :param step: Distance between two pixels of the subsample
+        :param bins: Number of bins on the 16 bits levels, a power of 2
+        """
+        super().__init__()
+        self.rate = rate
+        self.step = step
+        self.bins = bins
+        # 16 bits levels to bin index
+        self._shift = 16 - int(np.log2(bins))
+        self.levels = (np.arange(bins) << self._shift) + (1 << self._shift) / 2
+
+        subsample_shape = tuple(len(range(0, length, step)) for length in frame_shape)
+        self._subsample = np.zeros(subsample_shape, dtype=np.uint16)
+        self._last_submit = 0
+        # Set when a subsample waits to be computed, the GUI doesn't copy a new one until it's done
+        self._pending = threading.Event()
+
+    def submit(self, frame: np.ndarray):
+        """
+        Give the new frame of the camera, called at each frame by the GUI.
+        Only a subsample is copied and only if a histogram is due, the frame can be released after the call.
+        """
+        now = time.perf_counter()
+        if self._pending.is_set() or now - self._last_submit < 1 / self.rate:
+            return
+        subsample = frame[::self.step, ::self.step]
+        if subsample.shape != self._subsample.shape:
+            return
+
+        np.copyto(self._subsample, subsample)
+        self._last_submit = now
+        self._pending.set()
+
+    def compute(self, frame: np.ndarray) -> np.ndarray:
+        """
+        :param frame: 16 bits frame or subsample
+        :return: Count of each bin
+        """
+        return np.bincount((frame >> self._shift).ravel(), minlength=self.bins)
+
+    def run(self):
+        while not self.isInterruptionRequested():
+            # Timeout to check the interruption
+            if not self._pending.wait(0.5):
+                continue
+            counts = self.compute(self._subsample)
+            self._pending.clear()
+            self.histogram_changed.emit(self.levels, counts)
+
+    def stop(self):
+        self.requestInterruption()
+        self.wait()
+
+
+if __name__ == '__main__':
+    # Benchmark: cost of a histogram, full frame with pyqtgraph against the subsample
+    import pyqtgraph as pg
+
+    rng = np.random.default_rng(0)
+    frame = rng.integers(0, 2**14, size=(640, 512), dtype=np.uint16) * 4
+    engine = HistogramEngine()
+    repeat = 50
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        pg.ImageItem(np.stack([frame, frame])).getHistogram()
+    legacy_time = (time.perf_counter() - start) / repeat * 1000
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        engine.compute(frame[::engine.step, ::engine.step])
+    engine_time = (time.perf_counter() - start) / repeat * 1000
+
+    print(f"pyqtgraph full frame: {legacy_time:.2f} ms, subsample 1/{engine.step ** 2}: {engine_time:.3f} ms")
@@ -0,0 +1,246 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from Scripts.PictureTreatment.treatment_process_pool import TreatmentProcessPool, treatment_source
+from Scripts.utils import LoggingClass
+
+
+@dataclass
+class TreatmentTiming:
+    """
+    Wall time of the calls of an image treatment in seconds
+    """
+    calls: int = 0
+    total: float = 0
+    last: float = 0
+    max: float = 0
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.calls if self.calls else 0
+
+    def add(self, elapsed: float):
+        self.calls += 1
+        self.total += elapsed
+        self.last = elapsed
+        self.max = max(self.max, elapsed)
+
+
+class TreatmentPipeline(LoggingClass):
+    """
+    Apply the image treatments imported by the user to the frames, in order, on a pool of worker threads.
+    The GUI never waits for a treatment: a frame is only submitted if a worker is free,
+    and the GUI takes the last result when it displays a frame.
+    A treatment is skipped for the next frames if it raises, if its output doesn't have the shape and the dtype
+    of its input, or if it takes more than the frame budget.
+    In process mode, the treatments run in worker processes instead of the threads of the GUI process.
+    """
+
+    def __init__(self, budget: float = 0.1, max_workers: int = 2):
+        """
+        :param budget: Max time of a treatment on a frame in seconds
+        :param max_workers: Number of frames treated at the same time
+        """
+        LoggingClass.__init__(self)
+        self.budget = budget
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix="TreatmentPipeline")
+        self._lock = threading.Lock()
+
+        self._treatments: List[Tuple[str, Callable[[np.ndarray], np.ndarray]]] = []
+        # Incremented when the treatments change, to ignore the results of the old treatments
+        self._generation = 0
+        self._in_flight = 0
+        self._sequence = 0
+        self._result: Optional[np.ndarray] = None
+        self._result_sequence = -1
+        self._process_pool: Optional[TreatmentProcessPool] = None
+
+        self.skipped: Dict[str, str] = {}  # Name of the treatment skipped: reason
+        self.timings: Dict[str, TreatmentTiming] = {}
+
+    @property
+    def active(self) -> bool:
+        """
+        :return: True if there is at least one treatment to apply
+        """
+        return bool(self._treatments)
+
+    @property
+    def process_mode(self) -> bool:
+        return self._process_pool is not None
+
+    def set_process_mode(self, enabled: bool, timeout: float = 2.0):
+        """
+        :param enabled: True to run the treatments in worker processes, for the treatments which hold the GIL
+        :param timeout: Max time to treat a frame in a process in seconds, the processes are restarted after it
+        """
+        with self._lock:
+            if enabled == (self._process_pool is not None):
+                return
+            previous_pool = self._process_pool
+            self._process_pool = TreatmentProcessPool(self.max_workers, timeout) if enabled else None
+            self._generation += 1
+            self._result = None
+            self.skipped = {}
+        if previous_pool is not None:
+            previous_pool.close()
+
+    def set_treatments(self, treatments: List[Tuple[str, Callable[[np.ndarray], np.ndarray]]]):
+        """
+        :param treatments: (name, function) of the treatments in the order of application.
+        The treatments skipped are tried again.
+        """
+        with self._lock:
+            self._treatments = list(treatments)
+            self._generation += 1
+            self._result = None
+            self.skipped = {}
+            self.timings = {name: TreatmentTiming() for name, _ in self._treatments}
+
+    def submit(self, frame: np.ndarray) -> bool:
+        """
+        Treat a copy of the frame if a worker is free
+        :return: True if the frame is submitted
+        """
+        with self._lock:
+            if not self._treatments or self._in_flight >= self.max_workers:
+                return False
+            self._in_flight += 1
+            self._sequence += 1
+            job = (frame.copy(), list(self._treatments), self._sequence, self._generation, self._process_pool)
+        self._executor.submit(self._run, *job)
+        return True
+
+    def result(self) -> Optional[np.ndarray]:
+        """
+        :return: Last frame treated by all the treatments, None if no frame is treated yet
+        """
+        with self._lock:
+            return self._result
+
+    def _run(self, frame: np.ndarray, treatments: list, sequence: int, generation: int,
+             process_pool: Optional[TreatmentProcessPool]):
+        try:
+            treatments = [(name, treatment) for name, treatment in treatments if name not in self.skipped]
+            if process_pool is not None:
+                frame = self._apply_in_processes(process_pool, treatments, frame, generation)
+            else:
+                for name, treatment in treatments:
+                    frame = self._apply(name, treatment, frame, generation)
+        except Exception as e:
+            self.logger.error(f"Error in the treatment pipeline: {e}")
+            frame = None
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+                # The results can end in another order than the submission with several workers
+                if frame is not None and generation == self._generation and sequence > self._result_sequence:
+                    self._result = frame
+                    self._result_sequence = sequence
+
+    def _apply(self, name: str, treatment: Callable[[np.ndarray], np.ndarray], frame: np.ndarray,
+               generation: int) -> np.ndarray:
+        """
+        :param generation: Generation of the treatments when the frame was submitted
+        :return: Output of the treatment, or the frame not modified if the treatment failed
+        """
+        start = time.perf_counter()
+        try:
+            output = treatment(frame)
+        except Exception as e:
+            self._skip(name, f"error: {e}", generation)
+            return frame
+        elapsed = time.perf_counter() - start
+        self._record(name, elapsed, generation)
+
+        if not isinstance(output, np.ndarray) or output.shape != frame.shape or output.dtype != frame.dtype:
+            shape, dtype = getattr(output, "shape", None), getattr(output, "dtype", type(output).__name__)
+            self._skip(name, f"output {shape} {dtype} instead of {frame.shape} {frame.dtype}", generation)
+            return frame
+
+        if elapsed > self.budget:
+            # The output is kept, but the next frames won't wait for it
+            self._skip(name, f"{elapsed * 1000:.0f} ms, over the budget of {self.budget * 1000:.0f} ms", generation)
+        return output
+
+    def _apply_in_processes(self, process_pool: TreatmentProcessPool, treatments: list,
+                            frame: np.ndarray, generation: int) -> np.ndarray:
+        """
+        :param frame: Copy of the frame owned by the job, replaced by the output of the treatments
+        :param generation: Generation of the treatments when the frame was submitted
+        """
+        sources = []
+        for name, treatment in treatments:
+            source = treatment_source(treatment)
+            if source is None:
+                self._skip(name, "the function can't be loaded in a process", generation)
+                continue
+            sources.append((name, *source))
+        if not sources:
+            return frame
+
+        for name, elapsed, error in process_pool.run(frame, sources, out=frame):
+            self._record(name, elapsed, generation)
+            if error is not None:
+                self._skip(name, error, generation)
+            elif elapsed > self.budget:
+                self._skip(name, f"{elapsed * 1000:.0f} ms, over the budget of {self.budget * 1000:.0f} ms",
+                           generation)
+        return frame
+
+    def _record(self, name: str, elapsed: float, generation: int):
+        with self._lock:
+            # The frames of the old treatments don't count in the timings of the new ones
+            if generation == self._generation:
+                self.timings.setdefault(name, TreatmentTiming()).add(elapsed)
+
+    def _skip(self, name: str, reason: str, generation: int):
+        with self._lock:
+            # A frame of the old treatments doesn't skip a treatment enabled again,
+            # and several frames in progress can fail on the same treatment
+            if generation != self._generation or name in self.skipped:
+                return
+            self.skipped[name] = reason
+        self.logger.warning(f"Image treatment {name} skipped: {reason}")
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        if self._process_pool is not None:
+            self._process_pool.close()
+            self._process_pool = None
+
+
+if __name__ == '__main__':
+    # Benchmark: time spent in the GUI thread by frame, treatments applied inline against the pipeline
+    rng = np.random.default_rng(0)
+    frame = rng.integers(0, 2**14, size=(640, 512), dtype=np.uint16) * 4
+    treatments = [("invert", lambda array: 65535 - array),
+                  ("blur", lambda array: (array >> 1) + (np.roll(array, 1, axis=0) >> 1)),
+                  ("slow", lambda array: (time.sleep(0.02), array)[1])]
+    repeat = 50
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        treated = frame
+        for _, treatment in treatments:
+            treated = treatment(treated)
+    inline_time = (time.perf_counter() - start) / repeat * 1000
+
+    pipeline = TreatmentPipeline(budget=0.1)
+    pipeline.set_treatments(treatments)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        pipeline.submit(frame)
+        pipeline.result()
+        time.sleep(0.01)  # Frame period of the camera
+    pipeline_time = (time.perf_counter() - start) / repeat * 1000 - 10
+    pipeline.shutdown()
+
+    print(f"inline: {inline_time:.2f} ms by frame, pipeline: {pipeline_time:.3f} ms by frame")
+    print({name: f"{timing.mean * 1000:.2f} ms" for name, timing in pipeline.timings.items()})
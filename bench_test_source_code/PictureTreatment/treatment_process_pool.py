@@ -0,0 +1,283 @@
+import importlib.util
+import inspect
+import multiprocessing
+import multiprocessing.pool
+import queue
+import threading
+import time
+import types
+from multiprocessing.shared_memory import SharedMemory
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from Scripts.utils import LoggingClass
+
+# Start of the frame in a slot, after the index of the treatment running
+FRAME_OFFSET = 8
+
+# Memory of the worker processes, kept between the tasks
+_worker_slots: Dict[str, SharedMemory] = {}
+_worker_modules: Dict[str, types.ModuleType] = {}
+
+
+class TreatmentProcessError(Exception):
+    pass
+
+
+def treatment_source(treatment: Callable) -> Optional[Tuple[str, str]]:
+    """
+    :param treatment: Function of a treatment module imported by the user
+    :return: (path of the module, name of the function) to load it in a worker process,
+    None if the function can't be loaded by name (ex: lambda, nested function)
+    """
+    name = getattr(treatment, "__name__", "")
+    if not isinstance(treatment, types.FunctionType) or not name.isidentifier() or treatment.__qualname__ != name:
+        return None
+    path = inspect.getsourcefile(treatment)
+    if path is None:
+        return None
+    return path, name
+
+
+def _attach_slot(slot_name: str) -> SharedMemory:
+    memory = _worker_slots.get(slot_name)
+    if memory is None:
+        # The slot is created and destroyed by the GUI process, the workers only attach to it
+        memory = SharedMemory(name=slot_name)
+        _worker_slots[slot_name] = memory
+    return memory
+
+
+def _load_treatment(path: str, function_name: str) -> Callable:
+    module = _worker_modules.get(path)
+    if module is None:
+        spec = importlib.util.spec_from_file_location(inspect.getmodulename(path), path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        _worker_modules[path] = module
+    return getattr(module, function_name)
+
+
+def _treat_slot(slot_name: str, shape: tuple, dtype: str, treatments: List[Tuple[str, str, str]]) -> list:
+    """
+    Run in a worker process: apply the treatments on the frame of the slot, the output replaces the frame
+    :param treatments: (name, module path, function name) in the order of application
+    :return: (name, elapsed time in seconds, error or None) of each treatment
+    """
+    memory = _attach_slot(slot_name)
+    progress = np.ndarray((1,), dtype=np.int64, buffer=memory.buf)
+    frame = np.ndarray(shape, dtype=dtype, buffer=memory.buf, offset=FRAME_OFFSET)
+
+    reports = []
+    for index, (name, path, function_name) in enumerate(treatments):
+        # Read by the GUI process to know which treatment timed out or crashed
+        progress[0] = index
+        start = time.perf_counter()
+        try:
+            output = _load_treatment(path, function_name)(frame)
+        except Exception as e:
+            reports.append((name, time.perf_counter() - start, f"error: {e}"))
+            continue
+        elapsed = time.perf_counter() - start
+
+        if not isinstance(output, np.ndarray) or output.shape != frame.shape or output.dtype != frame.dtype:
+            shape_out, dtype_out = getattr(output, "shape", None), getattr(output, "dtype", type(output).__name__)
+            reports.append((name, elapsed, f"output {shape_out} {dtype_out} instead of {frame.shape} {frame.dtype}"))
+            continue
+        if output is not frame:
+            np.copyto(frame, output)
+        reports.append((name, elapsed, None))
+
+    progress[0] = -1
+    return reports
+
+
+class TreatmentProcessPool(LoggingClass):
+    """
+    Apply image treatments in worker processes: a pure Python treatment doesn't hold the GIL of the GUI,
+    and the treatments of several frames run on several cores.
+    Each worker owns a slot of shared memory: the frame is copied once into the slot, treated in place by the
+    worker and read back from the slot, without pickling the pixels.
+    A worker which exceeds the timeout or crashes is replaced, and the treatment running at that moment is reported.
+    """
+
+    def __init__(self, processes: int = 2, timeout: float = 2.0,
+                 frame_shape: tuple = (640, 512), dtype: type = np.uint16):
+        """
+        :param processes: Number of worker processes, and of frames treated at the same time
+        :param timeout: Max time to treat a frame in seconds, the pool is restarted after it
+        """
+        LoggingClass.__init__(self)
+        self.processes = processes
+        self.timeout = timeout
+        self.frame_shape = frame_shape
+        self.dtype = np.dtype(dtype)
+        self.restarts = 0
+
+        frame_size = int(np.prod(frame_shape)) * self.dtype.itemsize
+        self._slots = [SharedMemory(create=True, size=FRAME_OFFSET + frame_size) for _ in range(processes)]
+        self._free_slots: queue.Queue = queue.Queue()
+        for index in range(processes):
+            self._free_slots.put(index)
+
+        # Spawn on all platforms: a fork of the GUI process would copy the Qt threads state
+        self._context = multiprocessing.get_context("spawn")
+        self._pool_lock = threading.Lock()
+        self._pool = self._context.Pool(processes)
+        self._pool_generation = 0
+        # Set by close(): the frames submitted after fail, the frames in progress stop waiting for their worker
+        self._closed = threading.Event()
+
+    def _slot_arrays(self, index: int) -> Tuple[np.ndarray, np.ndarray]:
+        buffer = self._slots[index].buf
+        progress = np.ndarray((1,), dtype=np.int64, buffer=buffer)
+        frame = np.ndarray(self.frame_shape, dtype=self.dtype, buffer=buffer, offset=FRAME_OFFSET)
+        return progress, frame
+
+    def run(self, frame: np.ndarray, treatments: List[Tuple[str, str, str]], out: np.ndarray) -> list:
+        """
+        Treat a frame, blocking until the end of the treatments
+        :param frame: Frame of the camera, not modified
+        :param treatments: (name, module path, function name) in the order of application
+        :param out: Array of the shape of the frame where the treated frame is written
+        :return: (name, elapsed time in seconds, error or None) of each treatment run
+        """
+        if frame.shape != self.frame_shape or frame.dtype != self.dtype:
+            raise TreatmentProcessError(f"Frame {frame.shape} {frame.dtype} instead of {self.frame_shape} {self.dtype}")
+
+        if self._closed.is_set():
+            raise TreatmentProcessError("Treatment process pool closed")
+        index = self._free_slots.get()
+        try:
+            if self._closed.is_set():
+                raise TreatmentProcessError("Treatment process pool closed")
+            progress, slot_frame = self._slot_arrays(index)
+            progress[0] = -1
+            np.copyto(slot_frame, frame)
+
+            with self._pool_lock:
+                pool, generation = self._pool, self._pool_generation
+            task = pool.apply_async(_treat_slot, (self._slots[index].name, self.frame_shape, self.dtype.str,
+                                                  treatments))
+            try:
+                reports = self._wait_task(task)
+            except multiprocessing.TimeoutError:
+                running = int(progress[0])
+                self._restart(generation)
+                if 0 <= running < len(treatments):
+                    name = treatments[running][0]
+                    return [(name, self.timeout, f"timeout or crash of the process after {self.timeout} s")]
+                raise TreatmentProcessError("Worker process restarted during the treatment")
+
+            np.copyto(out, slot_frame)
+            return reports
+        finally:
+            self._free_slots.put(index)
+
+    def _wait_task(self, task: multiprocessing.pool.AsyncResult) -> list:
+        """
+        Wait for the result of a worker by short steps, to give back the slot as soon as the pool is closed
+        """
+        deadline = time.perf_counter() + self.timeout
+        while not task.ready():
+            if self._closed.is_set():
+                raise TreatmentProcessError("Treatment process pool closed during the treatment")
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                raise multiprocessing.TimeoutError
+            task.wait(min(remaining, 0.05))
+        return task.get()
+
+    def _restart(self, generation: int):
+        """
+        Kill the workers, the other frames in progress are lost
+        :param generation: Generation of the pool which timed out, it's only restarted once
+        """
+        with self._pool_lock:
+            if generation != self._pool_generation:
+                return
+            self._pool.terminate()
+            self._pool = self._context.Pool(self.processes)
+            self._pool_generation += 1
+            self.restarts += 1
+        self.logger.warning("Treatment process pool restarted")
+
+    def close(self):
+        """
+        Stop the workers and free the shared memory, once the frames in progress gave back their slot
+        """
+        self._closed.set()
+        with self._pool_lock:
+            # A timeout reported after the close doesn't start a new pool
+            self._pool_generation += 1
+            self._pool.terminate()
+            self._pool.join()
+
+        # The threads in run() hold arrays on the memory of their slot until they give it back
+        try:
+            for _ in range(self.processes):
+                self._free_slots.get(timeout=self.timeout)
+        except queue.Empty:
+            self.logger.error("Slot of the treatment process pool still in use, its memory is not unmapped")
+            for memory in self._slots:
+                memory.unlink()
+            self._slots = []
+            return
+        for memory in self._slots:
+            memory.close()
+            memory.unlink()
+        self._slots = []
+
+
+if __name__ == '__main__':
+    # Benchmark: a pure Python treatment run on several frames by the threads of the GUI process and by the processes
+    import os
+    import tempfile
+    from concurrent.futures import ThreadPoolExecutor
+
+    source = (
+        "def python_loop(array_picture):\n"
+        "    total = 0\n"
+        "    for i in range(3_000_000):\n"
+        "        total += i\n"
+        "    return array_picture\n"
+        "\n"
+        "def invert(array_picture):\n"
+        "    return 65535 - array_picture\n"
+    )
+    with tempfile.NamedTemporaryFile("w", suffix=".py", delete=False) as module_file:
+        module_file.write(source)
+    rng = np.random.default_rng(0)
+    frame = rng.integers(0, 2**14, size=(640, 512), dtype=np.uint16) * 4
+    frames = 8
+
+    def gui_ticks(stop: threading.Event) -> float:
+        # A 5 ms timer of the GUI thread: max lateness while the treatments run
+        worst = 0
+        while not stop.is_set():
+            start = time.perf_counter()
+            time.sleep(0.005)
+            worst = max(worst, time.perf_counter() - start - 0.005)
+        return worst
+
+    for name in ("invert", "python_loop"):
+        treatment = _load_treatment(module_file.name, name)
+        treatments = [(name, module_file.name, name)]
+        pool = TreatmentProcessPool(processes=2)
+        outputs = [np.empty_like(frame) for _ in range(2)]
+        pool.run(frame, treatments, outputs[0])  # Start of the workers
+
+        for label, run in (("threads", lambda i: treatment(frame.copy())),
+                           ("processes", lambda i: pool.run(frame, treatments, outputs[i % 2]))):
+            stop = threading.Event()
+            start = time.perf_counter()
+            with ThreadPoolExecutor(3) as executor:
+                ticks = executor.submit(gui_ticks, stop)
+                list(executor.map(run, range(frames)))
+                stop.set()
+            elapsed = (time.perf_counter() - start) / frames * 1000
+            print(f"{name:>12} {label:>9}: {elapsed:.2f} ms by frame, "
+                  f"GUI timer late by {ticks.result() * 1000:.1f} ms at most")
+        pool.close()
+    os.remove(module_file.name)
@@ -0,0 +1,252 @@
+import time
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+import numpy as np
+from toolbox3.geometry.point import Point3D
+
+from Scripts.Camera.raptor_ninox640II import RaptorNinox640II
+from Scripts.PictureTreatment.display_renderer import DisplayRenderer
+from Scripts.Storage.mosaic import Mosaic
+from Scripts.Translation_stage.translation_stage_pi import TranslationPi
+from Scripts.utils import LoggingClass
+
+X_AXIS = 1
+
+
+class FlyScanError(Exception):
+    pass
+
+
+@dataclass
+class FlyScanReport:
+    rows: int = 0
+    frames: int = 0
+    velocity: float = 0  # Velocity of the axis X during the rows in mm/s
+    frame_period: float = 0  # Time between two frames placed by the capture loop in seconds
+    reshot: int = 0  # Number of tiles taken again with the stage stopped, on the gaps of the rows
+    total: float = 0
+
+    def __str__(self):
+        return (f"{self.rows} rows, {self.frames} frames at {self.velocity:.3f} mm/s "
+                f"(1 frame every {self.frame_period * 1000:.1f} ms), {self.reshot} tiles taken again "
+                f"in {self.total:.2f} s")
+
+
+class FlyScan(LoggingClass):
+    """
+    Map a grid without stopping the stage on each tile, for the short exposures.
+    Each row is crossed at a constant velocity on X while the camera captures continuously.
+    The position of each frame is interpolated at the middle of its exposure between the positions of X read
+    before and after it, then the frame is placed in the mosaic at this position.
+    The velocity gives a frame at least every `overlap` tile length and a motion blur lower than `max_blur` pixels.
+    The rows are crossed in alternate directions.
+    At the end of each row, the columns of the mosaic left empty are taken again with the stage stopped.
+    """
+
+    def __init__(self, stage: TranslationPi, camera: RaptorNinox640II, mosaic: Mosaic, renderer: DisplayRenderer,
+                 exposure: float, max_blur: float = 2.0, overlap: float = 0.5, max_velocity: float = 20.0,
+                 timeout_margin: float = 10.0):
+        """
+        :param mosaic: Mosaic of the grid, a tile of the mosaic is a tile of the grid
+        :param renderer: Crop and flip of the frames, like the display
+        :param exposure: Exposure time of the camera in seconds
+        :param max_blur: Max move of the stage during an exposure in pixels
+        :param overlap: Max move of the stage between two frames in tile length
+        :param max_velocity: Max velocity of the axis X in mm/s
+        :param timeout_margin: Time added to the predicted time of a row for its timeouts in seconds
+        """
+        LoggingClass.__init__(self)
+        self.stage = stage
+        self.camera = camera
+        self.mosaic = mosaic
+        self.renderer = renderer
+        self.exposure = exposure
+        self.max_blur = max_blur
+        self.overlap = overlap
+        self.max_velocity = max_velocity
+        self.timeout_margin = timeout_margin
+        self.frame_timeout = camera.frame_timeout(exposure)
+
+    def measure_frame_period(self, frames: int = 5) -> float:
+        """
+        Run the capture loop of the rows without placing the frames
+        :return: Time between two frames taken by the capture loop in seconds,
+        longer than the frame period of the camera when the loop is the slowest
+        """
+        sequence = None
+        start = None
+        for _ in range(frames + 1):
+            frame, sequence = self._next_frame(sequence)
+            try:
+                self.renderer.view(frame)
+                self._sample_position()
+            finally:
+                self.camera.release_frame(frame)
+            # The first frame only synchronizes the loop on the camera
+            if start is None:
+                start = time.perf_counter()
+        return (time.perf_counter() - start) / frames
+
+    def row_velocity(self, tile_length: float, frame_period: float) -> float:
+        """
+        :param tile_length: Length of the field of the camera on X in mm
+        :return: Velocity of the axis X during the rows in mm/s
+        """
+        pixel_length = tile_length / self.mosaic.tile_shape[1]
+        limits = [self.overlap * tile_length / frame_period, self.max_velocity]
+        # Without exposure time, no motion blur
+        if self.exposure > 0:
+            limits.append(self.max_blur * pixel_length / self.exposure)
+        return min(limits)
+
+    def run(self, origin: Point3D, step_x: float, step_y: float) -> FlyScanReport:
+        """
+        Map the grid of the mosaic, the tile (0, 0) is at the origin
+        :param step_x: Move of the stage between two columns in mm, negative to go to the lower positions
+        :param step_y: Move of the stage between two rows in mm, negative to go to the lower positions
+        """
+        if not self.camera.live:
+            raise FlyScanError("The fly scan needs the live acquisition of the camera")
+
+        start = time.perf_counter()
+        report = FlyScanReport()
+        report.frame_period = self.measure_frame_period()
+        report.velocity = self.row_velocity(abs(step_x), report.frame_period)
+        velocity, acceleration = self.stage.get_motion_parameters(X_AXIS)
+        # Distance to reach the velocity of the row before the first tile
+        run_up = report.velocity ** 2 / (2 * acceleration) + abs(step_x) / 2
+        self.logger.info(f"Fly scan at {report.velocity:.3f} mm/s, frame period {report.frame_period * 1000:.1f} ms")
+
+        try:
+            for row in range(self.mosaic.rows):
+                # Columns of the edges of the row, in the direction of the row
+                edges = (-0.5, self.mosaic.cols - 0.5) if row % 2 == 0 else (self.mosaic.cols - 0.5, -0.5)
+                direction = np.sign(step_x) * np.sign(edges[1] - edges[0])
+                x_start = origin.x + edges[0] * step_x - direction * run_up
+                x_end = origin.x + edges[1] * step_x + direction * run_up
+                y = origin.y + row * step_y
+
+                self.stage.set_velocity(X_AXIS, velocity)
+                self.stage.move_absolute(Point3D(x_start, y, origin.z)).result()
+
+                # The blur limit can give a row of several minutes at the long exposures
+                timeout = abs(x_end - x_start) / report.velocity + report.velocity / acceleration + self.timeout_margin
+                self.stage.set_velocity(X_AXIS, report.velocity)
+                motion = self.stage.move_absolute(Point3D(x_end, y, origin.z), Point3D(x_start, y, origin.z), timeout)
+                frames, covered = self._capture_row(row, origin.x, step_x, origin.x + edges[1] * step_x, direction,
+                                                    timeout)
+                motion.result()
+                report.frames += frames
+                self.stage.set_velocity(X_AXIS, velocity)
+                report.reshot += self._fill_gaps(row, covered, origin, step_x, y)
+                report.rows += 1
+        finally:
+            self.stage.set_velocity(X_AXIS, velocity)
+
+        report.total = time.perf_counter() - start
+        self.logger.info(f"Fly scan: {report}")
+        return report
+
+    def _sample_position(self) -> tuple:
+        """
+        :return: (time, position of X), the time is the middle of the query
+        """
+        before = time.perf_counter()
+        position = self.stage.get_axis_position(X_AXIS)
+        return (before + time.perf_counter()) / 2, position
+
+    def _next_frame(self, sequence: Optional[int]) -> Tuple[np.ndarray, int]:
+        """
+        :param sequence: Sequence number of the last frame taken, None to wait for the next completed frame
+        :return: Frame of the pool newer than sequence, its sequence number
+        """
+        if not self.camera.wait_new_frame(sequence, self.frame_timeout):
+            raise FlyScanError(f"No frame from the camera after {self.frame_timeout:.1f} s in live mode")
+        frame = self.camera.capture_frame(self.frame_timeout)
+        return frame, self.camera.frame_sequence
+
+    def _capture_row(self, row: int, origin_x: float, step_x: float, last_edge: float, direction: float,
+                     timeout: float) -> Tuple[int, np.ndarray]:
+        """
+        Capture the frames until the field of the camera passes the last edge of the row
+        :param timeout: Max time of the row in seconds
+        :return: Number of frames placed, columns of the mosaic covered by the frames
+        """
+        tile_height, tile_width = self.mosaic.tile_shape
+        covered = np.zeros(self.mosaic.shape[1], dtype=bool)
+        samples: List[tuple] = [self._sample_position()]
+        frames = 0
+        sequence = None
+        deadline = time.perf_counter() + timeout
+        while direction * (samples[-1][1] - last_edge) < 0:
+            if time.perf_counter() > deadline:
+                raise FlyScanError(f"The row of the fly scan is not finished after {timeout:.1f} s")
+            # Every frame completed since the last one is taken, even when the loop is late on the camera
+            frame, sequence = self._next_frame(sequence)
+            # The frame taken is the last one completed, less than a frame period ago: its exposure is just before
+            frame_time = time.perf_counter() - self.exposure / 2
+            try:
+                samples.append(self._sample_position())
+                (time_before, x_before), (time_after, x_after) = samples[-2], samples[-1]
+                x = np.interp(frame_time, (time_before, time_after), (x_before, x_after))
+                left = int(round((x - origin_x) / step_x * tile_width))
+                self.mosaic.place_at(row * tile_height, left, self.renderer.view(frame))
+                covered[max(left, 0):max(left + tile_width, 0)] = True
+                frames += 1
+            finally:
+                self.camera.release_frame(frame)
+        return frames, covered
+
+    def _fill_gaps(self, row: int, covered: np.ndarray, origin: Point3D, step_x: float, y: float) -> int:
+        """
+        Take again with the stage stopped the tiles of the row with columns not covered by the frames
+        :param covered: Columns of the mosaic covered by the frames of the row
+        :return: Number of tiles taken again
+        """
+        tile_width = self.mosaic.tile_shape[1]
+        cols = np.unique(np.flatnonzero(~covered) // tile_width)
+        if len(cols):
+            self.logger.warning(f"Row {row} of the fly scan: {np.count_nonzero(~covered)} columns not covered, "
+                                f"tiles {cols.tolist()} taken again")
+        for col in cols:
+            self.stage.move_absolute(Point3D(origin.x + col * step_x, y, origin.z)).result()
+            frame = self.camera.capture_fresh_frame(self.frame_timeout)
+            try:
+                self.mosaic.place(row, int(col), self.renderer.view(frame))
+            finally:
+                self.camera.release_frame(frame)
+        return len(cols)
+
+
+if __name__ == '__main__':
+    # Benchmark: mapping at 50x zoom with the simulators, stop and go against the fly scan
+    from Scripts.Camera.xclib_simulator import XclibSimulator
+    from Scripts.Scan.scan_executor import ScanExecutor
+    from Scripts.Scan.scan_planner import ScanTile, grid_tiles, serpentine
+    from Scripts.Translation_stage.translation_stage_interface import TranslationStageInterface
+    from Scripts.Translation_stage.translation_stage_simulator import TranslationStageSimulator
+
+    camera = RaptorNinox640II(xclib=XclibSimulator(seed=0, frame_period=0.01))
+    camera.start_live()
+    simulator = TranslationStageSimulator()
+    # Thread-safe: the motion futures query the stage from their thread
+    stage = TranslationStageInterface(port=simulator.start(), baudrate=115200)
+    renderer = DisplayRenderer()
+    origin, step_x, step_y, rows, cols = Point3D(10, 10, 0), -0.2, -0.17, 3, 30
+    tile_shape = (renderer.height, renderer.width)
+
+    mosaic = Mosaic(rows, cols, tile_shape)
+
+    def place(tile: ScanTile, frame: np.ndarray):
+        mosaic.place(tile.row, tile.col, renderer.view(frame))
+
+    stop_and_go = ScanExecutor(stage, camera, place).run(serpentine(grid_tiles(origin, step_x, step_y, rows, cols)))
+    print(f"stop and go: {stop_and_go}")
+
+    fly_mosaic = Mosaic(rows, cols, tile_shape)
+    fly_scan = FlyScan(stage, camera, fly_mosaic, renderer, exposure=0.00005)
+    print(f"fly scan: {fly_scan.run(origin, step_x, step_y)}")
+    covered = np.count_nonzero(fly_mosaic.array) / fly_mosaic.array.size
+    print(f"Part of the mosaic covered by the fly scan: {covered:.3f}")
+    simulator.close()
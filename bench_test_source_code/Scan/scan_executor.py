@@ -0,0 +1,176 @@
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Deque, List, Optional
+
+import numpy as np
+
+from Scripts.Camera.raptor_ninox640II import RaptorNinox640II
+from Scripts.Scan.scan_planner import ScanTile
+from Scripts.Translation_stage.translation_stage_pi import TranslationPi
+from Scripts.utils import LoggingClass
+
+
+class ScanExecutorError(Exception):
+    pass
+
+
+@dataclass
+class TileTiming:
+    """
+    Time of each phase of a tile in seconds
+    """
+    tile: ScanTile
+    move: float = 0  # From the move command to the stop of the axis
+    capture: float = 0  # Exposure and reading of the frame
+    process: float = 0  # Processing of the frame, in the background
+
+
+@dataclass
+class ScanReport:
+    tiles: List[TileTiming] = field(default_factory=list)
+    total: float = 0
+    backlog: float = 0  # Time the scan waited for the processing of the previous tiles
+
+    def phase(self, name: str) -> float:
+        """
+        :param name: "move", "capture" or "process"
+        :return: Total time of the phase for all the tiles in seconds
+        """
+        return sum(getattr(timing, name) for timing in self.tiles)
+
+    def __str__(self):
+        return (f"{len(self.tiles)} tiles in {self.total:.2f} s: move {self.phase('move'):.2f} s, "
+                f"capture {self.phase('capture'):.2f} s, process {self.phase('process'):.2f} s (in the background), "
+                f"wait for the processing {self.backlog:.2f} s")
+
+
+class ScanExecutor(LoggingClass):
+    """
+    Take the tiles of a scan with the stage in motion as much as possible.
+    As soon as the frame of a tile is read, the stage starts to move to the next tile,
+    and the frame is processed on a background thread during the move.
+    The time of a scan approaches the time of the moves plus the time of the exposures.
+    """
+
+    def __init__(self, stage: TranslationPi, camera: RaptorNinox640II,
+                 process: Callable[[ScanTile, np.ndarray], None], max_pending: int = 2,
+                 move_timeout: Optional[float] = None):
+        """
+        :param process: Called on the background thread with each tile and its frame.
+        The frame belongs to the frame pool of the camera, it's released after the call
+        :param max_pending: Max number of frames waiting for the processing, the scan waits beyond
+        :param move_timeout: Max time of a move in seconds, None for the predicted time of the move plus a margin
+        """
+        LoggingClass.__init__(self)
+        self.stage = stage
+        self.camera = camera
+        self.process = process
+        self.max_pending = max_pending
+        self.move_timeout = move_timeout
+        # The exposure register counts 25 ns
+        self.frame_timeout = camera.frame_timeout(camera.exposure / 40e6)
+
+    def run(self, tiles: List[ScanTile]) -> ScanReport:
+        """
+        Take all the tiles, in the order of the list
+        :return: Time of each phase
+        """
+        report = ScanReport()
+        pending: Deque[Future] = deque()
+        start = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="ScanProcess") as executor:
+            motion = self.stage.move_absolute(tiles[0].position, timeout=self.move_timeout) if tiles else None
+            move_start = time.perf_counter()
+
+            for index, tile in enumerate(tiles):
+                timing = TileTiming(tile)
+                report.tiles.append(timing)
+
+                motion.result()
+                capture_start = time.perf_counter()
+                timing.move = capture_start - move_start
+
+                # Bound the frames waiting for the processing, they hold buffers of the frame pool
+                while len(pending) >= self.max_pending:
+                    pending.popleft().result()
+                capture_end = time.perf_counter()
+                report.backlog += capture_end - capture_start
+
+                frame = self._expose()
+                move_start = time.perf_counter()
+                timing.capture = move_start - capture_end
+
+                # The exposure is done: move to the next tile during the processing of this one
+                if index + 1 < len(tiles):
+                    # The stage is stopped on this tile: the time of the move is predicted without asking the position
+                    motion = self.stage.move_absolute(tiles[index + 1].position, tile.position, self.move_timeout)
+                pending.append(executor.submit(self._process, timing, frame))
+
+            backlog_start = time.perf_counter()
+            for future in pending:
+                future.result()
+            report.backlog += time.perf_counter() - backlog_start
+
+        report.total = time.perf_counter() - start
+        self.logger.info(str(report))
+        return report
+
+    def _expose(self) -> np.ndarray:
+        """
+        :return: Frame of the pool exposed with the stage stopped
+        """
+        if self.camera.live:
+            # The frame in progress started its exposure during the move: wait for the one after
+            for _ in range(2):
+                if not self.camera.wait_new_frame(None, self.frame_timeout):
+                    raise ScanExecutorError(f"No frame from the camera after {self.frame_timeout:.1f} s in live mode")
+        return self.camera.capture_frame(self.frame_timeout)
+
+    def _process(self, timing: TileTiming, frame: np.ndarray):
+        start = time.perf_counter()
+        try:
+            self.process(timing.tile, frame)
+        finally:
+            self.camera.release_frame(frame)
+            timing.process = time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    # Benchmark: scan of a grid with the simulators, sequential tiles against the pipelined executor
+    from toolbox3.geometry.point import Point3D
+
+    from Scripts.Camera.xclib_simulator import XclibSimulator
+    from Scripts.Scan.scan_planner import grid_tiles
+    from Scripts.Translation_stage.translation_stage_interface import TranslationStageInterface
+    from Scripts.Translation_stage.translation_stage_simulator import TranslationStageSimulator
+
+    camera = RaptorNinox640II(xclib=XclibSimulator(seed=0, frame_period=0.03))
+    camera.start_live()
+    simulator = TranslationStageSimulator()
+    # Thread-safe: the motion futures query the stage from their thread
+    stage = TranslationStageInterface(port=simulator.start(), baudrate=115200)
+    tiles = grid_tiles(Point3D(10, 10, 0), -0.5, -0.4, 3, 4)
+
+    def process(tile: ScanTile, frame: np.ndarray):
+        # Processing and writing of a tile, ex: placing in the mosaic and saving
+        time.sleep(0.05)
+
+    def sequential_scan() -> float:
+        # Old _capture_xy_grid: move, wait, capture, process, one after another
+        start = time.perf_counter()
+        executor = ScanExecutor(stage, camera, process)
+        for tile in tiles:
+            stage.move_absolute(tile.position).result()
+            frame = executor._expose()
+            process(tile, frame)
+            camera.release_frame(frame)
+        return time.perf_counter() - start
+
+    stage.move_absolute(Point3D(0, 0, 0)).result()
+    print(f"sequential: {len(tiles)} tiles in {sequential_scan():.2f} s")
+    stage.move_absolute(Point3D(0, 0, 0)).result()
+    print(f"pipelined: {ScanExecutor(stage, camera, process).run(tiles)}")
+    simulator.close()
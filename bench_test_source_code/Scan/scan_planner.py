@@ -0,0 +1,136 @@
+import time
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+import numpy as np
+from toolbox3.geometry.point import Point3D
+
+from Scripts.Translation_stage.motion_profile import move_duration
+
+RASTER = "Raster"
+SERPENTINE = "Serpentine"
+NEAREST_NEIGHBOUR = "Nearest neighbour"
+ORDERS = (SERPENTINE, RASTER, NEAREST_NEIGHBOUR)
+
+
+@dataclass(frozen=True)
+class ScanTile:
+    """
+    Picture of a scan: its place in the mosaic and the position of the stage to take it
+    """
+    row: int
+    col: int
+    position: Point3D
+
+
+def grid_tiles(origin: Point3D, step_x: float, step_y: float, rows: int, cols: int) -> List[ScanTile]:
+    """
+    Tiles of a grid, row by row from the tile (0, 0) at the origin
+    :param step_x: Move of the stage between two columns in mm, negative to go to the lower positions
+    :param step_y: Move of the stage between two rows in mm, negative to go to the lower positions
+    """
+    return [ScanTile(row, col, Point3D(origin.x + col * step_x, origin.y + row * step_y, origin.z))
+            for row in range(rows) for col in range(cols)]
+
+
+def serpentine(tiles: List[ScanTile]) -> List[ScanTile]:
+    """
+    :return: Tiles row by row, one row in the order of the columns and the next one in the reverse order:
+    the stage doesn't go back to the first column at the end of each row
+    """
+    ordered = []
+    for index, row in enumerate(sorted({tile.row for tile in tiles})):
+        row_tiles = sorted((tile for tile in tiles if tile.row == row), key=lambda tile: tile.col)
+        ordered += row_tiles[::-1] if index % 2 else row_tiles
+    return ordered
+
+
+def _move_times(start: np.ndarray, targets: np.ndarray, velocity: float, acceleration: float) -> np.ndarray:
+    """
+    :param start: (x, y) position
+    :param targets: (n, 2) positions
+    :return: Time of the move to each target, the axis move at the same time: the slowest gives the time
+    """
+    distances = np.abs(targets - start)
+    ramps_distance = velocity ** 2 / acceleration
+    # Vectorized motion_profile.move_duration
+    times = np.where(distances >= ramps_distance, distances / velocity + velocity / acceleration,
+                     2 * np.sqrt(distances / acceleration))
+    return times.max(axis=1)
+
+
+def nearest_neighbour(tiles: List[ScanTile], start: Point3D, velocity: float, acceleration: float) -> List[ScanTile]:
+    """
+    :param start: Position of the stage before the scan
+    :return: Tiles in an order where the stage always goes to the closest tile in time not taken yet,
+    for a set of tiles which is not a full grid
+    """
+    positions = np.array([(tile.position.x, tile.position.y) for tile in tiles], dtype=np.float64)
+    remaining = np.ones(len(tiles), dtype=bool)
+    current = np.array((start.x, start.y), dtype=np.float64)
+    ordered = []
+    for _ in range(len(tiles)):
+        times = _move_times(current, positions, velocity, acceleration)
+        times[~remaining] = np.inf
+        index = int(np.argmin(times))
+        remaining[index] = False
+        current = positions[index]
+        ordered.append(tiles[index])
+    return ordered
+
+
+def order_tiles(tiles: List[ScanTile], order: str, start: Optional[Point3D] = None, velocity: float = 10.0,
+                acceleration: float = 100.0) -> List[ScanTile]:
+    """
+    :param order: RASTER, SERPENTINE or NEAREST_NEIGHBOUR
+    :param start: Position of the stage before the scan, the first tile by default
+    :param velocity: Velocity of the axis X and Y in mm/s, for NEAREST_NEIGHBOUR
+    :param acceleration: Acceleration of the axis X and Y in mm/s², for NEAREST_NEIGHBOUR
+    """
+    if order == RASTER:
+        return sorted(tiles, key=lambda tile: (tile.row, tile.col))
+    if order == SERPENTINE:
+        return serpentine(tiles)
+    if order == NEAREST_NEIGHBOUR:
+        if not tiles:
+            return []
+        return nearest_neighbour(tiles, start if start is not None else tiles[0].position, velocity, acceleration)
+    raise ValueError(f"Unknown scan order: {order}")
+
+
+def travel(tiles: List[ScanTile], start: Point3D, velocity: float, acceleration: float) -> Tuple[float, float]:
+    """
+    Estimation of the moves of a scan, with the trapezoidal profile of the axis
+    :param start: Position of the stage before the scan
+    :return: Distance on X plus distance on Y in mm, time of the moves in seconds
+    """
+    distance = 0
+    duration = 0
+    current = start
+    for tile in tiles:
+        delta_x = tile.position.x - current.x
+        delta_y = tile.position.y - current.y
+        distance += abs(delta_x) + abs(delta_y)
+        duration += max(move_duration(delta_x, velocity, acceleration),
+                        move_duration(delta_y, velocity, acceleration))
+        current = tile.position
+    return distance, duration
+
+
+if __name__ == '__main__':
+    # Benchmark: travel of the stage to map a chip at 50x zoom, depending on the order of the tiles
+    rng = np.random.default_rng(0)
+    velocity, acceleration = 10.0, 100.0
+    origin = Point3D(20, 20, 0)
+    grid = grid_tiles(origin, -0.2, -0.17, 40, 60)
+    # Irregular set: tiles of interest only, ex: around the defects
+    irregular = [tile for tile in grid if rng.random() < 0.1]
+
+    for name, tiles in (("grid 40x60", grid), ("10 % of the grid", irregular)):
+        for order in (RASTER, SERPENTINE, NEAREST_NEIGHBOUR):
+            start = time.perf_counter()
+            ordered = order_tiles(tiles, order, origin, velocity, acceleration)
+            planning = time.perf_counter() - start
+            distance, duration = travel(ordered, origin, velocity, acceleration)
+            print(f"{name:>16} {order:>17}: {distance:8.1f} mm, {duration:7.1f} s of moves "
+                  f"(planned in {planning * 1000:.0f} ms)")
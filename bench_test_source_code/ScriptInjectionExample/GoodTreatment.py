@@ -2,7 +2,8 @@ import numpy as np
 
 def treatment_black(array_picture: np.ndarray) -> np.ndarray:
     print("Make a treatment")
-    return np.zeros(640*512).astype(np.uint16)
+    # Same shape and dtype as the picture of the camera
+    return np.zeros_like(array_picture)
 
 def AND_treatment(array_picture: np.ndarray) -> np.ndarray:
     print("AND TREATMENT")
@@ -0,0 +1,225 @@
+import struct
+import time
+import zlib
+from typing import Optional, Tuple
+
+import numpy as np
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+def _png_chunk(chunk_type: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + chunk_type + data + struct.pack(">I", zlib.crc32(chunk_type + data))
+
+
+def write_png(array: np.ndarray, path: str, bits: int = 16, levels: Optional[Tuple[int, int]] = None,
+              chunk_rows: int = 64, compress_level: int = 1):
+    """
+    Write a 16 bits gray picture in a PNG, converted and compressed by chunks of rows:
+    the memory used doesn't depend on the size of the picture, which can be a memory-mapped file.
+    :param bits: 16 to keep the levels of the camera, 8 to reduce the file
+    :param levels: (min, max) levels mapped to 0 and 255 in 8 bits, the whole 16 bits range by default
+    :param compress_level: zlib level, the noise of the camera compresses badly: a high level is slow for little gain
+    """
+    if array.ndim != 2 or array.dtype != np.uint16:
+        raise ValueError(f"Picture must be a 2D uint16 array: {array.shape} {array.dtype}")
+    if bits not in (8, 16):
+        raise ValueError(f"PNG export in 8 or 16 bits, not {bits}")
+    min_level, max_level = levels if levels is not None else (0, 65535)
+    height, width = array.shape
+    compressor = zlib.compressobj(compress_level)
+
+    with open(path, "wb") as png_file:
+        png_file.write(PNG_SIGNATURE)
+        # Gray levels, no interlace
+        png_file.write(_png_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, bits, 0, 0, 0, 0)))
+
+        # Each row starts with its filter type, 0 (none)
+        rows = np.zeros((chunk_rows, 1 + width * bits // 8), dtype=np.uint8)
+        for start in range(0, height, chunk_rows):
+            chunk = array[start:start + chunk_rows]
+            count = chunk.shape[0]
+            if bits == 16:
+                # PNG is big endian
+                rows[:count, 1:] = chunk.astype(">u2").view(np.uint8)
+            else:
+                scaled = (chunk.astype(np.int32) - min_level) * 255 // max(max_level - min_level, 1)
+                np.clip(scaled, 0, 255, out=scaled)
+                rows[:count, 1:] = scaled
+            data = compressor.compress(rows[:count].tobytes())
+            if data:
+                png_file.write(_png_chunk(b"IDAT", data))
+
+        png_file.write(_png_chunk(b"IDAT", compressor.flush()))
+        png_file.write(_png_chunk(b"IEND", b""))
+
+
+class Mosaic:
+    """
+    Picture of a grid of tiles of the camera, allocated once at its final size.
+    Each tile is copied once at its place: the assembly is linear in the number of tiles,
+    and the memory used is the one of the mosaic.
+    With a path, the mosaic is a memory-mapped .npy file: the tiles are written in the file as they arrive,
+    and the scans larger than the memory of the computer only keep the pages in use in RAM.
+    The tile (0, 0) is at the top left corner.
+    """
+
+    def __init__(self, rows: int, cols: int, tile_shape: Tuple[int, int] = (510, 638), dtype: type = np.uint16,
+                 path: Optional[str] = None):
+        """
+        :param rows: Number of tiles on the vertical axis
+        :param cols: Number of tiles on the horizontal axis
+        :param tile_shape: (height, width) of a tile in pixels
+        :param path: .npy file of the mosaic, None to keep the mosaic in memory
+        """
+        if rows <= 0 or cols <= 0:
+            raise ValueError(f"Wrong size of the mosaic: {rows} rows, {cols} columns")
+        self.rows = rows
+        self.cols = cols
+        self.tile_shape = tuple(tile_shape)
+        self.path = path
+        shape = (rows * self.tile_shape[0], cols * self.tile_shape[1])
+        if path is None:
+            self.array = np.zeros(shape, dtype=dtype)
+        else:
+            # The file is created full of zeros without writing them
+            self.array = np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=shape)
+        self._placed = np.zeros((rows, cols), dtype=bool)
+
+    @property
+    def shape(self) -> tuple:
+        return self.array.shape
+
+    @property
+    def placed(self) -> int:
+        """
+        :return: Number of tiles already placed
+        """
+        return int(np.count_nonzero(self._placed))
+
+    @property
+    def complete(self) -> bool:
+        return bool(self._placed.all())
+
+    def tile_slices(self, row: int, col: int) -> Tuple[slice, slice]:
+        """
+        :return: Slices of the tile in the mosaic array
+        """
+        if not (0 <= row < self.rows and 0 <= col < self.cols):
+            raise ValueError(f"Tile ({row}, {col}) out of the mosaic of {self.rows}x{self.cols} tiles")
+        height, width = self.tile_shape
+        return slice(row * height, (row + 1) * height), slice(col * width, (col + 1) * width)
+
+    def place(self, row: int, col: int, tile: np.ndarray):
+        """
+        Copy a tile at its place, a tile already placed is replaced
+        :param tile: Picture of the tile shape, can be a view of a frame of the camera
+        """
+        if tile.shape != self.tile_shape:
+            raise ValueError(f"Wrong shape of the tile: {tile.shape}, expected {self.tile_shape}")
+        self.array[self.tile_slices(row, col)] = tile
+        self._placed[row, col] = True
+
+    def place_at(self, top: int, left: int, picture: np.ndarray):
+        """
+        Copy a picture at any position in pixels, ex: a frame taken with the stage in motion.
+        The part out of the mosaic is cut, the tiles are not counted as placed.
+        :param top: Line of the mosaic of the first line of the picture, can be negative
+        :param left: Column of the mosaic of the first column of the picture, can be negative
+        """
+        height, width = picture.shape
+        first_line, first_column = max(top, 0), max(left, 0)
+        last_line, last_column = min(top + height, self.array.shape[0]), min(left + width, self.array.shape[1])
+        if last_line <= first_line or last_column <= first_column:
+            return
+        self.array[first_line:last_line, first_column:last_column] = \
+            picture[first_line - top:last_line - top, first_column - left:last_column - left]
+
+    def export_png(self, path: str, bits: int = 16, levels: Optional[Tuple[int, int]] = None):
+        """
+        Write the mosaic in a PNG by chunks of rows, see write_png
+        """
+        self.flush()
+        write_png(self.array, path, bits, levels)
+
+    def flush(self):
+        """
+        Write the tiles on the disk, for a memory-mapped mosaic
+        """
+        if isinstance(self.array, np.memmap):
+            self.array.flush()
+
+    def close(self):
+        """
+        Release the memory-mapped file, the mosaic can't be used after
+        """
+        self.flush()
+        self.array = None
+
+
+if __name__ == '__main__':
+    # Benchmark: assembly and export of a grid, legacy code against the mosaic in memory and memory-mapped
+    import os
+    import tempfile
+    import tracemalloc
+    from PIL import Image
+
+    rng = np.random.default_rng(0)
+    tile = rng.integers(0, 2**14, size=(510, 638), dtype=np.uint16) * 4
+
+    def legacy_concatenate(tiles, cols, rows):
+        # Old implementation of GrillageWidget._concatenate_png_picture, with the tiles already converted
+        big_picture_array = None
+        img_index = 0
+        for _ in range(rows):
+            temp_array = tiles[img_index].copy()
+            img_index += 1
+            for _ in range(1, cols):
+                temp_array = np.concatenate((temp_array, tiles[img_index]), axis=1)
+                img_index += 1
+            if big_picture_array is None:
+                big_picture_array = temp_array
+            else:
+                big_picture_array = np.concatenate((big_picture_array, temp_array), axis=0)
+        return big_picture_array
+
+    def legacy_scan(folder, size):
+        # Old GrillageWidget._capture_xy_grid + save_big_picture_array
+        rgbx_tiles = [np.stack([tile, tile, tile, tile], axis=-1)] * (size * size)
+        big_array = legacy_concatenate(rgbx_tiles, size, size)
+        big_array_8bit = (big_array / 65535.0 * 255.0).astype(np.uint8)
+        Image.fromarray(big_array_8bit, mode='RGBA').save(os.path.join(folder, "legacy.png"))
+
+    def mosaic_scan(folder, size, memory_mapped):
+        path = os.path.join(folder, "mosaic.npy") if memory_mapped else None
+        mosaic = Mosaic(size, size, tile.shape, path=path)
+        for row in range(size):
+            for col in range(size):
+                mosaic.place(row, col, tile)
+        mosaic.export_png(os.path.join(folder, "mosaic.png"))
+        mosaic.close()
+
+    print(f"{'grid':>6} {'case':>14} {'time (s)':>9} {'peak of the heap (MB)':>22}")
+    with tempfile.TemporaryDirectory() as folder:
+        for size in (4, 8):
+            cases = (("legacy", lambda: legacy_scan(folder, size)),
+                     ("mosaic in RAM", lambda: mosaic_scan(folder, size, False)),
+                     ("memory-mapped", lambda: mosaic_scan(folder, size, True)))
+            for name, scan in cases:
+                tracemalloc.start()
+                start = time.perf_counter()
+                scan()
+                elapsed = time.perf_counter() - start
+                peak = tracemalloc.get_traced_memory()[1] / 2**20
+                tracemalloc.stop()
+                print(f"{size}x{size:<4} {name:>14} {elapsed:>9.2f} {peak:>22.1f}")
+
+        # The PNG streamed is read back identical
+        mosaic = Mosaic(2, 3, tile.shape, path=os.path.join(folder, "check.npy"))
+        for row in range(2):
+            for col in range(3):
+                mosaic.place(row, col, tile)
+        mosaic.export_png(os.path.join(folder, "check.png"))
+        with Image.open(os.path.join(folder, "check.png")) as image:
+            assert np.array_equal(np.array(image), mosaic.array)
+        mosaic.close()
@@ -0,0 +1,155 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional
+
+import numpy as np
+from PIL import Image
+
+from Scripts.utils import LoggingClass
+
+# TIFF tag where the metadata are written, in JSON
+TIFF_IMAGE_DESCRIPTION = 270
+
+
+class SnapshotWriterError(Exception):
+    pass
+
+
+def read_snapshot(path: str) -> tuple[np.ndarray, dict]:
+    """
+    :param path: File written by SnapshotWriter
+    :return: 16 bits picture and its metadata
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".npy":
+        picture = np.load(path)
+        with open(path + ".json", "r") as metadata_file:
+            return picture, json.load(metadata_file)
+
+    with Image.open(path) as image:
+        description = image.tag_v2.get(TIFF_IMAGE_DESCRIPTION, "{}")
+        return np.array(image), json.loads(description)
+
+
+class SnapshotWriter(LoggingClass):
+    """
+    Write the raw 16 bits pictures of the camera on a background thread, in lossless TIFF or npy.
+    The pictures are written in the order of submission. The caller gets a Future of the path written,
+    and never waits for the disk.
+    A picture is written in a temporary file renamed at the end, so a file found on the disk is always complete.
+    The metadata are in the ImageDescription tag of the TIFF, or in a .json file next to the npy.
+    """
+    TIFF = ".tiff"
+    NPY = ".npy"
+    FORMATS = (TIFF, NPY)
+
+    def __init__(self):
+        LoggingClass.__init__(self)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="SnapshotWriter")
+        self._lock = threading.Lock()
+        self._pending = 0
+
+    @property
+    def pending(self) -> int:
+        """
+        :return: Number of pictures waiting to be written
+        """
+        return self._pending
+
+    def submit(self, picture: np.ndarray, path: str, metadata: Optional[dict] = None) -> Future:
+        """
+        :param picture: 2D 16 bits picture, copied: the caller can reuse it after the call
+        :param path: File path, the extension gives the format (.tif, .tiff or .npy)
+        :param metadata: Information saved with the picture, must be serializable in JSON
+        :return: Future of the path written, its exception is set if the writing failed
+        """
+        extension = os.path.splitext(path)[1].lower()
+        if extension not in self.FORMATS + (".tif",):
+            raise SnapshotWriterError(f"Unknown snapshot format: {extension}")
+        if picture.ndim != 2 or picture.dtype != np.uint16:
+            raise SnapshotWriterError(f"Snapshot must be a 2D uint16 picture: {picture.shape} {picture.dtype}")
+
+        description = json.dumps(metadata or {})
+        with self._lock:
+            self._pending += 1
+        return self._executor.submit(self._write, np.array(picture), path, description)
+
+    def _write(self, picture: np.ndarray, path: str, description: str) -> str:
+        try:
+            folder = os.path.dirname(path)
+            if folder:
+                os.makedirs(folder, exist_ok=True)
+
+            root, extension = os.path.splitext(path)
+            temporary_path = f"{root}.tmp{extension}"
+            if extension.lower() == self.NPY:
+                np.save(temporary_path, picture)
+                # The sidecar is replaced in one step too
+                with open(f"{root}.tmp{extension}.json", "w") as metadata_file:
+                    metadata_file.write(description)
+                os.replace(f"{root}.tmp{extension}.json", path + ".json")
+            else:
+                # Mode I;16: 16 bits gray levels, without conversion
+                image = Image.fromarray(picture)
+                image.save(temporary_path, format="TIFF", tiffinfo={TIFF_IMAGE_DESCRIPTION: description})
+            os.replace(temporary_path, path)
+            return path
+        except Exception as e:
+            self.logger.error(f"Snapshot {path} not written: {e}")
+            raise
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def flush(self, timeout: Optional[float] = None):
+        """
+        Wait the end of the writing of the pictures submitted
+        """
+        self._executor.submit(lambda: None).result(timeout)
+
+    def shutdown(self):
+        """
+        Write the pictures submitted and stop the thread
+        """
+        self._executor.shutdown(wait=True)
+
+
+if __name__ == '__main__':
+    # Benchmark: time spent by the caller for a snapshot, against the old PNG of the displayed pixmap
+    import sys
+    import tempfile
+    from PyQt6.QtCore import QSize
+    from PyQt6.QtWidgets import QApplication
+
+    from Scripts.PictureTreatment.display_renderer import DisplayRenderer
+
+    app = QApplication(sys.argv)
+    rng = np.random.default_rng(0)
+    frame = rng.integers(0, 2**14, size=(640, 512), dtype=np.uint16) * 4
+    picture = frame.reshape(512, 640)[::-1]
+    pixmap = DisplayRenderer().render(frame, QSize(800, 640))
+    writer = SnapshotWriter()
+    repeat = 20
+
+    with tempfile.TemporaryDirectory() as folder:
+        start = time.perf_counter()
+        for i in range(repeat):
+            pixmap.save(os.path.join(folder, f"legacy_{i}.png"))
+        legacy_time = (time.perf_counter() - start) / repeat * 1000
+
+        for extension in SnapshotWriter.FORMATS:
+            start = time.perf_counter()
+            futures = [writer.submit(picture, os.path.join(folder, f"snapshot_{i}{extension}"), {"index": i})
+                       for i in range(repeat)]
+            submit_time = (time.perf_counter() - start) / repeat * 1000
+            futures[-1].result()
+            total_time = (time.perf_counter() - start) / repeat * 1000
+
+            saved, metadata = read_snapshot(futures[0].result())
+            assert np.array_equal(saved, picture) and metadata == {"index": 0}
+            print(f"{extension:>6}: caller {submit_time:.2f} ms, written in {total_time:.2f} ms by picture")
+        print(f"   png of the 8 bits pixmap on the caller thread: {legacy_time:.2f} ms by picture")
+    writer.shutdown()
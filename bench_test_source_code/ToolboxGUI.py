@@ -5,8 +5,6 @@ import time
 from PyQt6.QtCore import QEventLoop, QTimer
 from PyQt6.QtWidgets import QInputDialog, QLineEdit, QMessageBox
 
-from Scripts.Translation_stage.translation_stage_interface import TranslationStageInterface
-
 
 class ToolboxGUI:
 
@@ -33,36 +31,6 @@ class ToolboxGUI:
 
         return name_file
 
-    @staticmethod
-    def wait_axis_moving(parent):
-        # Reset the value of the timeout
-        time_waiting_response = 0
-        loop = QEventLoop()
-
-        def _check_axis_moving(parent, loop: QEventLoop, timer):
-            """
-            Wait as long as the platine stop to move
-            :param loop: The loop that will execute this method
-            """
-            timer += 1
-            time.sleep(0.05)
-
-            if not TranslationStageInterface().is_any_axis_moving():
-                loop.quit()
-
-            # If waiting more than 10s
-            if timer >= 200:
-                QMessageBox.warning(parent, "Timeout error", "The calibration had an error, retry")
-                loop.quit()
-
-        check_to_quit_loop = QTimer()
-        check_to_quit_loop.timeout.connect(lambda: _check_axis_moving(parent, loop, time_waiting_response))
-        check_to_quit_loop.start(50)  # Check every 20ms
-        loop.exec()
-
-        # Stop the check of the response
-        check_to_quit_loop.stop()
-
     @staticmethod
     def wait_file_is_creating(parent, path_file: str):
         if path_file == "" or path_file is None:
@@ -0,0 +1,128 @@
+import threading
+import time
+from concurrent.futures import Future, InvalidStateError
+from typing import Tuple
+
+from Scripts.utils import LoggingClass
+
+
+class MotionTimeoutError(Exception):
+    pass
+
+
+class MotionFuture(Future, LoggingClass):
+    """
+    Completion of a move of the translation stage, returned by the move commands of TranslationPi.
+    A background thread polls the axis moved until their motion bit is cleared, or until they are on target.
+    The polling is adaptive: slow before the arrival predicted with the trapezoidal profile, fast from it,
+    so the serial link stays free for the other queries during the long moves.
+    The result is the time of the move in seconds.
+    The future queries the stage from its own thread: the stage must be thread-safe, see TranslationStageInterface.
+    The GUI never waits for it: the result is given to the GUI thread with add_done_callback and a signal.
+    """
+
+    def __init__(self, stage, axes: Tuple[int, ...], predicted: float, timeout: float,
+                 on_target: bool = False, min_period: float = 0.005, max_period: float = 0.1):
+        """
+        :param stage: TranslationPi which received the move commands
+        :param axes: Axis moved, X = 1, Y = 2, Z = 3
+        :param predicted: Time of the move predicted with the velocity and the acceleration of the axis in seconds
+        :param timeout: Max time of the move in seconds, the stage is stopped and the future fails
+        with MotionTimeoutError beyond
+        :param on_target: True to wait for the on-target state (ONT?): the axis settled in the target window,
+        False for the end of the trajectory (motion bit of SRG?)
+        :param min_period: Period of the polling after the predicted arrival in seconds
+        :param max_period: Period of the polling before the predicted arrival in seconds
+        """
+        Future.__init__(self)
+        LoggingClass.__init__(self)
+        self.stage = stage
+        self.axes = axes
+        self.predicted = predicted
+        self.timeout = timeout
+        self.on_target = on_target
+        self.min_period = min_period
+        self.max_period = max_period
+        self.polls = 0  # Number of readings of the status of the axis
+        # Axis not seen stopped yet: the last readings only query them
+        self._moving = axes
+        self.start_time = time.perf_counter()
+        # Set by cancel() to end the sleep of the polling
+        self._wake = threading.Event()
+        threading.Thread(target=self._watch, name="MotionFuture", daemon=True).start()
+
+    def cancel(self) -> bool:
+        """
+        Stop the stage if the move isn't finished, STOP stops all the axis
+        :return: False if the move is already finished
+        """
+        if self.done():
+            return False
+        self.stage.stop()
+        cancelled = Future.cancel(self)
+        self._wake.set()
+        return cancelled
+
+    def _watch(self):
+        try:
+            while not self.cancelled():
+                elapsed = time.perf_counter() - self.start_time
+                # Slow polling up to the predicted arrival, the first fast reading is at the arrival
+                self._wake.wait(min(max(self.predicted - elapsed, self.min_period), self.max_period))
+                if self.cancelled():
+                    return
+                self.polls += 1
+                if self._arrived():
+                    self.set_result(time.perf_counter() - self.start_time)
+                    return
+                if time.perf_counter() - self.start_time > self.timeout:
+                    # The axis must not keep moving without a caller waiting for them
+                    self.stage.stop()
+                    raise MotionTimeoutError(f"Axis {self.axes} still moving after {self.timeout} s")
+        except InvalidStateError:
+            # Cancelled between the reading and the result
+            pass
+        except Exception as e:
+            self.logger.error(f"Move of the axis {self.axes} failed: {e}")
+            try:
+                self.set_exception(e)
+            except InvalidStateError:
+                pass
+
+    def _arrived(self) -> bool:
+        # The axis are read in one batch of queries
+        if self.on_target:
+            return self.stage.is_on_target(self.axes)
+        self._moving = tuple(axis for axis, moving in zip(self._moving, self.stage.axes_moving(self._moving)) if moving)
+        return not self._moving
+
+
+if __name__ == '__main__':
+    # Benchmark: end of a move detected by a fixed polling against the adaptive polling of MotionFuture
+    from Scripts.Translation_stage.motion_profile import move_duration
+    from Scripts.Translation_stage.translation_stage_interface import TranslationStageInterface
+    from Scripts.Translation_stage.translation_stage_simulator import TranslationStageSimulator
+
+    with TranslationStageSimulator(latency=0.002) as simulator:
+        # Thread-safe: the future queries the stage from its thread
+        stage = TranslationStageInterface(port=simulator.port, baudrate=115200, timeout=1)
+        for distance in (0.5, 5.0, 40.0):
+            expected = move_duration(distance, 20, 400)
+            for name, period in (("fixed 5 ms", 0.005), ("fixed 50 ms", 0.05), ("MotionFuture", None)):
+                stage.move_absolute((0, 0, 0)).result()
+                origin = (0, 0, 0)
+                position = distance
+                commands = simulator.command_count
+                start = time.perf_counter()
+                if period is None:
+                    # The stage is stopped at the origin: no position query, like the fixed polling
+                    stage.move_absolute((position, position, position), origin).result()
+                else:
+                    # Old move_absolute then the loop of the caller on the motion status
+                    for axis in range(1, 4):
+                        stage.write(f"{axis} MOV 1 {position}")
+                    while stage.is_any_axis_moving():
+                        time.sleep(period)
+                elapsed = time.perf_counter() - start
+                print(f"{distance:5.1f} mm {name:>12}: end detected {(elapsed - expected) * 1000:6.1f} ms "
+                      f"after the arrival, {simulator.command_count - commands:4d} commands")
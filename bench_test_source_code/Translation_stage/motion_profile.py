@@ -0,0 +1,47 @@
+"""
+Trapezoidal velocity profile of an axis of the translation stage: constant acceleration up to the velocity,
+constant velocity, then constant deceleration. Triangular if the move is too short to reach the velocity.
+"""
+import math
+
+
+def move_duration(distance: float, velocity: float, acceleration: float) -> float:
+    """
+    :param distance: Length of the move in mm (the sign is ignored)
+    :param velocity: Max velocity of the axis in mm/s
+    :param acceleration: Acceleration and deceleration of the axis in mm/s²
+    :return: Time of the move in seconds, from rest to rest
+    """
+    distance = abs(distance)
+    # Distance to reach the velocity then to stop
+    ramps_distance = velocity ** 2 / acceleration
+    if distance >= ramps_distance:
+        return distance / velocity + velocity / acceleration
+    return 2 * math.sqrt(distance / acceleration)
+
+
+def position_at(start: float, target: float, velocity: float, acceleration: float, elapsed: float) -> float:
+    """
+    :param start: Position at the beginning of the move in mm
+    :param target: Position at the end of the move in mm
+    :param elapsed: Time since the beginning of the move in seconds
+    :return: Position of the axis in mm
+    """
+    distance = abs(target - start)
+    duration = move_duration(distance, velocity, acceleration)
+    if elapsed <= 0:
+        return start
+    if elapsed >= duration:
+        return target
+
+    # Velocity really reached: lower than velocity for a triangular profile
+    peak_velocity = min(velocity, math.sqrt(distance * acceleration))
+    ramp_time = peak_velocity / acceleration
+    if elapsed < ramp_time:
+        travelled = acceleration * elapsed ** 2 / 2
+    elif elapsed <= duration - ramp_time:
+        travelled = peak_velocity * ramp_time / 2 + peak_velocity * (elapsed - ramp_time)
+    else:
+        travelled = distance - acceleration * (duration - elapsed) ** 2 / 2
+
+    return start + math.copysign(travelled, target - start)
@@ -0,0 +1,86 @@
+import threading
+import time
+from threading import Lock
+from typing import Optional
+
+from PyQt6.QtCore import QThread, pyqtSignal
+
+from Scripts.Translation_stage.translation_stage_interface import TranslationStageInterface
+from Scripts.Translation_stage.translation_stage_pi import StageState, TranslationStageError
+from Scripts.utils import LoggingClass
+
+
+class StageStatePoller(QThread, LoggingClass):
+    """
+    Singleton class
+    Only thread that polls the translation stage: it reads the position and the motion status of the axis
+    once per period and publishes them to all the widgets with state_changed.
+    The widgets use the last state instead of asking the stage themselves.
+    """
+    state_changed = pyqtSignal(object)  # StageState
+
+    _instance = None
+    _lock = Lock()  # Thread safety
+    _initialized = False
+
+    def __new__(cls, *args, **kwargs):
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = super(StageStatePoller, cls).__new__(cls)
+        return cls._instance
+
+    def __init__(self, period: float = 0.2):
+        """
+        :param period: Time between two readings of the state in seconds
+        """
+        with self._lock:
+            if not self._initialized:
+                QThread.__init__(self)
+                LoggingClass.__init__(self)
+                self.translation = TranslationStageInterface()
+                self.period = period
+                self.state: Optional[StageState] = None
+                # Set to read the state without waiting the end of the period
+                self._wake = threading.Event()
+                self._initialized = True
+
+    @classmethod
+    def get_instance(cls):
+        """
+        Return the reference of the instance
+        """
+        return cls()  # Call __new__ then __init__
+
+    def run(self):
+        while not self.isInterruptionRequested():
+            try:
+                state = self.translation.get_state()
+            except (TranslationStageError, ValueError) as e:
+                self.logger.error(f"Error at reading of the stage state: {e}")
+            else:
+                self.state = state
+                self.state_changed.emit(state)
+
+            self._wake.wait(self.period)
+            self._wake.clear()
+
+    def refresh(self):
+        """
+        Read the state now, ex: just after a move command
+        """
+        self._wake.set()
+
+    def stop(self):
+        self.requestInterruption()
+        self._wake.set()
+        self.wait()
+
+    def last_state(self, max_age: Optional[float] = None) -> Optional[StageState]:
+        """
+        :param max_age: Max age of the state in seconds, None to accept any age
+        :return: Last state read, None if there is no state recent enough
+        """
+        state = self.state
+        if state is None or (max_age is not None and time.monotonic() - state.timestamp > max_age):
+            return None
+        return state
@@ -1,13 +1,15 @@
 from threading import Lock
+from typing import List, Sequence
 from Scripts.Translation_stage.translation_stage_pi import TranslationPi
-from PyQt6.QtCore import QMutexLocker, QMutex
+from Scripts.Translation_stage.translation_stage_pi import StageState
+from PyQt6.QtCore import QMutexLocker, QRecursiveMutex
 
 
 class TranslationStageInterface(TranslationPi):
     """
     Singleton class
     Interface between TranslationPi and Qt to handle multithreading.
-    A mutex locks the access to methods.
+    A mutex locks the access to methods, it's held during a whole reading of the state of the stage.
     Thread-safe singleton implementation.
     """
     _instance = None
@@ -23,7 +25,8 @@ class TranslationStageInterface(TranslationPi):
     def __init__(self, **kwargs):
         with self._lock:
             if not self._initialized:
-                self._mutex = QMutex()
+                # Recursive: the queries of get_state lock it again
+                self._mutex = QRecursiveMutex()
                 super().__init__(**kwargs)
                 self._initialized = True
 
@@ -38,6 +41,16 @@ class TranslationStageInterface(TranslationPi):
         with QMutexLocker(self._mutex):
             return TranslationPi.ask(self, msg, data_size_received)
 
+    def ask_batch(self, messages: Sequence[str]) -> List[str]:
+        # The answers of a batch are read before another thread sends a query
+        with QMutexLocker(self._mutex):
+            return TranslationPi.ask_batch(self, messages)
+
     def write(self, msg: str):
         with QMutexLocker(self._mutex):
             return TranslationPi.write(self, msg)
+
+    def get_state(self) -> StageState:
+        # The other threads can't send a command between the position and the motion queries
+        with QMutexLocker(self._mutex):
+            return TranslationPi.get_state(self)
@@ -3,7 +3,8 @@ Classe de gestion de la platine de translation du banc EMMI
 """
 import time
 from copy import deepcopy
-from typing import Union
+from dataclasses import dataclass
+from typing import Union, Optional, Tuple, Sequence, List
 
 from serial import Serial
 import serial
@@ -11,6 +12,8 @@ from toolbox3.geometry.point import Point3D
 from toolbox3.instrumentation.generic.generic import Generic
 import logging
 
+from Scripts.Translation_stage.motion_future import MotionFuture
+from Scripts.Translation_stage.motion_profile import move_duration
 from Scripts.utils import LoggingClass
 
 logger = logging.getLogger()
@@ -19,11 +22,27 @@ class TranslationStageError(Exception):
     pass
 
 
+@dataclass(frozen=True)
+class StageState:
+    """
+    Position and motion status of the axis read in the same cycle
+    """
+    position: Point3D
+    axis_moving: tuple  # Motion status of the axis X, Y, Z
+    timestamp: float  # time.monotonic() at the beginning of the reading
+
+    @property
+    def is_moving(self) -> bool:
+        return any(self.axis_moving)
+
+
 """
 For send command to specific axis, the doc tell "<command> <AxisID> <value>"
 To do this, use instead this syntax to communicate with axis X, Y and Z : "<AxisID> <command> 1 <value>"
 """
 class TranslationPi(Serial, Generic, LoggingClass):
+    # Time added to the predicted time of a move for its default timeout in seconds
+    MOVE_TIMEOUT_MARGIN = 5.0
 
     #region Serial communication
     def write(self, msg: str):
@@ -63,6 +82,27 @@ class TranslationPi(Serial, Generic, LoggingClass):
         self.write_ask(msg)
         return self.read_until(serial.LF, data_size_received)
 
+    def ask_batch(self, messages: Sequence[str]) -> List[str]:
+        """
+        Send all the queries back to back, then read their answers in the same order:
+        the round trip of the serial link is paid once instead of once by query
+        :param messages: Queries with one answer each, ex: POS? of the 3 axis
+        :return: Answers in the order of the queries
+        """
+        self.write_ask('\n'.join(messages))
+        answers = []
+        try:
+            for message in messages:
+                answer = self.read_until(serial.LF)
+                if answer == "":
+                    raise TranslationStageError(f"No answer to {message!r} after {self.timeout} s")
+                answers.append(answer)
+        except Exception:
+            # The answers left in the batch would be read by the next queries as their own answers
+            self.reset_input_buffer()
+            raise
+        return answers
+
     #endregion
 
     def __init__(self, **kwargs):
@@ -71,11 +111,10 @@ class TranslationPi(Serial, Generic, LoggingClass):
         LoggingClass.__init__(self)
 
         # position infos
-        pos_min = [self.ask(f"{axis} TMN? 1") for axis in range(1, 4)]
-        self._pos_min = [float(i.split('=')[-1]) for i in pos_min]
+        limits = self.ask_batch([f"{axis} TMN? 1" for axis in range(1, 4)] + [f"{axis} TMX? 1" for axis in range(1, 4)])
+        self._pos_min = [float(i.split('=')[-1]) for i in limits[:3]]
         self.__physical_limit_min = deepcopy(self._pos_min)
-        pos_max = [self.ask(f"{axis} TMX? 1") for axis in range(1, 4)]
-        self._pos_max = [float(i.split('=')[-1]) for i in pos_max]
+        self._pos_max = [float(i.split('=')[-1]) for i in limits[3:]]
         self.__physical_limit_max = deepcopy(self._pos_max)
 
         # Put initial speed
@@ -143,30 +182,50 @@ class TranslationPi(Serial, Generic, LoggingClass):
         """
         :return: Serial numbers of the 3 axis.
         """
-        sn = {"axis" + str(num): self.ask(f'{num} *IDN?') for num in range(1, 4)}
+        sn = dict(zip(("axis1", "axis2", "axis3"), self.ask_batch([f'{num} *IDN?' for num in range(1, 4)])))
         return "1:\t{axis1}\n2:\t{axis2}\n3:\t{axis3}".format(**sn)
 
     def get_position(self) -> Point3D:
         """
         :return: Actual position of the axis.
         """
-        pos = [self.ask(f"{axis} POS? 1") for axis in range(1, 4)]
+        pos = self.ask_batch([f"{axis} POS? 1" for axis in range(1, 4)])
         pos = [float(i.split('=')[-1]) for i in pos]
         pos = Point3D(*pos)
         return pos
 
-    def is_any_axis_moving(self) -> bool:
+    def get_axis_position(self, axis: int) -> float:
         """
-        Check if any axis moving
-        :return: true: at least one axis moving - false: no axis moving
+        :return: Actual position of one axis, in one query
         """
-        check_value = [True, True, True]
+        return float(self.ask(f"{axis} POS? 1").split('=')[-1])
 
-        for i in range(0, 3):
-            check_value[i] = self.is_axis_moving(i+1)
+    def get_state(self) -> StageState:
+        """
+        Read the position and the motion status of all the axis in one cycle
+        """
+        timestamp = time.monotonic()
+        # Positions and status registers in one batch
+        answers = self.ask_batch([f"{axis} POS? 1" for axis in range(1, 4)] +
+                                 [f"{axis} SRG? 1 1" for axis in range(1, 4)])
+        position = Point3D(*[float(i.split('=')[-1]) for i in answers[:3]])
+        axis_moving = tuple(self._motion_bit(i) for i in answers[3:])
+        return StageState(position, axis_moving, timestamp)
+
+    def axes_moving(self, axes: Sequence[int] = (1, 2, 3)) -> Tuple[bool, ...]:
+        """
+        :param axes: Axis to check, X = 1, Y = 2, Z = 3
+        :return: Motion status of each axis, read in one batch of queries
+        """
+        return tuple(self._motion_bit(i) for i in self.ask_batch([f"{axis} SRG? 1 1" for axis in axes]))
 
-        # If all axis stop moving, return false
-        return not all(x == False for x in check_value)
+    def is_any_axis_moving(self, axes: Sequence[int] = (1, 2, 3)) -> bool:
+        """
+        Check if any axis moving
+        :param axes: Axis to check, X = 1, Y = 2, Z = 3
+        :return: true: at least one axis moving - false: no axis moving
+        """
+        return any(self.axes_moving(axes))
 
     def is_axis_moving(self, axis) -> bool:
         """
@@ -176,11 +235,25 @@ class TranslationPi(Serial, Generic, LoggingClass):
         if axis not in (1, 2, 3) :
             self.logger.error("ERROR: Wrong axis to check")
             return
-        mvt = self.ask(f"{axis} SRG? 1 1")  # Query Status Register Value
-        mvt = mvt.split('=0x')[-1]
+        return self._motion_bit(self.ask(f"{axis} SRG? 1 1"))  # Query Status Register Value
+
+    @staticmethod
+    def _motion_bit(status: str) -> bool:
+        """
+        :param status: Answer of SRG?
+        :return: true: motion bit of the status register set
+        """
+        mvt = status.split('=0x')[-1]
         mvt = int(mvt, base=16) >> 13 & 1
         return not mvt == 0
 
+    def is_on_target(self, axes: Sequence[int] = (1, 2, 3)) -> bool:
+        """
+        :param axes: Axis to check, X = 1, Y = 2, Z = 3
+        :return: true: all the axis are stopped in the window of their target - false: moving or settling
+        """
+        return all(i.split('=')[-1].strip() == '1' for i in self.ask_batch([f"{axis} ONT? 1" for axis in axes]))
+
     def set_origin(self):
         """
         Actual position become the origin axis
@@ -197,33 +270,74 @@ class TranslationPi(Serial, Generic, LoggingClass):
         on_off = int(on_off)
         for axis in range(1, 4):
             self.write(f"{axis} JON 1 {on_off}")  # Set Joystick for each axis
-            j = self.ask(f"{axis} JON? 1")  # Get Joystick Activation Status
+        status = self.ask_batch([f"{axis} JON? 1" for axis in range(1, 4)])  # Get Joystick Activation Status
+        for axis, j in zip(range(1, 4), status):
             if j[-1] != str(int(on_off)):
                 raise TranslationStageError(f"Joystick {axis} deactivated")
 
-    def move_relative(self, pos: Point3D) -> bool:
+    def move_relative(self, pos: Point3D, current_position: Optional[Point3D] = None,
+                      timeout: Optional[float] = None, on_target: bool = False) -> Optional[MotionFuture]:
         """
-        Move to a relative position
+        Move to a relative position, returns as soon as the commands are sent
         :param pos: Wished Position :(x,y,z)
+        :param current_position: Position of the axis if it's already known (axis stopped), to not ask it again
+        :param timeout: Max time of the move in seconds, see MotionFuture.
+        None for the predicted time of the move plus MOVE_TIMEOUT_MARGIN
+        :param on_target: Wait for the axis settled on target instead of the end of the trajectory
+        :return: Completion of the move, None if the position is out of range (no axis moved)
         """
-        act_pos = self.get_position()
+        act_pos = current_position if current_position is not None else self.get_position()
+        # Check all the axis before moving one
         for i in range(1, 4):
             if not (self._pos_min[i - 1]-act_pos[i-1]) <= pos[i - 1] <= (self._pos_max[i - 1]-act_pos[i-1]):
                 self.logger.error(f"Position {i} out of range")
-                return False
+                return None
+        # Predicted before sending the commands: a wrong velocity fails with the stage stopped
+        predicted = self.predict_move([pos[i] for i in range(3)])
+        for i in range(1, 4):
             self.write(f"{i} MVR 1 {pos[i - 1]}")  # Move relative instruction for each axis
-        return True
+        return MotionFuture(self, (1, 2, 3), predicted, self._move_timeout(predicted, timeout), on_target)
 
-    def move_absolute(self, pos: Point3D):
+    def move_absolute(self, pos: Point3D, current_position: Optional[Point3D] = None,
+                      timeout: Optional[float] = None, on_target: bool = False) -> MotionFuture:
         """
-        Move to an absolute position
+        Move to an absolute position, returns as soon as the commands are sent
         :param pos: Wished Position :(x,y,z)
-        :return: Final Position after the movements
+        :param current_position: Position of the axis if it's already known (axis stopped), to predict the time
+        of the move without asking it
+        :param timeout: Max time of the move in seconds, see MotionFuture.
+        None for the predicted time of the move plus MOVE_TIMEOUT_MARGIN
+        :param on_target: Wait for the axis settled on target instead of the end of the trajectory
+        :return: Completion of the move
         """
         for i in range(1, 4):
             if not self._pos_min[i - 1] <= pos[i - 1] <= self._pos_max[i - 1]:  # error if the position is out of range
                 raise ValueError("Position out of range")
+        act_pos = current_position if current_position is not None else self.get_position()
+        # Predicted before sending the commands: a wrong velocity fails with the stage stopped
+        predicted = self.predict_move([pos[i] - act_pos[i] for i in range(3)])
+        for i in range(1, 4):
             self.write(f"{i} MOV 1 {pos[i - 1]}")  # move absolute instruction for each axis
+        return MotionFuture(self, (1, 2, 3), predicted, self._move_timeout(predicted, timeout), on_target)
+
+    def _move_timeout(self, predicted: float, timeout: Optional[float]) -> float:
+        return predicted + self.MOVE_TIMEOUT_MARGIN if timeout is None else timeout
+
+    def predict_move(self, distances: Sequence[float]) -> float:
+        """
+        :param distances: Move of the axis X, Y, Z in mm
+        :return: Time of the move in seconds with the trapezoidal profile, the axis move at the same time
+        """
+        durations = [0.0]
+        for axis, (distance, velocity, acceleration) in enumerate(
+                zip(distances, self._velocities, self._accelerations), start=1):
+            if distance == 0:
+                continue
+            if velocity <= 0 or acceleration <= 0:
+                raise TranslationStageError(f"Axis {axis} can't move: velocity {velocity} mm/s, "
+                                            f"acceleration {acceleration} mm/s²")
+            durations.append(move_duration(distance, velocity, acceleration))
+        return max(durations)
 
     @property
     def acceleration(self):
@@ -234,9 +348,12 @@ class TranslationPi(Serial, Generic, LoggingClass):
         """
         :param value: Value of the acceleration of axis, max = 400
         """
+        # Known for the prediction of the time of the moves
+        self._accelerations = [float(value)] * 3
         for i in range(1, 4):
             self.write(f"{i} ACC 1 {value}")  # Change value
-            acceleration_value = self.ask(f"{i} ACC? 1")  # Get the value
+        acceleration_values = self.ask_batch([f"{i} ACC? 1" for i in range(1, 4)])  # Get the values
+        for i, acceleration_value in zip(range(1, 4), acceleration_values):
             self.logger.debug(f"acceleration:: axis: {i}, value: {acceleration_value}")
 
     @property
@@ -248,11 +365,29 @@ class TranslationPi(Serial, Generic, LoggingClass):
         """
         :param value: Value of the speed of axis, max = 20
         """
+        # Known for the prediction of the time of the moves
+        self._velocities = [float(value)] * 3
         for i in range(1, 4):
             self.write(f"{i} VEL 1 {value}")  # Change value
-            velocity_value = self.ask(f"{i} VEL? 1")  # Get value
+        velocity_values = self.ask_batch([f"{i} VEL? 1" for i in range(1, 4)])  # Get values
+        for i, velocity_value in zip(range(1, 4), velocity_values):
             self.logger.debug(f"speed:: axis: {i}, value: {velocity_value}")
 
+    def set_velocity(self, axis: int, velocity: float):
+        """
+        Change the velocity of one axis, without reading it back: used during the scans
+        :param velocity: Velocity in mm/s, max = 20
+        """
+        self._velocities[axis - 1] = float(velocity)
+        self.write(f"{axis} VEL 1 {velocity}")
+
+    def get_motion_parameters(self, axis: int = 1) -> Tuple[float, float]:
+        """
+        :return: Velocity in mm/s and acceleration in mm/s² of an axis
+        """
+        velocity, acceleration = self.ask_batch([f"{axis} VEL? 1", f"{axis} ACC? 1"])
+        return float(velocity.split('=')[-1]), float(acceleration.split('=')[-1])
+
     def stop(self):
         self.write("STOP")
 
@@ -0,0 +1,296 @@
+"""
+Simulator of the PI translation stage of the EMMI bench, to run and benchmark the software without the stage.
+The simulator answers the GCS commands used by TranslationPi through a pseudo-terminal:
+TranslationPi opens its port like the real COM port of the controller.
+"""
+import os
+import select
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Optional
+
+from Scripts.Translation_stage.motion_profile import move_duration, position_at
+from Scripts.Translation_stage.translation_stage_pi import TranslationStageError
+from Scripts.utils import LoggingClass
+
+
+@dataclass
+class SimulatedAxis:
+    """
+    State of an axis: the position is computed from the last move and the time elapsed since its start
+    """
+    limit_min: float = 0.0
+    limit_max: float = 52.0
+    velocity: float = 20.0
+    acceleration: float = 400.0
+    servo: bool = False
+    joystick: bool = False
+    referenced: bool = False
+    start: float = 0.0
+    target: float = 0.0
+    start_time: float = field(default_factory=time.perf_counter)
+    # Profile of the move in progress, kept even if the velocity or the acceleration are changed during it
+    move_velocity: float = 20.0
+    move_acceleration: float = 400.0
+
+    def elapsed(self, now: float) -> float:
+        return now - self.start_time
+
+    def position(self, now: float) -> float:
+        return position_at(self.start, self.target, self.move_velocity, self.move_acceleration, self.elapsed(now))
+
+    def is_moving(self, now: float) -> bool:
+        duration = move_duration(self.target - self.start, self.move_velocity, self.move_acceleration)
+        return self.elapsed(now) < duration
+
+    def move_to(self, target: float, now: float):
+        self.start = self.position(now)
+        self.target = target
+        self.start_time = now
+        self.move_velocity = self.velocity
+        self.move_acceleration = self.acceleration
+
+    def stop(self, now: float):
+        self.start = self.target = self.position(now)
+
+
+class TranslationStageSimulator(LoggingClass):
+    """
+    PI controller of 3 axes (1 = X, 2 = Y, 3 = Z) simulated behind a pseudo-terminal, only available on Linux/macOS.
+    Each axis follows a trapezoidal profile with its velocity (VEL) and acceleration (ACC),
+    its status register (SRG?) has the motion bit set during the move, it is on target (ONT?) after it.
+    Each command takes `latency` seconds plus its transmission time at `baudrate` before being answered.
+    Each transfer from the software adds `link_latency` seconds, ex: the latency timer of a USB serial adapter:
+    the commands sent back to back in one transfer share it.
+    """
+    # Bit of the status register set when the axis is moving
+    MOTION_BIT = 1 << 13
+    # GCS error codes
+    NO_ERROR = 0
+    UNKNOWN_COMMAND = 2
+    OUT_OF_LIMITS = 7
+
+    def __init__(self, latency: float = 0.002, baudrate: Optional[int] = 115200, axis_count: int = 3,
+                 link_latency: float = 0.0):
+        """
+        :param latency: Processing time of each command by the controller in seconds
+        :param baudrate: Speed of the simulated serial link to add the transmission time, None to ignore it
+        :param link_latency: Round trip time of the serial link for each transfer in seconds
+        """
+        LoggingClass.__init__(self)
+        self.latency = latency
+        self.link_latency = link_latency
+        self.baudrate = baudrate
+        self.axes = {axis: SimulatedAxis() for axis in range(1, axis_count + 1)}
+        self.error = self.NO_ERROR
+        # Number of commands received, to measure the serial traffic of the software
+        self.command_count = 0
+
+        self._master = None
+        self._slave = None
+        self._port = None
+        self._thread = None
+        self._running = False
+        self._axes_lock = threading.Lock()
+
+    @property
+    def port(self) -> str:
+        """
+        :return: Path of the pseudo-terminal to give to TranslationPi(port=...)
+        """
+        if self._port is None:
+            raise TranslationStageError("The simulator is not started")
+        return self._port
+
+    def start(self) -> str:
+        """
+        Open the pseudo-terminal and answer the commands in a thread
+        :return: Path of the port
+        """
+        if os.name == "nt":
+            raise TranslationStageError("The translation stage simulator needs a pseudo-terminal (Linux/macOS)")
+        import tty  # Not available on Windows
+
+        self._master, self._slave = os.openpty()
+        # Raw mode: no echo and no conversion of the line feeds
+        tty.setraw(self._slave)
+        self._port = os.ttyname(self._slave)
+
+        self._running = True
+        self._thread = threading.Thread(target=self._serve, name="TranslationStageSimulator", daemon=True)
+        self._thread.start()
+        self.logger.debug(f"Simulator started on {self._port}")
+        return self._port
+
+    def close(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        for fd in (self._master, self._slave):
+            if fd is not None:
+                os.close(fd)
+        self._master = self._slave = self._port = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _serve(self):
+        pending = b""
+        while self._running:
+            ready, _, _ = select.select([self._master], [], [], 0.05)
+            if not ready:
+                continue
+            pending += os.read(self._master, 4096)
+            time.sleep(self.link_latency)
+            # Execute each complete line
+            while b"\n" in pending:
+                line, pending = pending.split(b"\n", 1)
+                answer = self._execute(line.decode("ascii").strip())
+                if answer is not None:
+                    os.write(self._master, (answer + "\n").encode("ascii"))
+
+    def _transmission_time(self, message: str) -> float:
+        # 10 bits by byte: start bit + 8 bits + stop bit
+        return 0 if self.baudrate is None else len(message) * 10 / self.baudrate
+
+    #region GCS commands
+
+    def _execute(self, line: str) -> Optional[str]:
+        """
+        :param line: Command without line feed, "<axis> <command> 1 <value>" or "<command>"
+        :return: Answer of the controller, None if the command has no answer
+        """
+        self.command_count += 1
+        time.sleep(self.latency + self._transmission_time(line))
+        words = line.split()
+        if not words:
+            return None
+
+        # Commands for one axis start with its number
+        if words[0].isdigit() and len(words) > 1:
+            axis, command, args = int(words[0]), words[1], words[2:]
+        else:
+            axis, command, args = 1, words[0], words[1:]
+
+        with self._axes_lock:
+            try:
+                return self._command(axis, command, args)
+            except (KeyError, IndexError, ValueError):
+                self.logger.warning(f"Unknown command: {line!r}")
+                self.error = self.UNKNOWN_COMMAND
+                return None
+
+    def _command(self, axis_id: int, command: str, args: list) -> Optional[str]:
+        now = time.perf_counter()
+        axis = self.axes[axis_id]
+
+        def answer(value) -> str:
+            return f"0 {axis_id} 1={value}"
+
+        if command == "POS?":
+            return answer(f"{axis.position(now):.4f}")
+        if command == "SRG?":
+            status = self.MOTION_BIT if axis.is_moving(now) else 0
+            return answer(f"0x{status:X}")
+        if command == "ONT?":
+            return answer(int(not axis.is_moving(now)))
+        if command in ("MOV", "MVR"):
+            target = float(args[1]) + (axis.position(now) if command == "MVR" else 0)
+            if not axis.limit_min <= target <= axis.limit_max:
+                self.error = self.OUT_OF_LIMITS
+                return None
+            axis.move_to(target, now)
+            return None
+        if command == "FNL":  # Reference move to the negative limit
+            axis.move_to(axis.limit_min, now)
+            axis.referenced = True
+            return None
+        if command == "FRF?":
+            # 0 during the reference move, _init_axis checks it just after FNL
+            return answer(0 if axis.is_moving(now) else int(axis.referenced))
+        if command == "VEL":
+            axis.velocity = float(args[1])
+            return None
+        if command == "VEL?":
+            return answer(axis.velocity)
+        if command == "ACC":
+            axis.acceleration = float(args[1])
+            return None
+        if command == "ACC?":
+            return answer(axis.acceleration)
+        if command == "TMN?":
+            return answer(axis.limit_min)
+        if command == "TMX?":
+            return answer(axis.limit_max)
+        if command == "SVO":
+            axis.servo = args[1] == "1"
+            return None
+        if command == "SVO?":
+            return answer(int(axis.servo))
+        if command == "JON":
+            axis.joystick = args[1] == "1"
+            return None
+        if command == "JON?":
+            return answer(int(axis.joystick))
+        if command == "JAX":
+            return None
+        if command == "JAX?":
+            return answer(1)
+        if command == "*IDN?":
+            return f"(c)2015 Physik Instrumente (PI) GmbH & Co. KG, C-863, simulator axis {axis_id}"
+        if command == "ERR?":
+            error, self.error = self.error, self.NO_ERROR
+            return str(error)
+        if command == "STOP":
+            for each_axis in self.axes.values():
+                each_axis.stop(now)
+            return None
+        if command == "DFH":
+            for each_axis in self.axes.values():
+                each_axis.stop(now)
+                each_axis.start = each_axis.target = 0.0
+            return None
+        raise KeyError(command)
+
+    #endregion
+
+
+if __name__ == "__main__":
+    # Benchmark: time of the queries of TranslationStageInterface depending on the latency of the controller
+    # and of the serial link, one query by axis against the queries in one batch
+    from Scripts.Translation_stage.translation_stage_interface import TranslationStageInterface
+
+    with TranslationStageSimulator(latency=0.0005) as simulator:
+        stage = TranslationStageInterface(port=simulator.port, baudrate=115200, timeout=1)
+        repeat = 50
+        for link_latency in (0.0, 0.002, 0.008):
+            simulator.link_latency = link_latency
+            queries = (("get_position", [f"{axis} POS? 1" for axis in range(1, 4)]),
+                       ("get_state", [f"{axis} POS? 1" for axis in range(1, 4)] +
+                        [f"{axis} SRG? 1 1" for axis in range(1, 4)]))
+            for name, messages in queries:
+                start = time.perf_counter()
+                for _ in range(repeat):
+                    # Old implementation: a round trip by query
+                    [stage.ask(message) for message in messages]
+                one_by_one = (time.perf_counter() - start) / repeat * 1000
+                start = time.perf_counter()
+                for _ in range(repeat):
+                    stage.ask_batch(messages)
+                batch = (time.perf_counter() - start) / repeat * 1000
+                print(f"link latency {link_latency * 1000:.0f} ms, {name:>12}: {one_by_one:6.2f} ms one by one, "
+                      f"{batch:6.2f} ms in a batch")
+
+        simulator.link_latency = 0.002
+        stage.move_absolute((10, 10, 10))
+        start = time.perf_counter()
+        while stage.is_any_axis_moving():
+            pass
+        print(f"Move of 10 mm: {time.perf_counter() - start:.3f} s, "
+              f"expected {move_duration(10, 20, 400):.3f} s, {simulator.command_count} commands")
@@ -2,6 +2,7 @@ import sys
 import types
 from typing import List, Optional, NamedTuple, Dict
 
+from PyQt6.QtCore import pyqtSignal
 from PyQt6.QtGui import QAction
 from PyQt6.QtWidgets import QPushButton, QMenu, QMainWindow, QApplication, QMessageBox, QHBoxLayout, QWidget
 
@@ -15,6 +16,8 @@ class ImageTreatment(NamedTuple):
     action: QAction
 
 class QCheckableComboBox(QPushButton):
+    selection_changed = pyqtSignal(list)  # ImageTreatment selected, in the order of selection
+
     def __init__(self, treatments: dict[str, types.FunctionType] = None):
         super().__init__("Select treatments...")
         self._items: dict[str, ImageTreatment] = {}
@@ -82,6 +85,7 @@ class QCheckableComboBox(QPushButton):
         # If the item is in selected items
         if any(key == item.name for key in self._selected_items.keys()):
             del self._selected_items[item.action.text()]
+            self.update_text()
 
     def remove_all_items(self):
         for item in self._items.values():
@@ -121,6 +125,8 @@ class QCheckableComboBox(QPushButton):
             self.setText(f"{len(self._selected_items)} selected")
         else:
             self.setText("Select treatments...")
+        # The text is updated at each change of the selection
+        self.selection_changed.emit(list(self._selected_items.values()))
 
     @property
     def items(self):
@@ -1,42 +1,71 @@
 import os.path
 import shutil
 import sys
+import time
 import types
+from concurrent.futures import Future
 
 import numpy as np
 
 from PyQt6.QtCore import QThread, pyqtSignal, pyqtSlot, Qt, QSettings
-from PyQt6.QtGui import QImage, QPixmap, QPainter, QPen
+from PyQt6.QtGui import QPixmap, QPainter, QPen
 from PyQt6.QtWidgets import QWidget, QLabel, QVBoxLayout, QSlider, QHBoxLayout, QMainWindow, QApplication, QSizePolicy, \
-    QFileDialog, QMessageBox, QDialog, QDialogButtonBox
+    QFileDialog, QMessageBox, QDialog, QDialogButtonBox, QDoubleSpinBox, QComboBox
 import pyqtgraph as pg
-from typing_extensions import Union
+from typing_extensions import Union, Optional
 
 from Scripts.Camera.camera_interface import CameraInterface
-from Scripts.Camera.raptor_ninox640II import RaptorNinox640II
-from Scripts.ToolboxGUI import ToolboxGUI
-
-#TODO: Regler bug avec l'histogramme qui freeze
+from Scripts.Camera.frame_mailbox import FrameMailbox
+from Scripts.Camera.frame_pool import FramePoolError
+from Scripts.Camera.raptor_ninox640II import RaptorNinox640II, RaptorNinox640IIError
+from Scripts.PictureTreatment.dark_frame import MasterDark
+from Scripts.PictureTreatment.display_renderer import DisplayRenderer
+from Scripts.PictureTreatment.frame_averager import FrameAverager
+from Scripts.PictureTreatment.histogram_engine import HistogramEngine
+from Scripts.PictureTreatment.treatment_pipeline import TreatmentPipeline
+from Scripts.Storage.snapshot_writer import SnapshotWriter
+from Scripts.Translation_stage.stage_state_poller import StageStatePoller
 
 class PictureThread(QThread):
     """
     Ask the camera to take a picture and save it in an array, every X sec (=exposure time).
+    In live mode, take each new frame completed by the frame grabber: the frame rate is limited by the exposure only.
+    The frames are put in the mailbox, the GUI takes the newest one when it's notified by picture_changed.
     """
-    picture_changed = pyqtSignal()
+    picture_changed = pyqtSignal()  # A frame is waiting in the mailbox
+    ERROR_SLEEP = 500  # in ms, before capturing again after an error of the camera
 
-    def __init__(self, raptor_ninox640II: RaptorNinox640II, frame_sleep):
+    def __init__(self, raptor_ninox640II: RaptorNinox640II, frame_sleep, mailbox: FrameMailbox):
         super().__init__()
         self.raptor = raptor_ninox640II
         self.frame_sleep = frame_sleep  # in seconds
+        self.mailbox = mailbox
+
+    def put_frame(self):
+        """
+        Capture a frame, notify the GUI only if it has already taken the previous one
+        """
+        if self.mailbox.put(self.raptor.capture_frame()):
+            self.picture_changed.emit()
 
     def run(self):
         """
         Loop of the thread : take a picture + save it every X sec
         """
         while True:
-            self.raptor.capture_img()
-            self.picture_changed.emit()
-            self.msleep(self.frame_sleep)
+            try:
+                if self.raptor.live:
+                    # Wait the next frame of the frame grabber, check again the mode if timeout
+                    if not self.raptor.wait_new_frame(self.raptor.frame_sequence):
+                        continue
+                    self.put_frame()
+                else:
+                    self.put_frame()
+                    self.msleep(self.frame_sleep)
+            except (RaptorNinox640IIError, FramePoolError) as e:
+                # Ex: all the buffers of the pool held by a scan, a snap failed: the display continues after
+                self.raptor.logger.error(f"Picture of the display not captured: {e}")
+                self.msleep(self.ERROR_SLEEP)
 
 
 class CameraPictureWidget(QWidget):
@@ -50,6 +79,7 @@ class CameraPictureWidget(QWidget):
         super().__init__()
         self._raptor = CameraInterface()
         self.frame_sleep = int(100/3)  # 30 Hz by default
+        self.exposure: Optional[float] = None  # Exposure sent to the camera in seconds, None in auto exposure
 
         #region camera picture size constraints
         self.img_label = QLabel()
@@ -73,17 +103,24 @@ class CameraPictureWidget(QWidget):
         self.overlay_image = None
 
         self.subtract_image_check = False
-        self.subtract_image_list = []
-
-        self.frame_average_list = None
+        # Dark frames combined into the master dark subtracted from the frames
+        self.master_dark = MasterDark()
+        # Image treatments imported by the user, applied out of the GUI thread
+        self.treatment_pipeline = TreatmentPipeline(budget=0.1)
+        # Raw pictures saved on the disk out of the GUI thread
+        self.snapshot_writer = SnapshotWriter()
+
+        self.frame_averager = FrameAverager(max_frame_average=10)
         self.frame_average_check = False
-        self.max_frame_average = 10
-        self.max_value_pixel = 65535
+        # Levels, gamma and colormap of the display, set by the sliders
+        self.display_renderer = DisplayRenderer(self._raptor.width, self._raptor.height)
 
         # Overlay crosshair
         self.crosshair_visible = False
         self.crosshair_color = Qt.GlobalColor.yellow
 
+        # Only the newest frame waits for the display, the frames not displayed in time are dropped
+        self.frame_mailbox = FrameMailbox(self._raptor.release_frame)
         self._thread = None
         self.launch_thread()
 
@@ -101,19 +138,63 @@ class CameraPictureWidget(QWidget):
 
     def slider_level_layout(self) -> QVBoxLayout:
         """
-        Create a slider to adjust the contrast of the picture
+        Create the sliders to adjust the contrast of the picture (min and max levels), the gamma and the colormap
         """
+        self.min_slider = QSlider(Qt.Orientation.Vertical)
+        self.min_slider.setRange(0, 65535)
+        self.min_slider.setValue(0)
+        self.min_slider.valueChanged.connect(self.change_min_pixel_level)
+
         self.slider = QSlider(Qt.Orientation.Vertical)
         self.slider.setRange(0, 65535)
         self.slider.setValue(65535)
         self.slider.valueChanged.connect(self.change_max_pixel_level)
+
+        layout_sliders = QHBoxLayout()
+        layout_sliders.addWidget(self.min_slider)
+        layout_sliders.addWidget(self.slider)
+
+        self.gamma_spin_box = QDoubleSpinBox()
+        self.gamma_spin_box.setPrefix("γ ")
+        self.gamma_spin_box.setRange(0.1, 5)
+        self.gamma_spin_box.setSingleStep(0.1)
+        self.gamma_spin_box.setValue(1)
+        self.gamma_spin_box.valueChanged.connect(self.change_gamma)
+
+        self.colormap_combo_box = QComboBox()
+        self.colormap_combo_box.addItems(DisplayRenderer.COLORMAPS)
+        self.colormap_combo_box.currentTextChanged.connect(self.change_colormap)
+
         layout = QVBoxLayout()
-        layout.addWidget(self.slider)
+        layout.addLayout(layout_sliders)
+        layout.addWidget(self.gamma_spin_box)
+        layout.addWidget(self.colormap_combo_box)
         return layout
 
+    @property
+    def max_frame_average(self) -> int:
+        return self.frame_averager.max_frame_average
+
+    @max_frame_average.setter
+    def max_frame_average(self, value: int):
+        self.frame_averager.max_frame_average = value
+
+    @property
+    def max_value_pixel(self) -> int:
+        return self.display_renderer.max_value
+
     def change_max_pixel_level(self, value):
-        self.max_value_pixel = value
-        self.frame_average_list = None
+        # Only the lookup table of the display changes, the frames and the average are not modified
+        self.display_renderer.set_levels(min(self.display_renderer.min_value, value - 1), value)
+
+    def change_min_pixel_level(self, value):
+        self.display_renderer.set_levels(value, max(self.display_renderer.max_value, value + 1))
+
+    def change_gamma(self, value: float):
+        self.display_renderer.gamma = value
+
+    def change_colormap(self, name: str):
+        self.display_renderer.colormap = name
 
     def histogram_layout(self):
         """
@@ -142,35 +223,54 @@ class CameraPictureWidget(QWidget):
 
         histogram_widget.addItem(self.hist_lut)
 
+        # The histogram is computed out of the GUI thread, at most 5 times by second
+        self.histogram_engine = HistogramEngine(rate=5)
+        self.histogram_engine.histogram_changed.connect(self.update_histogram)
+        self.histogram_engine.start()
+
         layout = QVBoxLayout()
         layout.addWidget(histogram_widget)
         return layout
 
 
+    @pyqtSlot(object, object)
+    def update_histogram(self, levels: np.ndarray, counts: np.ndarray):
+        """
+        Show the histogram computed by the histogram engine
+        """
+        self.hist_lut.plot.setData(levels, counts)
+
     @pyqtSlot()
+    def display_frame(self):
+        """
+        Display the newest frame of the picture thread and give it back to the frame pool of the camera
+        """
+        frame = self.frame_mailbox.take()
+        if frame is None:
+            return
+        try:
+            self.load_image(frame)
+        finally:
+            self._raptor.release_frame(frame)
+
     def load_image(self, array_picture: np.ndarray):
         """
         Display the new image that the camera has saved.
         """
-        # Set the array to show the histogram
-        self.hist_lut.setImageItem(pg.ImageItem(np.stack([array_picture, array_picture])))
+        # Give the array to the histogram engine, only a subsample is copied when a histogram is due
+        self.histogram_engine.submit(array_picture)
 
         # Change the picture compared to the state of the picture treatment set
         array_picture = self.apply_treatment_picture(array_picture)
 
-        # .mirrored to flip the picture vertical
-        # camera_width*8 give bytes per line (lines*uint16*4(RGBA))
-        array_img = QImage(array_picture, self._raptor.width, self._raptor.height, self._raptor.width*8,
-                           QImage.Format.Format_RGBX64).mirrored(False, True)
-        # Crop 2px border to delete black border
-        img = QPixmap.fromImage(array_img).copy(2, 2, 638, 510)
-        # Scaled the picture compared of the GUI
-        smaller_img = img.scaled(self.img_label.size(), Qt.AspectRatioMode.KeepAspectRatio,
-                                 Qt.TransformationMode.SmoothTransformation)
+        # Flip, crop of the 2px black border, levels and scale to the size of the GUI
+        # The pixels upper than the max level set by the slider are white
+        overlay = self.overlay_image if self.overlay_image_check else None
+        smaller_img = self.display_renderer.render(array_picture, self.img_label.size(), overlay)
 
         smaller_img = self.draw_crosshair(smaller_img)
 
-        self.img_label.setPixmap(smaller_img)  # Crop the 2 black pixel border
+        self.img_label.setPixmap(smaller_img)
 
     #region Picture treatment
 
@@ -179,48 +279,22 @@ class CameraPictureWidget(QWidget):
         """
         Apply treatment picture depends on set in the GUI
         :param array_picture: image capture by the camera
-        :return: image capture with treatment set
+        :return: image capture with treatment set, in 16 bits
         """
-        # If the value of a pixel is uppermore than the max_value set, set it to a white pixel
-        # Handle the value by the slider in the picture widget
-        array_picture[array_picture > self.max_value_pixel] = 65535
-
-        if self.subtract_image_check and self.frame_average_check:
+        if self.frame_average_check:
             array_picture = self.frame_average_calculation(array_picture)
-            for subtract_picture in self.subtract_image_list:
-                # Turn the dtype to int16 to have negative value
-                # If keep the dtype to unit16, negative value will return an overflow, so near 65000
-                # Can use uint16 because the camera is on 14 data bits
-                array_picture = np.subtract(array_picture, subtract_picture, dtype=np.int32)
-                # If values are negative, put it at 0
-                array_picture = np.clip(array_picture, 0, None)
-
-            # Return in uint16 to avoid bug with overlay mode
-            array_picture = array_picture.astype(dtype=np.uint16)
-        else:
-            if self.subtract_image_check:
-                for subtract_picture in self.subtract_image_list:
-                    # Turn the dtype to int16 to have negative value
-                    # If keep the dtype to unit16, negative value will return an overflow, so near 65000
-                    # Can use uint16 because the camera is on 14 data bits
-                    array_picture = np.subtract(array_picture, subtract_picture, dtype=np.int32)
-                    # If values are negative, put it at 0
-                    array_picture = np.clip(array_picture, 0, None)
-
-                # Return in uint16 to avoid bug with overlay mode
-                array_picture = array_picture.astype(dtype=np.uint16)
-
-            if self.frame_average_check:
-                array_picture = self.frame_average_calculation(array_picture)
-
-        if self.overlay_image_check:
-            # Apply in the red and green section of the array the overlay picture pixels
-            array_picture = np.stack([array_picture, array_picture, self.overlay_image, array_picture], axis=-1)
-        else:
-            # Create a 2D array to split R, G, B and A
-            # axis = -1 to stack to the last axis
-            array_picture = np.stack([array_picture, array_picture, array_picture, array_picture], axis=-1)\
-                .astype(np.uint16)
+
+        if self.subtract_image_check:
+            # Saturating subtraction of the master dark: negative values are put at 0
+            array_picture = self.master_dark.subtract(array_picture)
+
+        if self.treatment_pipeline.active:
+            # Never wait for the treatments: the frame is treated if a worker is free
+            # and the last frame treated is displayed
+            self.treatment_pipeline.submit(array_picture)
+            treated_picture = self.treatment_pipeline.result()
+            if treated_picture is not None:
+                array_picture = treated_picture
 
         return array_picture
 
@@ -230,29 +304,15 @@ class CameraPictureWidget(QWidget):
         :param array_picture: New picture take by the camera
         :return: The average of all pictures stored depending on the length set in the GUI
         """
-        if not array_picture.shape == (640, 512):
+        if not array_picture.shape == self.frame_averager.frame_shape:
             return array_picture
 
-        # Create a 3D array to concatenate with an existing 3D array
-        array_picture_3D = np.expand_dims(array_picture, axis=0)
-
-        if self.frame_average_list is None:
-            self.frame_average_list = array_picture_3D
-            return self.frame_average_list
-
-        # Prevent bug when decrease the value of max_frame_average
-        while self.frame_average_list.shape[0] > self.max_frame_average:
-            # Delete the last element put in the array
-            self.frame_average_list = self.frame_average_list[1:]
-
-        # Add the new array picture to the list
-        self.frame_average_list = np.concatenate((self.frame_average_list, array_picture_3D), axis=0)
+        # Add the new picture to the running sum, the cost doesn't depend on the number of frames averaged
+        average = self.frame_averager.add(array_picture)
 
         # Emit that a picture is taking in the frame averaging system to actualize widget of the camera
         self.frame_average_picture_take.emit()
-        # Calculate the average of the array
-        # axis = 0 for calculates the mean of each lines
-        return np.mean(self.frame_average_list, axis=0).astype(np.uint16)
+        return average
 
     def draw_crosshair(self, pixmap: QPixmap) -> QPixmap:
         """
@@ -319,16 +379,63 @@ class CameraPictureWidget(QWidget):
             if button == QMessageBox.StandardButton.No:
                 return None
 
-        ToolboxGUI.wait_axis_moving(self)
-
         picture = self.img_label.pixmap()
-        if picture:
-            picture.save(picture_path)
-
-        ToolboxGUI.wait_file_is_creating(self, picture_path)
+        # QPixmap.save returns once the file is written
+        if picture and not picture.save(picture_path):
+            return None
 
         return picture
 
+    def save_snapshot(self, file_name: str, folder_name: str, extension: str = SnapshotWriter.TIFF) -> Optional[Future]:
+        """
+        Save in file explorer the raw 16 bits picture of the camera in full resolution, with its metadata.
+        The picture is written by a background thread, the live view continues during the writing.
+        :param extension: SnapshotWriter.TIFF or SnapshotWriter.NPY
+        :return: Future of the path of the file written, None if the user cancel
+        """
+        picture_path = self.folder_path(folder_name) + "/{}".format(file_name + extension)
+
+        # Check if the file already exist
+        if os.path.isfile(picture_path):
+            button = QMessageBox.warning(
+                self,
+                "Save warning",
+                f"{file_name} already exist, do you want to overwrite it ?",
+                buttons=QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No,
+                defaultButton=QMessageBox.StandardButton.Yes
+            )
+            if button == QMessageBox.StandardButton.No:
+                return None
+
+        # The GUI doesn't wait for the end of a move: the user takes the snapshot again after it
+        state = StageStatePoller().last_state(max_age=1)
+        if state is not None and state.is_moving:
+            QMessageBox.warning(self, "Save warning", "The stage is moving, take the picture at the end of the move")
+            return None
+
+        frame = self.capture_img()
+        # Lines of the sensor in the order of the display, the black border is kept
+        picture = frame.reshape(self._raptor.height, self._raptor.width)[::-1]
+        return self.snapshot_writer.submit(picture, picture_path, self.snapshot_metadata())
+
+    def snapshot_metadata(self) -> dict:
+        """
+        :return: Settings of the acquisition known by the GUI, without asking the camera
+        """
+        metadata = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "exposure_ms": self.exposure * 1000 if self.exposure is not None else None,
+            "frame_average": self.frame_averager.count if self.frame_average_check else 1,
+            "border": self.display_renderer.border,
+            "display_levels": [self.display_renderer.min_value, self.display_renderer.max_value],
+        }
+        state = StageStatePoller().last_state(max_age=1)
+        if state is not None:
+            position = state.position
+            metadata["stage_position"] = {"x": position.x, "y": position.y, "z": position.z}
+            metadata["stage_moving"] = state.is_moving
+        return metadata
+
     def remove_folder_files(self, folder_name: str):
         # Get all files in the folder
         folder_path = self.folder_path(folder_name)
@@ -346,13 +453,14 @@ class CameraPictureWidget(QWidget):
 
     def capture_img(self) -> np.ndarray:
         """
-        :return: Array show in the GUI
+        :return: Array show in the GUI, exposed after the call without frame averaging
         """
         if self.frame_average_check:
             # Get the frame average show
-            picture = np.mean(self.frame_average_list, axis=0).astype(np.uint16)
+            picture = self.frame_averager.average()
         else:
-            picture = self._raptor.capture_img()
+            # Single picture: the last frame of the live acquisition can be exposed before the call
+            picture = self._raptor.capture_img(fresh=True, timeout=self._raptor.frame_timeout(self.exposure))
 
         if picture is None:
             QMessageBox.critical(self, "Save picture error", "Error during capture image of the camera")
@@ -373,9 +481,16 @@ class CameraPictureWidget(QWidget):
         """
         Start the thread to display picture
         """
-        self._thread = PictureThread(self._raptor, self.frame_sleep)
+        if not self._raptor.live:
+            try:
+                self._raptor.start_live()
+            except RaptorNinox640IIError as e:
+                # Keep the snap of each picture
+                self._raptor.logger.error(f"Live acquisition not available: {e}")
+
+        self._thread = PictureThread(self._raptor, self.frame_sleep, self.frame_mailbox)
         # Connect the signal to the function -> display the pic
-        self._thread.picture_changed.connect(lambda: self.load_image(self._raptor.last_img))
+        self._thread.picture_changed.connect(self.display_frame)
         self._thread.start()
 
     def actualize_frame_rate(self):
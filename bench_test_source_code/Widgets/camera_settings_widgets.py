@@ -4,7 +4,8 @@ from PyQt6.QtCore import QThread, pyqtSignal, Qt, QSettings
 from PyQt6.QtWidgets import QWidget, QVBoxLayout, QPushButton, QHBoxLayout, QLabel, QSpinBox, QRadioButton, \
     QApplication, QMainWindow, QLineEdit, QSlider, QMessageBox
 
-from Scripts.Translation_stage.translation_stage_interface import TranslationStageInterface
+from Scripts.Translation_stage.stage_state_poller import StageStatePoller
+from Scripts.Translation_stage.translation_stage_pi import StageState
 from Scripts.Widgets.CustomWidget.QLineEdit import ValueWithUnitInputWidget
 
 from Scripts.Camera.camera_interface import CameraInterface
@@ -28,33 +29,6 @@ class TecTempThread(QThread):
             self.temp_value_changed.emit(tec, temp_pcb)
             self.msleep(250)  # Sleep for 250 milliseconds
 
-class CheckAxisMovingThread(QThread):
-    """
-    Check if the axis moving
-    -> Use for frame averaging
-    """
-    axis_moving = pyqtSignal()
-
-    def __init__(self, camera_settings):
-        super().__init__()
-        self.translation_pi = TranslationStageInterface()
-        self.camera_settings: CameraSettings = camera_settings
-        self.camera_settings.timeValueChanged.connect(self.set_wait_time)
-        self.wait_time: int = 500
-
-    def run(self):
-        while True:
-            if self.translation_pi.is_any_axis_moving():
-                self.axis_moving.emit()
-            self.msleep(self.wait_time)
-
-
-    def set_wait_time(self, time: float):
-        """
-        Wait checking connected to the frame rate of the camera
-        """
-        self.wait_time = int(time*1000)
-
 #TODO: Mettre un logo check pour save les settings
 #TODO: Récupérer la valeur du slider du cameraPicture dans le save setting
 
@@ -107,10 +81,10 @@ class CameraSettings(QWidget):
         self.temp_thread.temp_value_changed.connect(self.update_tec_temp)  # Connect signal-> to function-> display the values
         self.temp_thread.start()
 
-        # Thread to reset frame average if axis moving
-        self.check_axis_thread = CheckAxisMovingThread(self)
-        self.check_axis_thread.axis_moving.connect(self.reset_frame_average)
-        self.check_axis_thread.start()
+        # Reset frame average if axis moving
+        self.stage_poller = StageStatePoller()
+        self.stage_poller.state_changed.connect(self.stage_state_changed)
+        self.stage_poller.start()
 
         self.exposure_changed()
 
@@ -285,11 +259,15 @@ class CameraSettings(QWidget):
 
         self.actualize_frame_average_label()
 
+    def stage_state_changed(self, state: StageState):
+        if state.is_moving:
+            self.reset_frame_average()
+
     def reset_frame_average(self):
         # Reset the frame average counter
         self.frame_average_counter = 0
-        # Reset the array stored previously
-        self._picture_widget.frame_average_list = None
+        # Reset the frames stored previously
+        self._picture_widget.frame_averager.reset()
         # Set the new value to the label
         self.actualize_frame_average_label()
 
@@ -348,9 +326,11 @@ class CameraSettings(QWidget):
         Update the TEC Setpoint value when the value inside the QSpinbox is changed
         """
         self.val_tec_setpoint = self.tec_set_point.text()
-        tec_mode = self._raptor.tec_activation
-        if tec_mode == 1:  # if TEC is enabled then -> send the new value
-            self._raptor.tec = int(self.val_tec_setpoint[:-2])
+        # Read the TEC mode and send the value without command of another thread between
+        with self._raptor.transaction():
+            tec_mode = self._raptor.tec_activation
+            if tec_mode == 1:  # if TEC is enabled then -> send the new value
+                self._raptor.tec = int(self.val_tec_setpoint[:-2])
 
     def tec_button_toggled(self, checked: bool):
         """
@@ -424,6 +404,8 @@ class CameraSettings(QWidget):
             exposure_value = round(value*0.9, 9)
 
             self._raptor.exposure = exposure_value
+            # Known by the picture widget without reading the register of the camera
+            self._picture_widget.exposure = exposure_value
 
     def auto_button_toggled(self, checked: bool):
         """
@@ -434,6 +416,7 @@ class CameraSettings(QWidget):
         if self.auto_exp_val:
             self.gain_slider.setEnabled(False)
             self._raptor.auto_exposure = 1
+            self._picture_widget.exposure = None  # Chosen by the camera
             self.frame_rate_val.setText("Auto Exposure Value")  # Change the text of the QLabel
         else:
             self.gain_slider.setEnabled(True)
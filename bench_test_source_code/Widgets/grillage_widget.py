@@ -2,21 +2,28 @@ import os
 import re
 import sys
 import time
-from typing import List, Union
 
 import numpy as np
 from dataclasses import dataclass
 from PIL import Image
 
 from PyQt6.QtCore import QThread, pyqtSignal, Qt, QTimer, QEventLoop, QDir, QSettings
-from PyQt6.QtGui import QIcon, QImage, QPixmap
+from PyQt6.QtGui import QIcon
 from PyQt6.QtWidgets import QWidget, QVBoxLayout, QPushButton, QHBoxLayout, QLabel, QSpinBox, QRadioButton, \
     QApplication, QMainWindow, QLineEdit, QSlider, QComboBox, QMessageBox, QStyle, QFileDialog, QInputDialog
 from toolbox3.geometry.point import Point3D, Point2D
 
 from Scripts.Camera.camera_interface import CameraInterface
+from Scripts.Camera.frame_pool import FramePoolError
+from Scripts.Scan.fly_scan import FlyScan, FlyScanError
+from Scripts.Scan.scan_executor import ScanExecutor, ScanExecutorError
+from Scripts.Scan.scan_planner import ScanTile, grid_tiles, order_tiles, travel, ORDERS, SERPENTINE
+from Scripts.Storage.mosaic import Mosaic
 from Scripts.ToolboxGUI import ToolboxGUI
+from Scripts.Translation_stage.motion_future import MotionTimeoutError
+from Scripts.Translation_stage.stage_state_poller import StageStatePoller
 from Scripts.Translation_stage.translation_stage_interface import TranslationStageInterface
+from Scripts.Translation_stage.translation_stage_pi import TranslationStageError
 
 from Scripts.Widgets.camera_picture_widget import CameraPictureWidget
 from Scripts.Widgets.position_widget import GetPosWidget
@@ -30,6 +37,9 @@ Y: 2.95 = 512px
 
 # CHIP POS : 16, 28, 28.8
 
+# Bigger mosaics are saved without being opened in the picture viewer
+MAX_SHOWN_PIXELS = 100_000_000
+
 @dataclass
 class PlanValues:
     """
@@ -112,6 +122,8 @@ class GrillageWidget(QWidget):
         # Initial value for 2.5x zoom, so not const
         self.x_camera_length: float = 3.9
         self.y_camera_length: float = 3.1
+        self.scan_order = SERPENTINE
+        self.fly_scan = False
 
         # Répétition dans picture_settings_widget -> Peut etre trouver une méthode pour éviter cela
         os_style = self.style()
@@ -144,7 +156,7 @@ class GrillageWidget(QWidget):
 
         # DEBUG
         btn_debug = QPushButton("DEBUG")
-        btn_debug.clicked.connect(lambda: self.save_big_picture_array(self.take_treat_camera_array()))
+        btn_debug.clicked.connect(lambda: self.save_big_picture_array(self.take_treat_camera_mosaic()))
         layout.addWidget(btn_debug)
 
         self.setLayout(layout)
@@ -229,11 +241,17 @@ class GrillageWidget(QWidget):
                 QMessageBox.warning(self, "Set Landmark Error", "Axis need to be init to get landmark position")
                 return
 
-            if self._translation_stage.is_any_axis_moving():
+            # Position and motion status of the same reading
+            state = StageStatePoller().last_state(max_age=1)
+            if state is None:
+                QMessageBox.warning(self, "Set Landmark Error", "The position of the axis is not available")
+                return
+
+            if state.is_moving:
                 QMessageBox.warning(self, "Set Landmark Error", "Can't get the position during axis moving")
                 return
 
-            pos = self._pos
+            pos = state.position
             label_capture.setText(
                 "Landmark {0} position: {1:.2f}, {2:.2f}, {3:.2f}".format(landmark, pos.x, pos.y, pos.z))
             self.landmark_position[str(landmark)] = pos
@@ -332,10 +350,30 @@ class GrillageWidget(QWidget):
         self.save_file_button.setEnabled(False)
         self.save_file_button.clicked.connect(self.start_chip_picture_thread)
 
+        # Order of the tiles: serpentine doesn't come back to the first column at each row
+        scan_order_dropdown = QComboBox()
+        scan_order_dropdown.addItems(ORDERS)
+        scan_order_dropdown.setCurrentText(self.scan_order)
+        scan_order_dropdown.currentTextChanged.connect(self.set_scan_order)
+
+        # Capture with the stage in motion, for the short exposures
+        fly_scan_button = QPushButton("Fly scan")
+        fly_scan_button.setCheckable(True)
+        fly_scan_button.clicked.connect(self.set_fly_scan)
+
         layout = QHBoxLayout()
         layout.addWidget(self.save_file_button)
+        layout.addWidget(QLabel("Scan order: "))
+        layout.addWidget(scan_order_dropdown)
+        layout.addWidget(fly_scan_button)
         return layout
 
+    def set_fly_scan(self, checked: bool):
+        self.fly_scan = checked
+
+    def set_scan_order(self, order: str):
+        self.scan_order = order
+
     #region thread_manager
     def start_chip_picture_thread(self):
         """
@@ -387,7 +425,16 @@ class GrillageWidget(QWidget):
                                                             "Can't take picture as long as the joystick is activated")
             return
 
-        self._perform_chip_mapping_capture()
+        if self.fly_scan and not self._raptor.live:
+            self.take_chip_picture_thread.show_warning.emit("Fly scan error",
+                                                            "The fly scan needs the live acquisition of the camera")
+            return
+
+        try:
+            self._perform_chip_mapping_capture()
+        except MotionTimeoutError as e:
+            # The thread ends normally: the main window is enabled again
+            self.take_chip_picture_thread.show_warning.emit("Timeout error", f"The stage didn't reach the picture: {e}")
 
         # Emit from the thread that the chip has been captured to stop the thread -> turn on the main window and save picture
         self.take_chip_picture_thread.finished_successfully.emit()
@@ -421,47 +468,47 @@ class GrillageWidget(QWidget):
             self._capture_single_picture(delta_x, delta_y)
 
     def _capture_xy_grid(self, step_move_x, step_move_y):
-        big_picture_array = None
         # Start at the middle of the left corner
-        start_pos_x = self.plan_values.x_max - self.x_camera_length / 2
-        start_pos_y = self.plan_values.y_max - self.y_camera_length / 2
-
-        picture_number = 0
+        origin = Point3D(self.plan_values.x_max - self.x_camera_length / 2,
+                         self.plan_values.y_max - self.y_camera_length / 2, self._pos.z)
 
-        png_picture_list = []
+        # Each tile is the raw frame of the camera, cropped and flipped like the display
+        renderer = self._camera_picture_widget.display_renderer
+        # Memory-mapped in the draft folder: a scan of thousands of tiles doesn't need to fit in memory
+        mosaic_path = os.path.join(self._camera_picture_widget.folder_path("PictureDraft"), "mosaic.npy")
+        mosaic = None
 
         print("Start move ts")
-
-        for i in range(step_move_y):
-            for j in range(step_move_x):
-                picture_number += 1
-
-                pos_x = start_pos_x - j * self.x_camera_length
-                pos_y = start_pos_y - i * self.y_camera_length
-
-                self._translation_stage.move_absolute(Point3D(pos_x, pos_y, self._pos.z))
-
-                picture = self._camera_picture_widget.save_pixmap_picture_folder(
-                    f"PictureDraft_{picture_number}", "PictureDraft")
-
-                if picture is None:
-                    QMessageBox.critical(
-                        self,
-                        "Save picture draft",
-                        f"There is an error during the# saving of the picture draft of 'PictureDraft_{picture_number}'"
-                    )
-
-                png_picture_list.append(picture)
-
-        print("Finish move ts")
-
-        big_picture_array = self._concatenate_png_picture(png_picture_list, step_move_x, step_move_y)
-
-        if big_picture_array is None:
-            print("ERROR: Failed to concatenate PNG files")
-            return
-
-        self.save_big_picture_array(big_picture_array)
+        try:
+            # In the try: a full disk must give a warning, not end the thread with the window disabled
+            mosaic = Mosaic(step_move_y, step_move_x, (renderer.height, renderer.width), path=mosaic_path)
+            if self.fly_scan:
+                # Exposure of the camera in seconds: register counts of 25 ns
+                exposure = self._raptor.exposure / 40e6
+                report = FlyScan(self._translation_stage, self._raptor, mosaic, renderer, exposure).run(
+                    origin, -self.x_camera_length, -self.y_camera_length)
+            else:
+                tiles = grid_tiles(origin, -self.x_camera_length, -self.y_camera_length, step_move_y, step_move_x)
+                velocity, acceleration = self._translation_stage.get_motion_parameters()
+                tiles = order_tiles(tiles, self.scan_order, self._pos, velocity, acceleration)
+                distance, duration = travel(tiles, self._pos, velocity, acceleration)
+                print(f"Scan order {self.scan_order}: {distance:.1f} mm, {duration:.1f} s of moves estimated")
+
+                def place_tile(tile: ScanTile, frame: np.ndarray):
+                    mosaic.place(tile.row, tile.col, renderer.view(frame))
+
+                # The stage moves to the next tile during the placing of the previous one
+                report = ScanExecutor(self._translation_stage, self._raptor, place_tile).run(tiles)
+            print(f"Finish move ts: {report}")
+
+            self.save_big_picture_array(mosaic)
+        except (ScanExecutorError, FlyScanError, MotionTimeoutError, FramePoolError, TranslationStageError,
+                ValueError, OSError) as e:
+            # The thread ends normally: the main window is enabled again
+            self.take_chip_picture_thread.show_warning.emit("Chip mapping error", f"The scan of the chip failed: {e}")
+        finally:
+            if mosaic is not None:
+                mosaic.close()
 
     def _capture_horizontal_grid(self, step_move_x, delta_y):
         start_pos_x = self.plan_values.x_max - self.x_camera_length / 2
@@ -470,7 +517,7 @@ class GrillageWidget(QWidget):
 
         for i in range(step_move_x + 1):
             self._translation_stage.move_absolute(
-                Point3D(start_pos_x - i * self.x_camera_length, start_pos_y, self._pos.z))
+                Point3D(start_pos_x - i * self.x_camera_length, start_pos_y, self._pos.z)).result()
 
             self._camera_picture_widget.save_pixmap_picture_folder(
                 f"Picture_x_{i}", "PictureDraft")
@@ -482,7 +529,7 @@ class GrillageWidget(QWidget):
 
         for i in range(step_move_y + 1):
             self._translation_stage.move_absolute(
-                Point3D(start_pos_x, start_pos_y - i * self.y_camera_length, self._pos.z))
+                Point3D(start_pos_x, start_pos_y - i * self.y_camera_length, self._pos.z)).result()
 
             self._camera_picture_widget.save_pixmap_picture_folder(
                 f"Picture_y_{i}", "PictureDraft")
@@ -493,110 +540,32 @@ class GrillageWidget(QWidget):
         start_pos_y = self.plan_values.y_min + delta_y / 2
 
         self._translation_stage.move_absolute(
-            Point3D(start_pos_x, start_pos_y, self._pos.z))
+            Point3D(start_pos_x, start_pos_y, self._pos.z)).result()
 
         self._camera_picture_widget.save_pixmap_picture_folder(
             f"Picture_single", "PictureDraft")
     # endregion
 
-    def _concatenate_png_picture(self, png_list: List[QPixmap], cols: int, rows: int) -> Union[np.ndarray, None]:
-        """
-        Concatenate all the png in a list to create a big picture
-        :param png_list: The list of the png to concatenate
-        :param cols: Number of columns take
-        :param rows: Number of rows take
-        """
-        print("Start to concatenate")
-        try:
-            if len(png_list) != cols*rows:
-                QMessageBox.critical(
-                    self,
-                    "Concatenate PNG pictures error",
-                    "Error in the size of the list compared of the rows and the columns"
-                )
-                return None
-
-            images_list: List[np.ndarray] = []
-            for png in png_list:
-                image = png.toImage().convertToFormat(QImage.Format.Format_RGBX64)
-
-                # Get raw bytes from the image
-                ptr = image.constBits()
-                ptr.setsize(image.sizeInBytes())
-
-                arr = np.frombuffer(ptr, dtype=np.uint16).reshape(image.height(), image.width(), 4)
-                images_list.append(arr)
-
-            # Check if all files have the same shape
-            reference_shape = images_list[0].shape
-            for i, img in enumerate(images_list):
-                if img.shape != reference_shape:
-                    print(f"ERROR : Image {i} has a different shape: {img.shape} vs {reference_shape}")
-                    return None
-
-            # Concatenation of all pictures
-            print("Start assembling picture")
-
-            big_picture_array = None
-            img_index = 0
-
-            for row in range(rows):
-                # Create a new reference
-                temp_array = images_list[img_index].copy()
-                img_index += 1
-
-                for col in range(1, cols):
-                    next_image = images_list[img_index]
-                    img_index += 1
-
-                    #Concatenate horizontally (axis=1) the arrays
-                    temp_array = np.concatenate((temp_array, next_image), axis=1)
-
-                # At the end of concatenate a new line
-                if big_picture_array is None:
-                    big_picture_array = temp_array
-                else:
-                    #Concatenate vertically (axis=0) the arrays
-                    big_picture_array = np.concatenate((big_picture_array, temp_array), axis=0)
-
-            print("Finish assembling picture")
-
-            return big_picture_array
-
-
-        except Exception as e:
-            print(f"Error during concatenation of png picture: {e}")
-            return None
-
-
-
-    def _convert_pixmap_to_array(self, pixmap: QPixmap):
-        image = pixmap.toImage().convertToFormat(QImage.Format.Format_RGBX64)
-
-        # Get raw bytes from the image
-        ptr = image.constBits()
-        ptr.setsize(image.sizeInBytes())
-
-        arr = np.frombuffer(ptr, dtype=np.uint16).reshape(image.height(), image.width(), 4)
-
-        return arr
-
-
     def take_treat_camera_array(self) -> np.ndarray:
         return self._camera_picture_widget.apply_treatment_picture(self._raptor.capture_img())
 
-    def save_big_picture_array(self, big_array: np.ndarray):
+    def take_treat_camera_mosaic(self) -> Mosaic:
         """
-        Save the big array into a path give by the user
+        :return: Mosaic of one tile, the picture of the camera with the picture treatments
+        """
+        renderer = self._camera_picture_widget.display_renderer
+        mosaic = Mosaic(1, 1, (renderer.height, renderer.width))
+        mosaic.place(0, 0, renderer.view(self.take_treat_camera_array()))
+        return mosaic
+
+    def save_big_picture_array(self, mosaic: Mosaic):
+        """
+        Save the mosaic into a path give by the user
         """
         try:
-            if not self._check_big_array(big_array):
+            if not self._check_big_array(mosaic.array):
                 return
 
-            big_array_8bit = (big_array / 65535.0 * 255.0).astype(np.uint8)
-
-            img = Image.fromarray(big_array_8bit, mode='RGBA')
-
             name_file = self.take_chip_picture_thread.get_user_input()
 
             picture_path = self.picture_folder_path(name_file)
@@ -604,9 +573,11 @@ class GrillageWidget(QWidget):
             if picture_path == "":
                 return
 
-            if img:
-                img.save(picture_path)
-                img.show()
+            # 16 bits gray levels PNG, written by chunks of rows without loading the mosaic in memory
+            mosaic.export_png(picture_path)
+            # The viewer loads the whole picture in memory
+            if mosaic.array.size <= MAX_SHOWN_PIXELS:
+                Image.open(picture_path).show()
         except Exception as e:
             print(f"Save big picture array error : {e}")
 
@@ -618,8 +589,9 @@ class GrillageWidget(QWidget):
 
         shape = big_array.shape
 
-        # Verify the shape, the dimension - should be divisible by camera resolution
-        if len(shape) != 3 or shape[2] != 4 or not (shape[0] % 640 == 0 and shape[1] % 512 == 0):
+        renderer = self._camera_picture_widget.display_renderer
+        # Verify the shape, the dimension - should be divisible by the size of a tile
+        if len(shape) != 2 or not (shape[0] % renderer.height == 0 and shape[1] % renderer.width == 0):
             self.take_chip_picture_thread.show_warning.emit("Big chip picture",
                                                             f"Error: Array shape {shape} is not a valid image format")
             return False
@@ -2,15 +2,17 @@ import importlib.util
 import inspect
 import sys
 import types
+from concurrent.futures import Future
 from dataclasses import dataclass
 from typing import List
 
-from PyQt6.QtCore import QSettings, Qt
+from PyQt6.QtCore import QSettings, Qt, pyqtSignal
 from PyQt6.QtGui import QIcon
 from PyQt6.QtWidgets import QWidget, QVBoxLayout, QPushButton, QHBoxLayout, QApplication, QMainWindow, QMessageBox, \
-    QStyle, QFileDialog
+    QStyle, QFileDialog, QComboBox
 
 from Scripts.Camera.camera_interface import CameraInterface
+from Scripts.PictureTreatment.dark_frame import MasterDark
 from Scripts.ScriptInjectionExample.GoodTreatment import treatment_black
 from Scripts.ToolboxGUI import ToolboxGUI
 from Scripts.Widgets.CustomWidget.QCheckableComboBox import QCheckableComboBox, ImageTreatment
@@ -21,10 +23,13 @@ from Scripts.Widgets.grillage_widget import GrillageWidget
 #TODO: Permettre de soustraire autant d'images qu'on veut
 #TODO: Put the layout into a grid layout
 class PictureSettings(QWidget):
+    snapshot_saved = pyqtSignal(object)  # Future of the snapshot written
+
     def __init__(self, camera_picture_widget: CameraPictureWidget):
         super().__init__()
         self.raptor = CameraInterface()
         self.camera_picture_widget = camera_picture_widget
+        self.snapshot_saved.connect(self.snapshot_written)
 
         os_style = self.style()
         self.check_icon = os_style.standardIcon(QStyle.StandardPixmap.SP_DialogApplyButton)
@@ -75,22 +80,33 @@ class PictureSettings(QWidget):
         self.save_dark_image_button.clicked.connect(self.save_dark_picture)
 
         remove_last_image = QPushButton("Remove last image")
-        remove_last_image.clicked.connect(lambda: self.camera_picture_widget.subtract_image_list.pop())
+        remove_last_image.clicked.connect(self.remove_last_dark_image)
+
+        # Combination of the dark images into the master dark
+        self.dark_method_combo_box = QComboBox()
+        self.dark_method_combo_box.addItems(MasterDark.METHODS)
+        self.dark_method_combo_box.currentTextChanged.connect(self.dark_method_changed)
 
         layout = QHBoxLayout()
         # layout.setAlignment(Qt.AlignmentFlag.AlignLeft)
         layout.addWidget(self.save_dark_image_button)
         layout.addWidget(self.show_subtract_picture_button)
         layout.addWidget(remove_last_image)
+        layout.addWidget(self.dark_method_combo_box)
 
         return layout
 
     def remove_last_dark_image(self):
-        self.camera_picture_widget.subtract_image_list.pop()
+        self.camera_picture_widget.master_dark.pop()
+        if len(self.camera_picture_widget.master_dark) == 0:
+            self.save_dark_image_button.setIcon(QIcon(self.cancel_icon))
+
+    def dark_method_changed(self, method: str):
+        self.camera_picture_widget.master_dark.method = method
 
     def subtract_pictures(self, checked: bool):
         # If the subtract image is not set
-        if any(image is None for image in self.camera_picture_widget.subtract_image_list) :
+        if checked and len(self.camera_picture_widget.master_dark) == 0:
             self.show_subtract_picture_button.setChecked(False)
             QMessageBox.warning(self, "Picture error", "Subtract picture is not set !")
             return
@@ -112,12 +128,28 @@ class PictureSettings(QWidget):
 
     def save_dark_picture(self):
         # treatment_name = ToolboxGUI.ask_user_text(self)
-        self.camera_picture_widget.subtract_image_list.append(self.camera_picture_widget.capture_img())
+        try:
+            self.camera_picture_widget.master_dark.add(self.camera_picture_widget.capture_img())
+        except ValueError as e:
+            QMessageBox.warning(self, "Picture error", f"Dark image not added: {e}")
+            return
         self.save_dark_image_button.setIcon(QIcon(self.check_icon))
 
     def save_camera_picture(self):
         name_picture = ToolboxGUI.ask_user_text(self)
-        self.camera_picture_widget.save_pixmap_picture_folder(name_picture, "Picture")
+        # The user cancel or the name is not valid
+        if name_picture == "ERROR":
+            return
+
+        future = self.camera_picture_widget.save_snapshot(name_picture, "Picture")
+        if future is not None:
+            # The callback is called by the thread of the writer, the signal gives the result to the GUI thread
+            future.add_done_callback(self.snapshot_saved.emit)
+
+    def snapshot_written(self, future: Future):
+        if future.exception() is not None:
+            QMessageBox.critical(self, "Save picture error",
+                                 f"Error during the saving of the picture: {future.exception()}")
 
     #region dynamic script import
     def dynamic_picture_treatment_layout(self) -> QVBoxLayout:
@@ -132,9 +164,16 @@ class PictureSettings(QWidget):
 
         self.toggle_select_items = QCheckableComboBox()
         self.toggle_select_items.setMinimumWidth(250)
+        self.toggle_select_items.selection_changed.connect(self.selected_treatments_changed)
+
+        # Treatments in pure Python hold the GIL: run them in other processes to not slow down the GUI
+        self.process_treatment_button = QPushButton("Run in processes")
+        self.process_treatment_button.setCheckable(True)
+        self.process_treatment_button.clicked.connect(self.process_treatment_changed)
 
         choose_treatment_layout.addWidget(choose_script)
         choose_treatment_layout.addWidget(self.toggle_select_items)
+        choose_treatment_layout.addWidget(self.process_treatment_button)
 
         main_layout.addLayout(choose_treatment_layout)
         return main_layout
@@ -158,6 +197,16 @@ class PictureSettings(QWidget):
 
         self.toggle_select_items.add_items_from_dict(image_treatments)
 
+    def selected_treatments_changed(self, treatments: List[ImageTreatment]):
+        """
+        Apply the treatments selected to the pictures of the camera
+        """
+        self.camera_picture_widget.treatment_pipeline.set_treatments(
+            [(treatment.name, treatment.img_treatment) for treatment in treatments])
+
+    def process_treatment_changed(self, checked: bool):
+        self.camera_picture_widget.treatment_pipeline.set_process_mode(checked)
+
     def get_treatment_from_module(self, module_path: str) -> dict[str, types.FunctionType]:
         """
         Get all the function write in a .py file
@@ -194,8 +243,8 @@ class PictureSettings(QWidget):
         :param setting: the dictionary for this class
         """
         subtract_image = setting["SubtractImage"]
-        self.camera_picture_widget.subtract_image_list = subtract_image
-        if subtract_image is not None:
+        self.camera_picture_widget.master_dark.set_frames(subtract_image or [])
+        if subtract_image:
             self.save_dark_image_button.setIcon(QIcon(self.check_icon))
 
         overlay_image = setting["OverlayImage"]
@@ -208,7 +257,7 @@ class PictureSettings(QWidget):
         Save image for picture treatment
         """
         return {
-            "SubtractImage": self.camera_picture_widget.subtract_image_list,
+            "SubtractImage": list(self.camera_picture_widget.master_dark.frames),
             "OverlayImage": self.camera_picture_widget.overlay_image,
         }
 
@@ -1,22 +1,27 @@
 import sys
+from concurrent.futures import Future
 
-from PyQt6.QtCore import QRegularExpression
+from PyQt6.QtCore import QRegularExpression, pyqtSignal
 from PyQt6.QtGui import QRegularExpressionValidator, QColor
 from PyQt6.QtWidgets import QWidget, QVBoxLayout, QPushButton, QHBoxLayout, QComboBox, QLineEdit, QMessageBox, \
     QMainWindow, QApplication, QLabel, QDoubleSpinBox, QAbstractSpinBox
 from toolbox3.geometry.point import Point3D
 
+from Scripts.Translation_stage.stage_state_poller import StageStatePoller
 from Scripts.Translation_stage.translation_stage_interface import TranslationStageInterface
-from Scripts.Translation_stage.translation_stage_pi import TranslationPi
+from Scripts.Translation_stage.translation_stage_pi import TranslationPi, TranslationStageError
 
 class PositionSettings(QWidget):
     """
     Display the XYZ Stage's relative actions.
     """
+    move_finished = pyqtSignal(object)  # MotionFuture of the move asked with the MOVE button
 
     def __init__(self):
         super().__init__()
+        self.move_finished.connect(self.move_done)
         self.translation = TranslationStageInterface()
+        self.stage_poller = StageStatePoller()
         self.translation.joystick(0)
         self.move_abs_state = True
         self.inputs = {1: '0', 2: '0', 3: '0'}  # default values
@@ -95,14 +100,14 @@ class PositionSettings(QWidget):
 
         #endregion
 
-        move_button = QPushButton("MOVE")  # Move button
-        move_button.clicked.connect(self.move_button_clicked)
+        self.move_button = QPushButton("MOVE")  # Move button
+        self.move_button.clicked.connect(self.move_button_clicked)
         layout_move = QHBoxLayout()  # Creating the layout
         layout_move.addWidget(self.select_move)
         layout_move.addWidget(self.input_x)
         layout_move.addWidget(self.input_y)
         layout_move.addWidget(self.input_z)
-        layout_move.addWidget(move_button)
+        layout_move.addWidget(self.move_button)
         return layout_move
 
     def layout_save_load(self) -> QHBoxLayout:
@@ -123,7 +128,8 @@ class PositionSettings(QWidget):
         """
         Saving position in a dictionary & displaying it inside the loading button.
         """
-        pos = self.translation.get_position()
+        state = self.stage_poller.last_state(max_age=1)
+        pos = state.position if state is not None else self.translation.get_position()
         self.pos_settings = {"X": pos.x, "Y": pos.y, "Z": pos.z, "MoveMode": self.move_abs_state}
         self.load_button_pos.setText(
             "Load Position  -  Latest saved position  {}x | {}y | {}z".format(self.pos_settings["X"],
@@ -211,13 +217,31 @@ class PositionSettings(QWidget):
 
         position = Point3D(float(self.inputs[1]), float(self.inputs[2]), float(self.inputs[3]))
 
-        if self.move_abs_state:
-            self.translation.move_absolute(position)
-        else:
-            check = self.translation.move_relative(position)
-            if not check:
-                QMessageBox.warning(self, "Move relative error", "You try to move out of the translation stage limit")
-                return
+        # The position of the poller is the actual one only if the axis are stopped
+        state = self.stage_poller.last_state(max_age=1)
+        current_position = state.position if state is not None and not state.is_moving else None
+        try:
+            if self.move_abs_state:
+                motion = self.translation.move_absolute(position, current_position)
+            else:
+                motion = self.translation.move_relative(position, current_position)
+        except TranslationStageError as e:
+            # Nothing sent: ex velocity at 0 %
+            QMessageBox.warning(self, "Move error", str(e))
+            return
+        if motion is None:
+            QMessageBox.warning(self, "Move relative error", "You try to move out of the translation stage limit")
+            return
+
+        # The GUI stays responsive during the move, the button is enabled again at its end
+        self.move_button.setEnabled(False)
+        # The callback is called by the thread of the motion, the signal gives the result to the GUI thread
+        motion.add_done_callback(self.move_finished.emit)
+
+    def move_done(self, motion: Future):
+        self.move_button.setEnabled(True)
+        if not motion.cancelled() and motion.exception() is not None:
+            QMessageBox.warning(self, "Move error", f"Error during the move: {motion.exception()}")
 
     def layout_enable_joystick(self) -> QHBoxLayout:
         """
@@ -244,7 +268,9 @@ class PositionSettings(QWidget):
                 self.joystick_button.setChecked(False)
                 return
 
-            if self.translation.is_any_axis_moving():
+            state = self.stage_poller.last_state(max_age=1)
+            is_moving = state.is_moving if state is not None else self.translation.is_any_axis_moving()
+            if is_moving:
                 QMessageBox.warning(self, "Joystick activation error", "Can't use joystick during axis moving")
                 self.joystick_button.setChecked(False)
                 return
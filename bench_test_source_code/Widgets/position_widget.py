@@ -1,31 +1,14 @@
-from PyQt6.QtCore import QThread, pyqtSignal, pyqtSlot
+from PyQt6.QtCore import pyqtSlot
 from PyQt6.QtWidgets import QWidget, QLabel, QHBoxLayout
 
 from toolbox3.geometry.point import Point3D
 
-from Scripts.Translation_stage.translation_stage_interface import TranslationStageInterface
-from Scripts.Translation_stage.translation_stage_pi import TranslationPi
-
-class GetPosThread(QThread):
-    """
-    Ask the XYZ Stage the position of the axis.
-    """
-    position_changed = pyqtSignal(Point3D)
-
-    def __init__(self):
-        super().__init__()
-        self.translation = TranslationStageInterface()
-
-    def run(self):
-        while True:
-            pos = self.translation.get_position()
-            self.position_changed.emit(pos)
-            self.msleep(500)  # Sleep for 500 milliseconds
-
+from Scripts.Translation_stage.stage_state_poller import StageStatePoller
+from Scripts.Translation_stage.translation_stage_pi import StageState
 
 class GetPosWidget(QWidget):
     """
-    Display the position on the interface every X ms using a thread.
+    Display the position on the interface at each state published by the StageStatePoller.
     """
     def __init__(self):
         super().__init__()
@@ -38,16 +21,17 @@ class GetPosWidget(QWidget):
             self.layout_pos.addWidget(label)
 
         self.setLayout(self.layout_pos)
-        self.thread = GetPosThread()  # Start the thread who periodically send position values
-        self.thread.position_changed.connect(self.update_labels)  # Connect the signal to the function -> display the values
-        self.thread.start()
         self.pos: Point3D = Point3D(0, 0, 0)
+        self.poller = StageStatePoller()  # Thread who periodically send the state of the stage
+        self.poller.state_changed.connect(self.update_labels)  # Connect the signal to the function -> display the values
+        self.poller.start()
 
-    @pyqtSlot(Point3D)
-    def update_labels(self, pos: Point3D):
+    @pyqtSlot(object)
+    def update_labels(self, state: StageState):
         """
         Update the position values collected by the thread
         """
+        pos = state.position
         self.pos = pos
         self.labels["X Axis"].setText(f"X Axis: {pos.x}")
         self.labels["Y Axis"].setText(f"Y Axis: {pos.y}")
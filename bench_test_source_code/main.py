@@ -4,7 +4,9 @@ import sys
 from PyQt6.QtWidgets import QApplication
 
 from Scripts.Camera.camera_interface import CameraInterface
+from Scripts.Camera.xclib_simulator import XclibSimulator
 from Scripts.Translation_stage.translation_stage_interface import TranslationStageInterface
+from Scripts.Translation_stage.translation_stage_simulator import TranslationStageSimulator
 from Scripts.Widgets.CustomWidget.QFolderDialog import QFolderDialog
 from Scripts.main_window import MainWindow
 
@@ -12,6 +14,7 @@ from Scripts.main_window import MainWindow
 def main():
     """
     Launch the application
+    Run with --simulate to use a simulated camera and a simulated translation stage
     """
     app = QApplication(sys.argv)
 
@@ -27,8 +30,13 @@ def main():
     else:
         raise ValueError(f"Got an unexpected return value from connection dialog: {response}")
 
-    pi = TranslationStageInterface(port="COM4", baudrate=115200)
-    cam = CameraInterface()
+    simulate = "--simulate" in sys.argv
+    if simulate:
+        stage_simulator = TranslationStageSimulator()
+        pi = TranslationStageInterface(port=stage_simulator.start(), baudrate=115200)
+    else:
+        pi = TranslationStageInterface(port="COM4", baudrate=115200)
+    cam = CameraInterface(xclib=XclibSimulator() if simulate else None)
 
     # region Debug logger
     # A rajouter le mois et l'année dans le nom du fichier
@@ -6,6 +6,7 @@ import sys
 from PyQt6.QtCore import QSettings
 
 from Scripts.Camera.camera_interface import CameraInterface
+from Scripts.Translation_stage.stage_state_poller import StageStatePoller
 from Scripts.Translation_stage.translation_stage_interface import TranslationStageInterface
 from PyQt6.QtGui import QAction, QIcon
 from PyQt6.QtWidgets import QApplication, QMainWindow, QHBoxLayout, QVBoxLayout, QLabel, QFrame, QWidget, \
@@ -70,6 +71,13 @@ class MainWindow(QMainWindow):
         self.__raptor.tec_activation = False
         del self.__raptor
         self.local_server.stop_server()
+        # Stop the threads before the end of the application, the poller queries the stage
+        StageStatePoller().stop()
+        self.camera_picture_widget.histogram_engine.stop()
+        # Stop the treatment processes and free their shared memory
+        self.camera_picture_widget.treatment_pipeline.shutdown()
+        # Write the pictures still in the queue
+        self.camera_picture_widget.snapshot_writer.shutdown()
         event.accept()
         return QMainWindow.closeEvent(self, event)
 